@@ -0,0 +1,101 @@
+"""Benchmark merging break node arcs into the travel time matrix
+
+   python bench/bench_aggregate.py --loads 20 50 100
+
+Reports wall time and peak traced memory (tracemalloc) for the old
+pivot and update merge, and for the scatter merge into a DataFrame,
+a SolverMatrix and a SparseSolverMatrix.
+"""
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+import warnings
+
+import pandas as pd
+
+import synthetic
+import breaks
+import demand as D
+import read_csv as reader
+import solver_matrix as SM
+
+
+def legacy_aggregate_split_nodes(travel_time, newtimes):
+    """the pre-scatter implementation, kept here for comparison"""
+    new_df = pd.DataFrame(data=newtimes)
+    new_df.drop_duplicates(inplace=True)
+    df_new_times = new_df.pivot(index='x', columns='y', values='t')
+    df_new_times.update(travel_time)
+    for idx in travel_time.index:
+        assert idx in df_new_times.index
+    return df_new_times
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (result, elapsed, peak)
+
+
+def collect_triplets(d, mm):
+    """run the break expansion, but hang on to the triplets"""
+    captured = {}
+    aggregate = breaks.aggregate_split_nodes
+
+    def capture(travel_time, newtimes):
+        captured['newtimes'] = newtimes
+        return travel_time
+    breaks.aggregate_split_nodes = capture
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            d.insert_nodes_for_breaks(mm)
+    finally:
+        breaks.aggregate_split_nodes = aggregate
+    return captured['newtimes']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and size the break node merge')
+    parser.add_argument('--loads', type=int, nargs='+', dest='loads',
+                        default=[20, 50, 100],
+                        help='Numbers of loads to try.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=200,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    matrix = synthetic.make_matrix(args.mapnodes)
+    minutes_matrix = reader.travel_time(1, matrix)
+    lines = ['loads,nodes,method,seconds,peak_mb']
+    for num_loads in args.loads:
+        odpairs = synthetic.make_demand(num_loads, args.mapnodes, args.horizon)
+        with contextlib.redirect_stdout(io.StringIO()):
+            d = D.Demand(odpairs, minutes_matrix, args.horizon)
+        mm = d.generate_solver_space_matrix(minutes_matrix)
+        newtimes = collect_triplets(d, mm)
+        inputs = [('legacy_dataframe', legacy_aggregate_split_nodes, mm),
+                  ('scatter_dataframe', breaks.aggregate_split_nodes, mm),
+                  ('scatter_solver_matrix', breaks.aggregate_split_nodes,
+                   SM.as_solver_matrix(mm)),
+                  ('scatter_sparse', breaks.aggregate_split_nodes,
+                   SM.SparseSolverMatrix.from_matrix(mm))]
+        for (name, fn, base) in inputs:
+            (result, elapsed, peak) = measure(fn, base, newtimes)
+            lines.append('{},{},{},{:.3f},{:.1f}'.format(num_loads, len(result.index),
+                                                         name, elapsed, peak/2**20))
+            del result
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark the break node chain storage
+
+   python bench/bench_break_chains.py --loads 20 40
+
+Builds the break-expanded synthetic network, then compares the old
+dict of dicts of lists for Demand.break_node_chains against the flat
+BreakNodeChains: memory once loaded (tracemalloc, after a pickle round
+trip), pickled size, and the time to look up every chain.  Checks
+that both give the same chains.
+"""
+import argparse
+import contextlib
+import io
+import pickle
+import time
+import tracemalloc
+import warnings
+
+import synthetic
+import demand as D
+import read_csv as reader
+
+
+def legacy_chains(chains):
+    """the old dict of dicts, made the way add_break_nodes used to"""
+    legacy = {0: {}}
+    for i in range(len(chains)):
+        (o, d) = (int(chains.from_nodes[i]), int(chains.to_nodes[i]))
+        legacy.setdefault(o, {})[d] = chains.nodes[chains.offsets[i]:chains.offsets[i+1]].tolist()
+    return legacy
+
+
+def legacy_get(legacy, from_node, to_node):
+    if from_node in legacy:
+        if to_node in legacy[from_node]:
+            return legacy[from_node][to_node]
+    return None
+
+
+def loaded_bytes(store):
+    """memory taken by an unpickled copy of store"""
+    data = pickle.dumps(store)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    copy = pickle.loads(data)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copy
+    return (after - before, len(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time break node chain lookups')
+    parser.add_argument('--loads', type=int, nargs='+', dest='loads',
+                        default=[20, 40],
+                        help='Numbers of loads to try.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=100,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    matrix = reader.travel_time(1, synthetic.make_matrix(args.mapnodes))
+    lines = ['loads,links,break_nodes,method,memory_bytes,pickle_bytes,lookup_seconds']
+    for num_loads in args.loads:
+        odpairs = synthetic.make_demand(num_loads, args.mapnodes, args.horizon)
+        with contextlib.redirect_stdout(io.StringIO()):
+            d = D.Demand(odpairs, matrix, args.horizon)
+            d.insert_nodes_for_breaks(d.generate_solver_space_matrix(matrix, compact=True),
+                                      sparse=True)
+        chains = d.break_node_chains
+        legacy = legacy_chains(chains)
+        links = list(zip(chains.from_nodes.tolist(), chains.to_nodes.tolist()))
+        results = {}
+        for (method, store, get) in [('legacy', legacy, lambda o, t: legacy_get(legacy, o, t)),
+                                     ('flat', chains, d.get_break_node_chain)]:
+            start = time.perf_counter()
+            results[method] = [get(o, t) for (o, t) in links]
+            elapsed = time.perf_counter() - start
+            (memory, pickled) = loaded_bytes(store)
+            lines.append('{},{},{},{},{},{},{:.4f}'.format(num_loads, len(links), len(chains.nodes),
+                                                           method, memory, pickled, elapsed))
+        assert results['legacy'] == [c.tolist() for c in results['flat']]
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark single break node lookups
+
+   python bench/bench_break_nodes.py --loads 20 40
+
+Builds the break-expanded synthetic network, then times
+Demand.get_break_node over every node id (break nodes and regular
+nodes both, the way solution_output and initial_routes ask) against
+the old dict of BreakNode objects.  Checks that both give the same
+answers.
+"""
+import argparse
+import contextlib
+import io
+import time
+import warnings
+
+import synthetic
+import demand as D
+import read_csv as reader
+
+
+def legacy_registry(break_nodes):
+    """the old dict of BreakNode objects, by node id"""
+    return {node: bn for (node, bn) in break_nodes.items()}
+
+
+def legacy_get(legacy, node):
+    """what Demand.get_break_node used to do"""
+    if legacy and node in legacy:
+        return legacy[node]
+    return None
+
+
+def fields(bn):
+    if bn is None:
+        return None
+    return (bn.node, bn.origin, bn.destination, bn.break_time,
+            bn.accumulator_reset, bn.tt_o, bn.tt_d)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time single break node lookups')
+    parser.add_argument('--loads', type=int, nargs='+', dest='loads',
+                        default=[20, 40],
+                        help='Numbers of loads to try.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=100,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('--repeat', type=int, dest='repeat', default=5,
+                        help='Passes over every node id.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    matrix = reader.travel_time(1, synthetic.make_matrix(args.mapnodes))
+    lines = ['loads,nodes,break_nodes,method,lookups,microseconds_per_lookup']
+    for num_loads in args.loads:
+        odpairs = synthetic.make_demand(num_loads, args.mapnodes, args.horizon)
+        with contextlib.redirect_stdout(io.StringIO()):
+            d = D.Demand(odpairs, matrix, args.horizon)
+            x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(matrix, compact=True),
+                                            sparse=True)
+        legacy = legacy_registry(d.break_nodes)
+        nodes = list(range(len(x_m)))
+        results = {}
+        for (method, get) in [('legacy', lambda node: legacy_get(legacy, node)),
+                              ('columns', d.get_break_node)]:
+            # first pass outside the clock, so the lookup lists are made
+            results[method] = [fields(get(node)) for node in nodes]
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for node in nodes:
+                    get(node)
+            elapsed = time.perf_counter() - start
+            lookups = args.repeat * len(nodes)
+            lines.append('{},{},{},{},{},{:.3f}'.format(num_loads, len(nodes), len(legacy),
+                                                        method, lookups, elapsed / lookups * 1e6))
+        assert results['legacy'] == results['columns']
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
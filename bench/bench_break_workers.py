@@ -0,0 +1,56 @@
+"""Benchmark the break node expansion with different numbers of workers
+
+   python bench/bench_break_workers.py --loads 200 --workers 1 2 4 8
+
+Each run is checked against the single process result.
+"""
+import argparse
+import contextlib
+import io
+import time
+import warnings
+
+import synthetic
+import demand as D
+import read_csv as reader
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time insert_nodes_for_breaks by worker count')
+    parser.add_argument('--loads', type=int, dest='loads', default=200,
+                        help='Number of loads.')
+    parser.add_argument('--workers', type=int, nargs='+', dest='workers',
+                        default=[1, 2, 4],
+                        help='Worker counts to try.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=200,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    matrix = reader.travel_time(1, synthetic.make_matrix(args.mapnodes))
+    odpairs = synthetic.make_demand(args.loads, args.mapnodes, args.horizon)
+    with contextlib.redirect_stdout(io.StringIO()):
+        d = D.Demand(odpairs, matrix, args.horizon)
+    mm = d.generate_solver_space_matrix(matrix, compact=True)
+    lines = ['loads,workers,nodes,seconds']
+    expected = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            expanded = d.insert_nodes_for_breaks(mm, sparse=True, workers=workers)
+        elapsed = time.perf_counter() - start
+        if expected is None:
+            expected = expanded
+        assert (expanded.offsets == expected.offsets).all()
+        assert (expanded.neighbors == expected.neighbors).all()
+        assert (expanded.times == expected.times).all()
+        lines.append('{},{},{},{:.3f}'.format(args.loads, workers, len(expanded), elapsed))
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark building the time, drive and short break evaluator arrays
+
+   python bench/bench_evaluators.py --loads 20 50
+
+Times the old per node and per arc DataFrame loops (kept here, for sizes up to
+--legacy_max) against the broadcast versions in evaluators, and checks
+that they agree.
+"""
+import argparse
+import contextlib
+import io
+import time
+import warnings
+
+import numpy as np
+
+import synthetic
+import demand as D
+import evaluators as E
+import read_csv as reader
+
+
+def legacy_service_total_time(service, matrix):
+    """the pre-broadcast double loop over the pivoted DataFrame, kept
+    here for comparison"""
+    notna = matrix.notna()
+    tmm_index = matrix.index
+    service_time = np.zeros((len(tmm_index), len(tmm_index)))
+    for o_idx in tmm_index:
+        for d_idx in tmm_index[notna.loc[o_idx, :]]:
+            if o_idx != d_idx:
+                service_time[o_idx, d_idx] = service[o_idx]
+    return E.gen_total_time(service_time, matrix)
+
+
+def legacy_time_service_vector(nodes, demand):
+    """the pre-vectorization per node lookups, kept here for comparison"""
+    service = np.zeros(len(nodes))
+    for o_idx in nodes:
+        o_sv = demand.get_service_time(o_idx)
+        o_bk = demand.get_break_node(o_idx)
+        if o_bk:
+            o_sv = o_bk.break_time
+        service[o_idx] = o_sv
+    return service
+
+
+def build_all(x_m, d):
+    return [E.service_total_time(E.time_service_vector(x_m.index, d), x_m),
+            E.service_total_time(E.drive_service_vector(x_m.index, d, 600), x_m),
+            E.service_total_time(E.short_break_service_vector(x_m.index, d, 480, 30), x_m)]
+
+
+def legacy_build_all(x_m, d):
+    x_m = x_m.to_dataframe()
+    return [legacy_service_total_time(legacy_time_service_vector(x_m.index, d), x_m),
+            legacy_service_total_time(E.drive_service_vector(x_m.index, d, 600), x_m),
+            legacy_service_total_time(E.short_break_service_vector(x_m.index, d, 480, 30), x_m)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the evaluator array builds')
+    parser.add_argument('--loads', type=int, nargs='+', dest='loads',
+                        default=[20, 50],
+                        help='Numbers of loads to try.')
+    parser.add_argument('--legacy_max', type=int, dest='legacy_max', default=50,
+                        help='Largest load count to run the old loops on.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=200,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    matrix = reader.travel_time(1, synthetic.make_matrix(args.mapnodes))
+    lines = ['loads,nodes,method,seconds']
+    for num_loads in args.loads:
+        odpairs = synthetic.make_demand(num_loads, args.mapnodes, args.horizon)
+        with contextlib.redirect_stdout(io.StringIO()):
+            d = D.Demand(odpairs, matrix, args.horizon)
+            x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(matrix, compact=True))
+        start = time.perf_counter()
+        arrays = build_all(x_m, d)
+        elapsed = time.perf_counter() - start
+        lines.append('{},{},broadcast,{:.3f}'.format(num_loads, len(x_m), elapsed))
+        if num_loads <= args.legacy_max:
+            start = time.perf_counter()
+            legacy = legacy_build_all(x_m, d)
+            elapsed = time.perf_counter() - start
+            for (a, b) in zip(arrays, legacy):
+                assert np.array_equal(a, b)
+            lines.append('{},{},legacy,{:.3f}'.format(num_loads, len(x_m), elapsed))
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark reading the map space matrix: CSV versus memory mapped .npy
+
+   python bench/bench_matrix_load.py --mapnodes 1000 3000 --loads 100
+
+For each size a synthetic matrix is written out as CSV and converted
+to .npy, then both are loaded, turned into minutes, and used to build
+the solver space matrix.  Peak memory is the tracemalloc peak.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import synthetic
+import demand as D
+import map_matrix as MM
+import read_csv as reader
+
+
+def build(filename, odpairs, horizon, speed):
+    matrix = reader.load_matrix(filename)
+    minutes_matrix = reader.travel_time(speed/60, matrix)
+    with contextlib.redirect_stdout(io.StringIO()):
+        d = D.Demand(odpairs, minutes_matrix, horizon)
+    return d.generate_solver_space_matrix(minutes_matrix, horizon, compact=True)
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (result, elapsed, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time CSV and .npy matrix loading')
+    parser.add_argument('--mapnodes', type=int, nargs='+', dest='mapnodes',
+                        default=[1000, 3000],
+                        help='Numbers of map nodes to try.')
+    parser.add_argument('--loads', type=int, dest='loads', default=100,
+                        help='Number of loads.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('--speed', type=float, dest='speed', default=55.0,
+                        help='Average speed, miles per hour.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    lines = ['mapnodes,format,convert_seconds,build_seconds,peak_mb']
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_map_nodes in args.mapnodes:
+            csvfile = os.path.join(tmp, 'matrix_{}.csv'.format(num_map_nodes))
+            npyfile = os.path.join(tmp, 'matrix_{}.npy'.format(num_map_nodes))
+            synthetic.make_matrix(num_map_nodes).to_csv(csvfile, header=False, index=False)
+            start = time.perf_counter()
+            MM.convert_csv(csvfile, npyfile)
+            convert = time.perf_counter() - start
+            odpairs = synthetic.make_demand(args.loads, num_map_nodes, args.horizon)
+
+            (csv_mm, elapsed, peak) = measure(build, csvfile, odpairs,
+                                              args.horizon, args.speed)
+            lines.append('{},csv,,{:.3f},{:.1f}'.format(num_map_nodes, elapsed, peak/2**20))
+            (npy_mm, elapsed, peak) = measure(build, npyfile, odpairs,
+                                              args.horizon, args.speed)
+            lines.append('{},npy,{:.3f},{:.3f},{:.1f}'.format(num_map_nodes, convert,
+                                                              elapsed, peak/2**20))
+            assert (csv_mm.times == npy_mm.times).all()
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark the Demand node getters
+
+   python bench/bench_node_table.py --loads 20 40
+
+Times get_map_node, get_demand, get_service_time and get_demand_number
+over every node of a break-expanded synthetic network, reading from the
+node table against the old lookup in the equivalence DataFrame, and
+checks that they agree.  Also times evaluators.service_vectors.
+"""
+import argparse
+import contextlib
+import io
+import time
+import warnings
+
+import synthetic
+import demand as D
+import evaluators as E
+import read_csv as reader
+
+
+def legacy_entry(d, demand_node, entry, default):
+    """the old _get_demand_entry, kept here for comparison"""
+    if demand_node in d.equivalence.index:
+        return int(d.equivalence.loc[demand_node, entry])
+    return default
+
+
+def legacy_getters(d, node):
+    map_node = 0 if node == 0 else legacy_entry(d, node, 'mapnode', -1)
+    return (map_node,
+            legacy_entry(d, node, 'demand', 0),
+            legacy_entry(d, node, 'service_time', 0),
+            legacy_entry(d, node, 'demand_index', -1))
+
+
+def table_getters(d, node):
+    return (d.get_map_node(node),
+            d.get_demand(node),
+            d.get_service_time(node),
+            d.get_demand_number(node))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the Demand node getters')
+    parser.add_argument('--loads', type=int, nargs='+', dest='loads',
+                        default=[20, 40],
+                        help='Numbers of loads to try.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=100,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    matrix = reader.travel_time(1, synthetic.make_matrix(args.mapnodes))
+    lines = ['loads,nodes,method,seconds']
+    for num_loads in args.loads:
+        odpairs = synthetic.make_demand(num_loads, args.mapnodes, args.horizon)
+        with contextlib.redirect_stdout(io.StringIO()):
+            d = D.Demand(odpairs, matrix, args.horizon)
+            x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(matrix, compact=True))
+        nodes = list(x_m.index)
+        results = {}
+        for (method, getters) in [('legacy', legacy_getters), ('table', table_getters)]:
+            start = time.perf_counter()
+            results[method] = [getters(d, node) for node in nodes]
+            elapsed = time.perf_counter() - start
+            lines.append('{},{},{},{:.4f}'.format(num_loads, len(nodes), method, elapsed))
+        assert results['legacy'] == results['table']
+        start = time.perf_counter()
+        E.service_vectors(len(x_m), d)
+        elapsed = time.perf_counter() - start
+        lines.append('{},{},service_vectors,{:.4f}'.format(num_loads, len(nodes), elapsed))
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark pruning the destination to origin links
+
+   python bench/bench_prune.py --loads 200 1000 2000
+
+Times Demand.destination_origin_legs against the old all pairs loop
+(for sizes up to --legacy_max), and checks that they agree.
+"""
+import argparse
+import contextlib
+import io
+import time
+import warnings
+
+import synthetic
+import demand as D
+import read_csv as reader
+
+
+def legacy_destination_origin_legs(d, travel_times):
+    """the pre-index all pairs loop, kept here for comparison"""
+    feasible_index = d.demand.feasible
+    destination_details = []
+    origin_details = []
+    for idx in d.demand.index[feasible_index]:
+        record = d.demand.loc[idx]
+        destination_details.append((record.destination,
+                                    record.earliest_destination,
+                                    record.origin))
+        origin_details.append((record.origin,
+                               record.late))
+    legs = []
+    for dd in destination_details:
+        didx = dd[0]
+        for oo in origin_details:
+            oidx = oo[0]
+            if dd[2] == oidx:
+                continue
+            tt = travel_times.loc[didx, oidx]
+            if dd[1] + tt > d.horizon:
+                continue
+            if dd[1] + tt > oo[1]:
+                continue
+            legs.append((didx, oidx, tt))
+    return legs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time destination to origin pruning')
+    parser.add_argument('--loads', type=int, nargs='+', dest='loads',
+                        default=[200, 1000, 2000],
+                        help='Numbers of loads to try.')
+    parser.add_argument('--legacy_max', type=int, dest='legacy_max', default=1000,
+                        help='Largest load count to run the old loop on.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=500,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    matrix = reader.travel_time(1, synthetic.make_matrix(args.mapnodes))
+    lines = ['loads,legs,method,seconds']
+    for num_loads in args.loads:
+        odpairs = synthetic.make_demand(num_loads, args.mapnodes, args.horizon)
+        with contextlib.redirect_stdout(io.StringIO()):
+            d = D.Demand(odpairs, matrix, args.horizon)
+        mm = d.generate_solver_space_matrix(matrix, compact=True)
+        start = time.perf_counter()
+        legs = d.destination_origin_legs(mm)
+        elapsed = time.perf_counter() - start
+        lines.append('{},{},indexed,{:.3f}'.format(num_loads, len(legs), elapsed))
+        if num_loads <= args.legacy_max:
+            start = time.perf_counter()
+            legacy = legacy_destination_origin_legs(d, mm)
+            elapsed = time.perf_counter() - start
+            assert [(int(a), int(b), float(c)) for (a, b, c) in legacy] == legs
+            lines.append('{},{},legacy,{:.3f}'.format(num_loads, len(legacy), elapsed))
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
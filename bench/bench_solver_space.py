@@ -0,0 +1,93 @@
+"""Benchmark Demand.generate_solver_space_matrix as the load count grows
+
+   python bench/bench_solver_space.py --loads 100 1000 5000 10000
+
+The legacy per-load loop is timed too, for the sizes at or below
+--legacy_max, and its output is checked against the vectorized builder.
+"""
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+import demand as D
+import read_csv as reader
+
+
+def legacy_solver_space_matrix(d, matrix):
+    """the pre-vectorization implementation, kept here for comparison"""
+    new_times = D.zeroed_trip_triplets(1)
+    feasible_idx = d.demand.feasible
+
+    def travtime(record):
+        record_times = D.zeroed_trip_triplets(5)
+        record_times[0] = (record.origin, record.origin, 0.0)
+        record_times[1] = (record.destination, record.destination, 0.0)
+        record_times[2] = (record.origin, record.destination,
+                           matrix.loc[record.from_node, record.to_node])
+        record_times[3] = (0, record.origin,
+                           matrix.loc[0, record.from_node])
+        record_times[4] = (record.destination, 0,
+                           matrix.loc[record.to_node, 0])
+        return record_times
+
+    for idx in d.demand.index[feasible_idx]:
+        record = d.demand.loc[idx]
+        new_times = np.append(new_times, travtime(record), axis=0)
+        other_feasible = feasible_idx.copy()
+        other_feasible[idx] = False
+        if len(other_feasible[other_feasible]) > 0:
+            other_times = [(record.destination, onode, matrix.loc[record.to_node, omap])
+                           for (onode, omap) in d.demand.loc[other_feasible,
+                                                             ['origin', 'from_node']].values]
+            triple = np.array(other_times,
+                              dtype=[('x', int), ('y', int), ('t', float)])
+            new_times = np.append(new_times, triple, axis=0)
+    df = pd.DataFrame(new_times)
+    df.drop_duplicates(inplace=True)
+    return df.pivot(index='x', columns='y', values='t')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the solver space matrix builder')
+    parser.add_argument('--loads', type=int, nargs='+', dest='loads',
+                        default=[100, 1000, 2500, 5000, 10000],
+                        help='Numbers of loads to try.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=1000,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--legacy_max', type=int, dest='legacy_max', default=500,
+                        help='Largest load count to also run through the legacy loop.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    matrix = synthetic.make_matrix(args.mapnodes)
+    minutes_matrix = reader.travel_time(1, matrix)
+    lines = ['loads,nodes,vectorized_s,legacy_s']
+    for num_loads in args.loads:
+        odpairs = synthetic.make_demand(num_loads, args.mapnodes)
+        # horizon large enough that every load is feasible
+        d = D.Demand(odpairs, minutes_matrix, 10**7, use_breaks=False)
+
+        start = time.perf_counter()
+        mm = d.generate_solver_space_matrix(minutes_matrix)
+        vectorized = time.perf_counter() - start
+
+        legacy = ''
+        if num_loads <= args.legacy_max:
+            start = time.perf_counter()
+            old = legacy_solver_space_matrix(d, minutes_matrix)
+            legacy = '{:.3f}'.format(time.perf_counter() - start)
+            assert np.array_equal(old.values, mm.values, equal_nan=True)
+        lines.append('{},{},{:.3f},{}'.format(num_loads, len(mm.index),
+                                              vectorized, legacy))
+        del mm
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
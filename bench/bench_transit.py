@@ -0,0 +1,104 @@
+"""Benchmark python transit callbacks against transit matrices
+
+   python bench/bench_transit.py --loads 10 20 --seconds 10
+
+Solves the same break-expanded synthetic problem both ways, for a fixed
+time limit, and reports the model build time, search branches per
+second, and the objective.  Each is run with the plain travel time
+objective and with the weighted distance plus time objective (with
+vehicle fixed costs), to show what the richer objective costs.
+"""
+import argparse
+import contextlib
+import io
+import time
+import warnings
+
+import synthetic
+import demand as D
+import evaluators as E
+import model_run as MR
+import read_csv as reader
+import vehicles as V
+
+
+def short_params(seconds):
+    """setup_params, but with a time limit in seconds and no search log"""
+    setup_params = MR.setup_params
+
+    def params(args):
+        parameters = setup_params(None)
+        parameters.time_limit.seconds = seconds
+        parameters.log_search = False
+        return parameters
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare callback and matrix transit evaluators')
+    parser.add_argument('--loads', type=int, nargs='+', dest='loads',
+                        default=[10, 20],
+                        help='Numbers of loads to try.')
+    parser.add_argument('--seconds', type=int, dest='seconds', default=10,
+                        help='Solver time limit per run, in seconds.')
+    parser.add_argument('--vehicles', type=int, dest='vehicles', default=5,
+                        help='Number of vehicles.')
+    parser.add_argument('--mapnodes', type=int, dest='mapnodes', default=100,
+                        help='Number of map nodes in the synthetic distance matrix.')
+    parser.add_argument('--horizon', type=int, dest='horizon', default=10080,
+                        help='Horizon in minutes.')
+    parser.add_argument('--cost_per_mile', type=float, dest='cost_per_mile', default=2.0,
+                        help='Distance weight for the weighted objective runs.')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='Append the report to this file.')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    MR.setup_params = short_params(args.seconds)
+    matrix = reader.travel_time(1, synthetic.make_matrix(args.mapnodes))
+    weighted = MR.Objective(1, args.cost_per_mile, True)
+    lines = ['loads,nodes,mode,objective_kind,build_seconds,solve_seconds,branches,branches_per_second,objective']
+    for num_loads in args.loads:
+        odpairs = synthetic.make_demand(num_loads, args.mapnodes, args.horizon)
+        with contextlib.redirect_stdout(io.StringIO()):
+            d = D.Demand(odpairs, matrix, args.horizon)
+            mm = d.generate_solver_space_matrix(matrix, compact=True)
+            x_m = d.insert_nodes_for_breaks(mm)
+        vehicles = V.Vehicles(args.vehicles, args.horizon)
+        # synthetic travel minutes are at 60 mph, so also the miles
+        evaluators = E.EvaluatorBundle(x_m, d, x_m)
+        runs = [(mode, transit_matrix, kind, objective)
+                for (kind, objective) in [('time', MR.TIME_ONLY), ('weighted', weighted)]
+                for (mode, transit_matrix) in [('callback', False), ('matrix', True)]]
+        for (mode, transit_matrix, kind, objective) in runs:
+            # no initial routes, the synthetic ones are not always feasible
+            solve = {}
+            run_solver = MR.run_solver
+
+            def timed_run_solver(routing, parameters, initial_routes, stats=None):
+                solve['start'] = time.perf_counter()
+                assignment = run_solver(routing, parameters, initial_routes, stats)
+                solve['end'] = time.perf_counter()
+                return assignment
+            MR.run_solver = timed_run_solver
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    (assignment, routing, manager) = MR.model_run(
+                        d, x_m, vehicles.vehicles, 10000, None, None,
+                        transit_matrix=transit_matrix,
+                        evaluators=evaluators, objective=objective)
+            finally:
+                MR.run_solver = run_solver
+            build = solve['start'] - start
+            elapsed = solve['end'] - solve['start']
+            branches = routing.solver().Branches()
+            objective = assignment.ObjectiveValue() if assignment else ''
+            lines.append('{},{},{},{},{:.3f},{:.3f},{},{:.0f},{}'.format(
+                num_loads, len(x_m), mode, kind, build, elapsed, branches,
+                branches/elapsed, objective))
+    synthetic.write_report(lines, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Synthetic problem generators shared by the benchmark scripts"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+
+def make_matrix(num_map_nodes, seed=0, max_distance=1500):
+    """random map space distance matrix, same shape as load_matrix_from_csv"""
+    rng = np.random.RandomState(seed)
+    xy = rng.uniform(0, max_distance/1.5, size=(num_map_nodes, 2))
+    dist = np.sqrt(((xy[:, None, :] - xy[None, :, :])**2).sum(axis=2))
+    return pd.DataFrame(np.floor(dist).astype(int))
+
+
+def make_demand(num_loads, num_map_nodes, horizon=10080, seed=0):
+    """random demand, same columns as load_demand_from_csv"""
+    rng = np.random.RandomState(seed)
+    from_node = rng.randint(1, num_map_nodes, size=num_loads)
+    to_node = rng.randint(1, num_map_nodes, size=num_loads)
+    # never pick up and drop off at the same place
+    same = from_node == to_node
+    to_node[same] = (to_node[same] % (num_map_nodes - 1)) + 1
+    early = rng.randint(0, horizon // 2, size=num_loads)
+    late = early + 720
+    return pd.DataFrame({'from_node': from_node,
+                         'to_node': to_node,
+                         'early': early,
+                         'late': late})
+
+
+def write_report(lines, filename=None):
+    """print the report lines, and append them to filename if given"""
+    text = '\n'.join(lines)
+    print(text)
+    if filename:
+        with open(filename, 'a+') as f:
+            print(text, file=f, flush=True)
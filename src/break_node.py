@@ -1,9 +1,13 @@
 import math
+import numpy as np
 
 class BreakNode():
     """
     A class for modeling break nodes
     """
+    __slots__ = ('origin','destination','break_time','accumulator_reset',
+                 'tt_o','tt_d','node')
+
     def __init__(self,
                  origin, # where from
                  destination, # where to
@@ -29,6 +33,287 @@ class BreakNode():
 
         self.node = new_node
 
+    @classmethod
+    def from_row(cls,node,origin,destination,break_time,accumulator_reset,tt_o,tt_d):
+        """a BreakNode straight from the stored values, no splitting"""
+        bn = cls.__new__(cls)
+        bn.node = node
+        bn.origin = origin
+        bn.destination = destination
+        bn.break_time = break_time
+        bn.accumulator_reset = accumulator_reset
+        bn.tt_o = tt_o
+        bn.tt_d = tt_d
+        return bn
+
     # FIXME this is a little bit bald
     def drive_time_restore(self):
         return -self.accumulator_reset
+
+class BreakNodes():
+    """
+    All of the break nodes, stored as numpy columns indexed by node id.
+
+    The columns are origin, destination, break_time,
+    accumulator_reset, tt_o and tt_d, plus a mask saying which node
+    ids are break nodes at all.  Rows for nodes that are not break
+    nodes are just unused.  Looks enough like the old dict of
+    BreakNode objects (len, in, [node], keys, values, items) that
+    callers did not have to change; [node] hands back a BreakNode
+    built from that row, so changing it does not change the columns.
+
+    Single node lookups ([node], get, in) are made for the output and
+    initial route loops, so they stay about as cheap as the dict was:
+    the mask is a plain python list (a regular node is one list
+    read), and each BreakNode is only built the first time its node
+    is asked for, then handed out again like the dict's objects.
+    Both get dropped whenever the registry changes.
+
+    """
+    COLUMNS = ('origin','destination','break_time','accumulator_reset','tt_o','tt_d')
+
+    def __init__(self,size=0):
+        self.present = np.zeros(size,dtype=bool)
+        for name in self.COLUMNS:
+            setattr(self,name,np.full(size,-1,dtype=np.int32))
+        self._count = 0
+        self._reset_lookups()
+
+    def _reset_lookups(self):
+        self._present = None
+        self._views = None
+
+    def __getstate__(self):
+        # the lookups are just a copy of the columns
+        state = self.__dict__.copy()
+        state['_present'] = None
+        state['_views'] = None
+        return state
+
+    def _lookups(self):
+        """(present as a python list, BreakNode made so far per node)"""
+        if self._present is None:
+            self._present = self.present.tolist()
+            self._views = [None]*len(self._present)
+        return (self._present,self._views)
+
+    def _grow(self,size):
+        """make room for node ids up to size-1"""
+        old = len(self.present)
+        if size <= old:
+            return
+        size = max(size,2*old)
+        self._reset_lookups()
+        present = np.zeros(size,dtype=bool)
+        present[:old] = self.present
+        self.present = present
+        for name in self.COLUMNS:
+            column = np.full(size,-1,dtype=np.int32)
+            column[:old] = getattr(self,name)
+            setattr(self,name,column)
+
+    def add(self,nodes):
+        """store a list of BreakNode objects"""
+        if len(nodes) == 0:
+            return
+        ids = np.array([bn.node for bn in nodes],dtype=int)
+        self._grow(int(ids.max())+1)
+        self._count += int((~self.present[ids]).sum())
+        self.present[ids] = True
+        for name in self.COLUMNS:
+            getattr(self,name)[ids] = [getattr(bn,name) for bn in nodes]
+        self._reset_lookups()
+
+    def remove(self,nodes):
+        """forget the given node ids.  Ids that are not break nodes are
+        just skipped"""
+        nodes = np.unique(np.asarray(nodes,dtype=int))
+        nodes = nodes[(nodes >= 0) & (nodes < len(self.present))]
+        self._count -= int(self.present[nodes].sum())
+        self.present[nodes] = False
+        self._reset_lookups()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self,node):
+        present = self._lookups()[0]
+        return 0 <= node < len(present) and present[node]
+
+    def __getitem__(self,node):
+        bn = self.get(node)
+        if bn is None:
+            raise KeyError(node)
+        return bn
+
+    def get(self,node,default=None):
+        views = self._views
+        if views is None:
+            views = self._lookups()[1]
+        if node < 0:
+            return default
+        try:
+            bn = views[node]
+        except IndexError:
+            return default
+        if bn is None:
+            if not self._present[node]:
+                return default
+            bn = BreakNode.from_row(int(node),
+                                    int(self.origin[node]),
+                                    int(self.destination[node]),
+                                    int(self.break_time[node]),
+                                    int(self.accumulator_reset[node]),
+                                    int(self.tt_o[node]),
+                                    int(self.tt_d[node]))
+            views[node] = bn
+        return bn
+
+    def nodes(self):
+        """the break node ids, in order, as an array"""
+        return np.flatnonzero(self.present)
+
+    def max_node(self):
+        return int(self.nodes()[-1])
+
+    def drive_time_restore(self):
+        """drive_time_restore() of every row, as an array"""
+        return -self.accumulator_reset
+
+    def keys(self):
+        return self.nodes().tolist()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        return [self[node] for node in self.keys()]
+
+    def items(self):
+        return [(node,self[node]) for node in self.keys()]
+
+class BreakNodeChains():
+    """
+    The break node chain of every link, flattened.
+
+    The links are sorted by (from node, to node), and the chain of
+    link i is nodes[offsets[i]:offsets[i+1]], in the order the break
+    nodes were made (short break before long break).  get() looks a
+    link up with a searchsorted on from*stride+to, and hands back a
+    slice of nodes, so nothing is copied.  A link with no break nodes
+    gets an empty chain, which is not the same as a link that is not
+    there at all (None).
+
+    Everything is a plain numpy array, so it pickles small and could
+    be saved right next to the expanded matrix.
+
+    """
+
+    def __init__(self,from_nodes,to_nodes,offsets,nodes,stride):
+        self.from_nodes = np.asarray(from_nodes,dtype=np.int32)
+        self.to_nodes = np.asarray(to_nodes,dtype=np.int32)
+        self.offsets = np.asarray(offsets,dtype=np.int64)
+        self.nodes = np.asarray(nodes,dtype=np.int32)
+        self.stride = int(stride)
+        self._set_keys()
+        assert len(self.offsets) == len(self.from_nodes) + 1
+        assert self.offsets[-1] == len(self.nodes)
+
+    def _set_keys(self):
+        self.keys = self.from_nodes.astype(np.int64)*self.stride + self.to_nodes
+
+    def __getstate__(self):
+        # keys are cheap to make again, so leave them out of the pickle
+        state = self.__dict__.copy()
+        del state['keys']
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._set_keys()
+
+    @classmethod
+    def from_legs(cls,from_nodes,to_nodes,leg_nodes):
+        """build from the from and to node of each link, and the list of
+        node ids made for that link.  If a link shows up more than
+        once, its chains get joined together in order.
+
+        """
+        from_nodes = np.asarray(from_nodes,dtype=np.int64)
+        to_nodes = np.asarray(to_nodes,dtype=np.int64)
+        lengths = np.array([len(nodes) for nodes in leg_nodes],dtype=np.int64)
+        flat = np.fromiter((node for nodes in leg_nodes for node in nodes),
+                           dtype=np.int64,count=int(lengths.sum()))
+        stride = 1
+        if len(from_nodes) > 0:
+            stride = int(max(from_nodes.max(),to_nodes.max())) + 1
+        # stable, so repeats of a link keep their order
+        order = np.lexsort((to_nodes,from_nodes))
+        starts = np.concatenate(([0],np.cumsum(lengths)))[:-1]
+        lengths = lengths[order]
+        # positions in flat of every node, link by link in sorted order
+        take = np.repeat(starts[order] - np.concatenate(([0],np.cumsum(lengths)))[:-1],
+                         lengths) + np.arange(int(lengths.sum()))
+        keys = from_nodes[order]*stride + to_nodes[order]
+        first = np.ones(len(keys),dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        offsets = np.concatenate(([0],np.cumsum(lengths)))[np.append(np.flatnonzero(first),len(keys))]
+        return cls(from_nodes[order][first],to_nodes[order][first],
+                   offsets,flat[take],stride)
+
+    def with_legs(self,from_nodes,to_nodes,leg_nodes):
+        """a new BreakNodeChains with more links added"""
+        old = []
+        if len(self) > 0:
+            old = np.split(self.nodes,self.offsets[1:-1])
+        return BreakNodeChains.from_legs(np.concatenate((self.from_nodes,np.asarray(from_nodes,dtype=np.int64))),
+                                         np.concatenate((self.to_nodes,np.asarray(to_nodes,dtype=np.int64))),
+                                         list(old) + list(leg_nodes))
+
+    def without_endpoints(self,nodes):
+        """returns (a new BreakNodeChains without the links that start
+        or end at any of nodes, the break node ids that were on those
+        links)
+
+        """
+        drop = np.isin(self.from_nodes,nodes) | np.isin(self.to_nodes,nodes)
+        lengths = np.diff(self.offsets)
+        on_dropped = np.repeat(drop,lengths)
+        offsets = np.concatenate(([0],np.cumsum(lengths[~drop])))
+        chains = BreakNodeChains(self.from_nodes[~drop],self.to_nodes[~drop],
+                                 offsets,self.nodes[~on_dropped],self.stride)
+        return (chains,self.nodes[on_dropped])
+
+    def _position(self,from_node,to_node):
+        if not (0 <= from_node < self.stride and 0 <= to_node < self.stride):
+            return -1
+        key = from_node*self.stride + to_node
+        pos = int(self.keys.searchsorted(key))
+        if pos < len(self.keys) and self.keys[pos] == key:
+            return pos
+        return -1
+
+    def get(self,from_node,to_node):
+        """the chain of break node ids for the link, as a slice of
+        nodes, or None if there is no such link
+
+        """
+        pos = self._position(from_node,to_node)
+        if pos < 0:
+            return None
+        return self.nodes[self.offsets[pos]:self.offsets[pos+1]]
+
+    def __contains__(self,link):
+        return self._position(*link) >= 0
+
+    def __len__(self):
+        """number of links"""
+        return len(self.from_nodes)
+
+    def __eq__(self,other):
+        if not isinstance(other,BreakNodeChains):
+            return NotImplemented
+        return (np.array_equal(self.from_nodes,other.from_nodes) and
+                np.array_equal(self.to_nodes,other.to_nodes) and
+                np.array_equal(self.offsets,other.offsets) and
+                np.array_equal(self.nodes,other.nodes))
@@ -3,9 +3,11 @@ import pandas as pd
 import numpy as np
 import math
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 import break_node as BN
 import demand as Demand
+import solver_matrix as SM
 
 def make_nodes(O,D,travel_time,starting_node,timelength=60):
     """starting with O, ending with D, make a dummy node every timelength minutes
@@ -89,40 +91,79 @@ def split_links(O,D,travel_time,starting_node):
     return new_times
 
 
-def split_links_break_nodes(O,D,travel_time,new_node,break_time,reset_time):
+# hours of service break rules, in minutes
+long_break_time = 60*10
+long_break_interval = 60*11
+short_break_time = 30
+short_break_interval = 60*8
+
+def split_links_break_nodes(O,D,travel_time,new_node,break_time,reset_time,
+                            out=None,offset=0):
     """split the link from O to D in half
     arguments: O: origin node, integer
                D: destination node, integer
                travel_time: time from O to D, integer
                starting_node: starting point for new nodes, integer
+               out: optional triplet array to write into, from offset
     returns: 2 dimensional array of travel times for new nodes.
              This array is one-directional, from O to D.  Nodes
              are numbered from starting_node + zero, sequentially,
              new_node
     """
     bn = BN.BreakNode(O,D,travel_time,new_node,break_time,reset_time)
-    new_times = Demand.zeroed_trip_triplets(3)
-    # np.zeros(3,dtype=[('x', int), ('y', int),('t',float)])
-
-    # # copy existing.  this is redundant
-    # new_times[0] = [O,O,0]
-    # new_times[1] = [O,D,travel_time]
-    # new_times[2] = [D,D,0]
-
+    if out is None:
+        out = Demand.zeroed_trip_triplets(3)
+        offset = 0
 
     # compute travel minutes
-    new_times[0] = (O,new_node,bn.tt_o)
-    new_times[1] = (new_node,new_node, 0)
-    new_times[2] = (new_node,D,bn.tt_d)
+    out[offset] = (O,new_node,bn.tt_o)
+    out[offset+1] = (new_node,new_node, 0)
+    out[offset+2] = (new_node,D,bn.tt_d)
 
     # new nodes are stored in "new_times" as keys of second dimension
     # not symmetric, but rather, directional.  Opposite way is impossible
     # so those values are NaN and easily set to infinity
-    return (new_times,bn)
+    return (out[offset:offset+3],bn)
+
+
+def count_break_arcs(tt):
+    """How many break nodes and arcs break_node_splitter will make for a
+    link of travel time tt.  Works on a single value or an array.
+
+    returns: (number of new nodes, number of new triplets)
+    """
+    tt = np.asarray(tt,dtype=float)
+    long_possible_breaks = np.maximum(np.ceil(tt/long_break_interval),1).astype(int)
+    extra_short = (tt - (long_possible_breaks-1)*long_break_interval
+                   > short_break_interval).astype(int)
+    # each long break comes with a short break, 3 triplets apiece,
+    # then one extra link from the last short break to destination,
+    # and maybe one more short break
+    num_nodes = 2*long_possible_breaks + extra_short
+    num_arcs = 6*long_possible_breaks + 1 + 3*extra_short
+    return (num_nodes,num_arcs)
+
+
+def needs_breaks(from_nodes,tts):
+    """Which links could ever need a break along them, given the worst
+    the drive accumulators could be at the start.  Works on a single
+    value or an array.
+
+    Leaving any node but the depot, the accumulators could be just
+    short of their limits, so any link with some driving on it might
+    need a break.  Leaving the depot, both start from zero, so a link
+    shorter than the short break interval can never reach either
+    limit.  A zero minute link adds nothing to either accumulator.
+    Those last two need no break nodes at all.
+
+    """
+    from_nodes = np.asarray(from_nodes)
+    tts = np.asarray(tts,dtype=float)
+    return (tts > 0) & ((from_nodes != 0) | (tts >= short_break_interval))
 
 
 """Code that gets used a lot, so split out into its own fn"""
-def break_node_splitter(origin,destination,tt,min_start):
+def break_node_splitter(origin,destination,tt,min_start,out=None,offset=0):
     """Given an Origin and a Destination node, plus travel time between
     and the numbering of nodes (min start is an integer for the first
     node that will be created), create necessary break nodes between O
@@ -132,17 +173,19 @@ def break_node_splitter(origin,destination,tt,min_start):
 
     Going to make it work for 8hr drive, 0.5hr break.
 
+    If out is given, the triplets are written into it starting at
+    offset, and it must have room for count_break_arcs(tt) of them.
+
     """
-    new_times = Demand.zeroed_trip_triplets(0)
-    # np.zeros(0,dtype=[('x', int), ('y', int),('t',float)])
+    (num_nodes,num_arcs) = count_break_arcs(tt)
+    if out is None:
+        out = Demand.zeroed_trip_triplets(num_arcs)
+        offset = 0
+    pos = offset
     new_nodes = []
-    long_break_time = 60*10
-    long_break_interval = 60*11
-    short_break_time = 30
-    short_break_interval = 60*8
 
     # for the 11 hour drive rule
-    long_possible_breaks = math.ceil(tt/(11*60))
+    long_possible_breaks = math.ceil(tt/long_break_interval)
     if long_possible_breaks == 0:
         long_possible_breaks = 1
 
@@ -156,10 +199,11 @@ def break_node_splitter(origin,destination,tt,min_start):
                                          segment_tt,
                                          min_start,
                                          long_break_time,
-                                         long_break_interval
+                                         long_break_interval,
+                                         out,pos
         )
         min_start += 1
-
+        pos += 3
 
         node11 = pair11[1]
 
@@ -172,28 +216,15 @@ def break_node_splitter(origin,destination,tt,min_start):
                                         node11.tt_o,
                                         min_start,
                                         short_break_time,
-                                        short_break_interval)
+                                        short_break_interval,
+                                        out,pos)
         node8=pair8[1]
         # need to correct the destination of the node8 because of the
         # way the demand object stores and retrieves breaks between an
         # OD pair
         node8.destination = destination
         min_start += 1
-
-        # possibly set up a dimension thing here too?
-        # pair8[1].add_dimension_name('halfhrbreak') # or similar?
-
-        # if i==long_possible_breaks-1:
-        #     # closing in on destination, so include potential to get
-        #     # from short break to goal?
-        #     extra_link = np.array([node8.node,destination,node8.tt_d+node11.tt_d])
-        #     new_times = np.concatenate(new_times,
-        #                                 pair11[0],
-        #                                 pair8[0])
-        new_times = np.concatenate((new_times,
-                                    pair11[0],
-                                    pair8[0]),axis=0)
-
+        pos += 3
 
         # but I want the 8hr break nodes coming before the 11 hr ones
         new_nodes.append(pair8[1])
@@ -210,11 +241,8 @@ def break_node_splitter(origin,destination,tt,min_start):
     # might not need a short break after long break prior to
     # arrival at destination, so make it so can just get to dest
     # from short break
-    extra_connection = np.array([(node8.node,destination,node8.tt_d+node11.tt_d)],
-                                dtype=[('x', int), ('y', int),('t',float)])
-    new_times = np.concatenate((new_times,extra_connection),axis=0)
-    # print(tt,long_possible_breaks*long_break_interval,
-    #       tt - long_possible_breaks*long_break_interval)
+    out[pos] = (node8.node,destination,node8.tt_d+node11.tt_d)
+    pos += 1
 
     # might need another 8 hr break node, but
     # only put in another 8 hr node if need to do so
@@ -229,13 +257,112 @@ def break_node_splitter(origin,destination,tt,min_start):
                                         node11.tt_d,
                                         min_start,
                                         short_break_time,
-                                        short_break_interval)
+                                        short_break_interval,
+                                        out,pos)
         min_start += 1 # not necessary, but good habit
+        pos += 3
 
-        new_times = np.concatenate((new_times,pair8[0]),axis=0)
         new_nodes.append(pair8[1])
 
-    return (new_times,new_nodes,min_start)
+    assert pos - offset == num_arcs
+    assert len(new_nodes) == num_nodes
+    return (out[offset:pos],new_nodes,min_start)
+
+def expand_legs(origins,destinations,tts,min_start):
+    """Make the break nodes for many links in one go.
+
+    arguments: origins, destinations: node ids at either end of each link
+               tts: travel time of each link
+               min_start: id of the first new node
+    returns: (triplets for every link in one array,
+              list of the break nodes made for each link,
+              next unused node id)
+
+    The node and arc counts are worked out up front, so all of the
+    triplets land in one preallocated array, and each link gets the
+    same node ids it would get if done one at a time in order.
+
+    """
+    (num_nodes,num_arcs) = count_break_arcs(tts)
+    arc_starts = np.concatenate(([0],np.cumsum(num_arcs)))
+    node_starts = min_start + np.concatenate(([0],np.cumsum(num_nodes)))
+    new_times = Demand.zeroed_trip_triplets(int(arc_starts[-1]))
+    leg_nodes = []
+    for i in range(0,len(tts)):
+        triple = break_node_splitter(int(origins[i]),int(destinations[i]),
+                                     tts[i],int(node_starts[i]),
+                                     new_times,int(arc_starts[i]))
+        assert triple[2] == node_starts[i+1]
+        leg_nodes.append(triple[1])
+    return (new_times,leg_nodes,int(node_starts[-1]))
+
+def _expand_chunk(chunk):
+    """expand_legs in a worker process.  The node ids come in with the
+    chunk, so the worker does not need to know about anything else
+
+    """
+    (origins,destinations,tts,min_start) = chunk
+    (new_times,leg_nodes,next_node) = expand_legs(origins,destinations,tts,min_start)
+    return (new_times,leg_nodes)
+
+def chunk_bounds(from_nodes,num_arcs,num_chunks):
+    """cut the links into about num_chunks runs with about the same
+    number of arcs, only cutting where the from node changes, so all of
+    the links out of any one node land in the same chunk.
+
+    returns: list of (start, end) positions
+
+    """
+    from_nodes = np.asarray(from_nodes)
+    arc_ends = np.cumsum(num_arcs)
+    # positions where a new from node starts
+    changes = np.flatnonzero(from_nodes[1:] != from_nodes[:-1]) + 1
+    targets = arc_ends[-1] * np.arange(1,num_chunks) / num_chunks
+    cuts = np.searchsorted(arc_ends,targets,side='right')
+    # snap each cut forward to the next change of from node
+    snapped = np.searchsorted(changes,cuts)
+    cuts = np.unique(np.append(changes[snapped[snapped < len(changes)]],len(from_nodes)))
+    starts = np.concatenate(([0],cuts[:-1]))
+    return [(int(a),int(b)) for (a,b) in zip(starts,cuts) if b > a]
+
+def expand_legs_parallel(origins,destinations,tts,min_start,workers=1):
+    """expand_legs, spread over a pool of worker processes.
+
+    The node ids for every link are worked out up front with
+    count_break_arcs, and each worker gets a run of links along with
+    the first node id of that run, so the results are exactly what
+    expand_legs would give done in one go.
+
+    """
+    if workers <= 1 or len(tts) < 2:
+        return expand_legs(origins,destinations,tts,min_start)
+    origins = np.asarray(origins,dtype=int)
+    destinations = np.asarray(destinations,dtype=int)
+    tts = np.asarray(tts,dtype=float)
+    (num_nodes,num_arcs) = count_break_arcs(tts)
+    node_starts = min_start + np.concatenate(([0],np.cumsum(num_nodes)))
+    chunks = [(origins[a:b],destinations[a:b],tts[a:b],int(node_starts[a]))
+              for (a,b) in chunk_bounds(origins,num_arcs,workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_expand_chunk,chunks))
+    new_times = np.concatenate([r[0] for r in results])
+    leg_nodes = [nodes for r in results for nodes in r[1]]
+    return (new_times,leg_nodes,int(node_starts[-1]))
+
+def record_legs(record,travel_times):
+    """the depot to origin, origin to destination and destination to
+    depot links for a demand record, skipping any that are missing
+    from travel_times.  returns list of (from, to, travel time)
+
+    """
+    legs = []
+    for (o,d) in [(0,record.origin),
+                  (record.origin,record.destination),
+                  (record.destination,0)]:
+        tt = travel_times.loc[o,d]
+        if not np.isnan(tt):
+            legs.append((o,d,tt))
+    return legs
 
 """Yes, this seems redundant with above by the name, but it isn't"""
 def split_break_node(record,travel_times,min_start=None):
@@ -251,56 +378,44 @@ def split_break_node(record,travel_times,min_start=None):
 
     if min_start == None:
         min_start = len(travel_times.index)
-    new_times = Demand.zeroed_trip_triplets(0)
-    # np.zeros(0,dtype=[('x', int), ('y', int),('t',float)])
-    new_nodes = []
-    tt = travel_times.loc[0,record.origin]
-    if not np.isnan(tt):
-        pair = break_node_splitter(0,record.origin,tt,min_start)
-        new_times = np.concatenate((new_times,pair[0]),axis=0)
-        new_nodes.extend(pair[1])
-        min_start = pair[2]
-
-    tt = travel_times.loc[record.origin,record.destination]
-    if not np.isnan(tt):
-        pair = break_node_splitter(record.origin,record.destination,tt,min_start)
-        new_times = np.concatenate((new_times,pair[0]),axis=0)
-        new_times = np.concatenate((new_times,pair[0]),axis=0)
-        new_nodes.extend(pair[1])
-        min_start = pair[2]
-
-    tt = travel_times.loc[record.destination,0]
-    if not np.isnan(tt):
-        pair = break_node_splitter(record.destination,0,tt,min_start)
-        new_times = np.concatenate((new_times,pair[0]),axis=0)
-        new_nodes.extend(pair[1])
-        min_start = pair[2]
-    #print(new_times)
-
+    legs = record_legs(record,travel_times)
+    (new_times,leg_nodes,min_start) = expand_legs([leg[0] for leg in legs],
+                                                  [leg[1] for leg in legs],
+                                                  [leg[2] for leg in legs],
+                                                  min_start)
+    new_nodes = [bn for nodes in leg_nodes for bn in nodes]
     return (new_times,new_nodes,min_start)
 
 def aggregate_split_nodes(travel_time,newtimes):
-    """combine current time matrix with list of new times for each new node"""
+    """combine current time matrix with list of new times for each new node
+
+    The new arcs are scattered straight into one preallocated array
+    that is big enough for the new nodes, and the old matrix is
+    copied over the top (existing arcs win).  No pivot, no
+    intermediate frames.
+
+    """
+    if isinstance(travel_time,(SM.SolverMatrix,SM.SparseSolverMatrix)):
+        return travel_time.with_arcs(newtimes)
+
     # at this time, I keep careful track of new nodes, so there should
     # be no need for the adjustment code.
-
-    new_df=pd.DataFrame(data=newtimes)
-    #new_df = pd.DataFrame(data=merged_nt,columns=['from','to','time'])
-    new_df.drop_duplicates(inplace=True)
-    df_new_times = new_df.pivot(index='x',columns='y',values='t')
-    # print(df_new_times)
-
-    df_new_times.update(travel_time)
-    # print(df_new_times)
-    for idx in travel_time.index:
-        if not idx in df_new_times.index:
-            print('problems ahead.  missing',idx,'from',df_new_times.index,' Bailing out')
-        assert idx in df_new_times.index
-    # print(df_new_times.index)
-    # print(travel_time.index)
-    # print(df_new_times)
-    travel_time = df_new_times
-    return travel_time
+    old_size = len(travel_time.index)
+    assert (travel_time.index == range(0,old_size)).all()
+    assert (travel_time.columns == range(0,old_size)).all()
+    size = old_size
+    if len(newtimes) > 0:
+        size = max(size,int(newtimes['x'].max())+1,int(newtimes['y'].max())+1)
+
+    times = np.full((size,size),np.nan)
+    times[newtimes['x'],newtimes['y']] = newtimes['t']
+    old_times = travel_time.values
+    np.copyto(times[:old_size,:old_size],old_times,where=~np.isnan(old_times))
+
+    nodes = range(0,size)
+    return pd.DataFrame(times,
+                        index=pd.Index(nodes,name='x'),
+                        columns=pd.Index(nodes,name='y'))
 
 
 
@@ -0,0 +1,114 @@
+"""Opt-in instrumentation for the python callbacks handed to the solver
+
+Every registered transit callback gets wrapped so that each call bumps
+a counter.  Only one call in sample_every is timed (and has its node
+pair noted), so the wrapper itself stays cheap; the total python time
+is estimated from the sampled calls.  After the solve, summary() says
+how many calls each callback got, how many per second of solve, about
+how much of the solve was spent in python, and which node pairs came
+up the most.
+
+"""
+import json
+import time
+from collections import Counter
+
+class _Counter():
+    def __init__(self,name,kind):
+        self.name = name
+        self.kind = kind
+        self.calls = 0
+        self.sampled = 0
+        self.sampled_seconds = 0.0
+        self.pairs = Counter()
+
+class CallbackStats():
+
+    def __init__(self,filename=None,sample_every=100,top=10):
+        assert sample_every > 0
+        self.filename = filename
+        self.sample_every = sample_every
+        self.top = top
+        self.counters = {}
+        self.manager = None
+        self.solve_seconds = None
+        self._solve_start = None
+
+    def wrap(self,name,callback):
+        """wrap a (from_index, to_index) transit callback"""
+        counter = _Counter(name,'callback')
+        self.counters[name] = counter
+        sample_every = self.sample_every
+        clock = time.perf_counter
+        def wrapped(from_index,to_index):
+            counter.calls += 1
+            if counter.calls % sample_every:
+                return callback(from_index,to_index)
+            start = clock()
+            value = callback(from_index,to_index)
+            counter.sampled_seconds += clock() - start
+            counter.sampled += 1
+            counter.pairs[(from_index,to_index)] += 1
+            return value
+        return wrapped
+
+    def note_matrix(self,name):
+        """record that name was handed over as a matrix or vector, so it
+        never calls back into python"""
+        self.counters[name] = _Counter(name,'matrix')
+
+    def start_solve(self):
+        self._solve_start = time.perf_counter()
+
+    def end_solve(self):
+        if self._solve_start is not None:
+            self.solve_seconds = time.perf_counter() - self._solve_start
+
+    def _node(self,index):
+        if self.manager is None:
+            return int(index)
+        return int(self.manager.IndexToNode(index))
+
+    def _estimated_seconds(self,counter):
+        if counter.sampled == 0:
+            return 0.0
+        return counter.sampled_seconds / counter.sampled * counter.calls
+
+    def summary(self):
+        callbacks = {}
+        total_calls = 0
+        total_seconds = 0.0
+        for (name,counter) in self.counters.items():
+            seconds = self._estimated_seconds(counter)
+            total_calls += counter.calls
+            total_seconds += seconds
+            entry = {'kind':counter.kind,
+                     'calls':counter.calls,
+                     'sampled_calls':counter.sampled,
+                     'python_seconds':seconds}
+            if counter.sampled > 0:
+                entry['mean_microseconds'] = counter.sampled_seconds / counter.sampled * 1e6
+            if self.solve_seconds:
+                entry['calls_per_second'] = counter.calls / self.solve_seconds
+            entry['hottest'] = [{'nodes':[self._node(i) for i in pair],
+                                 'sampled_calls':count}
+                                for (pair,count) in counter.pairs.most_common(self.top)]
+            callbacks[name] = entry
+        result = {'sample_every':self.sample_every,
+                  'solve_seconds':self.solve_seconds,
+                  'total_calls':total_calls,
+                  'python_seconds':total_seconds,
+                  'callbacks':callbacks}
+        if self.solve_seconds:
+            result['python_fraction'] = total_seconds / self.solve_seconds
+        return result
+
+    def report(self):
+        """print the JSON summary, and write it to self.filename if set"""
+        text = json.dumps(self.summary(),indent=2)
+        print(text)
+        if self.filename:
+            with open(self.filename,'w') as f:
+                f.write(text)
+                f.write('\n')
+        return text
@@ -0,0 +1,27 @@
+import argparse
+
+import map_matrix as MM
+
+def main():
+    """Convert a CSV distance matrix to .npy, for use with --matrixfile"""
+    parser = argparse.ArgumentParser(description=('One time conversion of the CSV travel matrix (distances) '
+                                                  'into a binary .npy file that can be memory mapped'))
+    parser.add_argument('-m,--matrixfile', type=str, dest='matrixfile',
+                        help='CSV file for travel matrix (distances)')
+    parser.add_argument('-o,--output', type=str, dest='output',
+                        help='.npy file to write.  Default is the CSV file name with .npy on the end')
+    parser.add_argument('--chunksize', type=int, dest='chunksize', default=1000,
+                        help='Number of CSV rows to read at a time.  Default is 1000')
+    parser.add_argument('--dtype', type=str, dest='dtype',
+                        help='numpy dtype to store, for example float64.  Default is whatever the first rows read as')
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        output = args.matrixfile + '.npy'
+    print('converting',args.matrixfile,'to',output)
+    MM.convert_csv(args.matrixfile,output,args.chunksize,args.dtype)
+
+
+if __name__ == '__main__':
+    main()
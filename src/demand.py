@@ -2,12 +2,175 @@ import pandas as pd
 import numpy as np
 import breaks
 import break_node as BN
+import solver_matrix as SM
+import map_matrix as MM
 import math
-from functools import partial
+
+# what kind of node a model node is, in Demand.node_table
+NODE_UNKNOWN = -1
+NODE_DEPOT = 0
+NODE_PICKUP = 1
+NODE_DROPOFF = 2
+NODE_BREAK = 3
+# an origin, destination or break node of a load that has been retired
+NODE_RETIRED = 4
+
+# one row per model node, see Demand.node_table
+NODE_TABLE_DTYPE = [('map_node',np.int64),
+                    ('demand',np.int8),
+                    ('service_time',np.int64),
+                    ('demand_index',np.int64),
+                    ('kind',np.int8),
+                    ('break_time',np.int64),
+                    ('drive_restore',np.int64)]
 
 def zeroed_trip_triplets(num):
     return np.zeros(num,dtype=[('x', int), ('y', int),('t',float)])
 
+def map_space_positions(matrix,from_nodes,to_nodes):
+    """row and column positions of the map nodes in a DataFrame
+    matrix.  A map node that is not in the matrix is a KeyError, same
+    as .loc, rather than a -1 that quietly reads the last row"""
+    rows = matrix.index.get_indexer(from_nodes)
+    cols = matrix.columns.get_indexer(to_nodes)
+    if (rows < 0).any() or (cols < 0).any():
+        missing = np.concatenate((np.asarray(from_nodes)[rows < 0],
+                                  np.asarray(to_nodes)[cols < 0]))
+        raise KeyError('map nodes not in the matrix: {}'.format(np.unique(missing).tolist()))
+    return (rows,cols)
+
+def map_space_times(matrix,from_nodes,to_nodes):
+    """pull a block of travel times out of the map space matrix
+
+    arguments: matrix: map space matrix (pandas.DataFrame or
+                       map_matrix.MappedMatrix)
+               from_nodes: map node ids for the rows, array of int
+               to_nodes: map node ids for the columns, array of int
+    returns: 2D float array, len(from_nodes) by len(to_nodes)
+
+    """
+    if isinstance(matrix,MM.MappedMatrix):
+        return matrix.take(from_nodes,to_nodes)
+    (rows,cols) = map_space_positions(matrix,from_nodes,to_nodes)
+    return np.asarray(matrix.values[np.ix_(rows,cols)],dtype=float)
+
+def map_space_pair_times(matrix,from_nodes,to_nodes):
+    """like map_space_times, but elementwise pairs, not the full block"""
+    if isinstance(matrix,MM.MappedMatrix):
+        return matrix.take_pairs(from_nodes,to_nodes)
+    (rows,cols) = map_space_positions(matrix,from_nodes,to_nodes)
+    return np.asarray(matrix.values[rows,cols],dtype=float)
+
+def solver_space_times(matrix,origins,destinations,from_nodes,to_nodes):
+    """build the solver space travel time array
+
+    arguments: matrix: map space matrix
+               origins: solver node ids of the pickups
+               destinations: solver node ids of the dropoffs
+               from_nodes: map node ids of the pickups
+               to_nodes: map node ids of the dropoffs
+    returns: square float array indexed by solver node id, with NaN
+             marking arcs that are not allowed
+
+    Every load gets depot to origin, origin to destination, and
+    destination to depot arcs, and every destination links to every
+    other origin.  Everything else is NaN.
+
+    """
+    origins = np.asarray(origins,dtype=int)
+    destinations = np.asarray(destinations,dtype=int)
+    size = 1
+    if len(origins) > 0:
+        size = max(origins.max(),destinations.max()) + 1
+    times = np.full((size,size),np.nan)
+    times[0,0] = 0
+    if len(origins) == 0:
+        return times
+
+    # one fancy-indexed read covers the depot and destination rows
+    map_rows = np.concatenate(([0],to_nodes))
+    map_cols = np.concatenate(([0],from_nodes))
+    block = map_space_times(matrix,map_rows,map_cols)
+    num = len(origins)
+    load = np.arange(num)
+
+    times[origins,origins] = 0
+    times[destinations,destinations] = 0
+    # depot to origin, origin to destination, destination to depot
+    times[0,origins] = block[0,1:num+1]
+    times[origins,destinations] = map_space_pair_times(matrix,from_nodes,to_nodes)
+    times[destinations,0] = block[1:,0]
+    # destination to every other origin
+    dest_origin = block[1:,1:num+1]
+    dest_origin[load,load] = np.nan
+    times[np.ix_(destinations,origins)] = dest_origin
+    return times
+
+
+
+def new_load_arcs(time_matrix,old,new):
+    """the solver space arcs that adding the new loads makes, as
+    triplets: depot to origin, origin to destination, destination to
+    depot and the zero self arcs for each new load, plus new
+    destinations to every origin but their own, and old destinations
+    to the new origins.  old and new are demand rows with origin and
+    destination set, same as solver_space_times.
+
+    """
+    o = new.origin.values.astype(int)
+    d = new.destination.values.astype(int)
+    from_nodes = new.from_node.values
+    to_nodes = new.to_node.values
+    num = len(o)
+    depot = np.zeros(num,dtype=int)
+    x = [o,d,depot,o,d]
+    y = [o,d,o,d,depot]
+    t = [np.zeros(num),np.zeros(num),
+         map_space_pair_times(time_matrix,depot,from_nodes),
+         map_space_pair_times(time_matrix,from_nodes,to_nodes),
+         map_space_pair_times(time_matrix,to_nodes,depot)]
+    # every destination to every origin, leaving out each new load's own
+    all_o = np.concatenate((old.origin.values.astype(int),o))
+    block = map_space_times(time_matrix,to_nodes,
+                            np.concatenate((old.from_node.values,from_nodes)))
+    own = np.zeros(block.shape,dtype=bool)
+    own[np.arange(num),len(old.index)+np.arange(num)] = True
+    x.append(np.repeat(d,len(all_o))[~own.ravel()])
+    y.append(np.tile(all_o,num)[~own.ravel()])
+    t.append(block.ravel()[~own.ravel()])
+    # and the old destinations to the new origins
+    block = map_space_times(time_matrix,old.to_node.values,from_nodes)
+    x.append(np.repeat(old.destination.values.astype(int),num))
+    y.append(np.tile(o,len(old.index)))
+    t.append(block.ravel())
+
+    x = np.concatenate(x)
+    triplets = zeroed_trip_triplets(len(x))
+    triplets['x'] = x
+    triplets['y'] = np.concatenate(y)
+    triplets['t'] = np.concatenate(t)
+    return triplets
+
+def without_nodes(travel_times,nodes):
+    """travel_times with every arc into or out of nodes dropped"""
+    nodes = np.asarray(nodes,dtype=int)
+    if isinstance(travel_times,(SM.SolverMatrix,SM.SparseSolverMatrix)):
+        keep = np.ones(len(travel_times),dtype=bool)
+        keep[nodes] = False
+        return travel_times.subset(np.flatnonzero(keep))
+    travel_times = travel_times.copy()
+    travel_times.iloc[nodes,:] = np.nan
+    travel_times.iloc[:,nodes] = np.nan
+    return travel_times
+
+def time_matrix_is_integer(matrix):
+    """true if the map space matrix holds integers (e.g., a distance
+    matrix used directly as minutes)"""
+    if isinstance(matrix,MM.MappedMatrix):
+        return (np.issubdtype(matrix.values.dtype,np.integer)
+                and all(isinstance(v,(int,np.integer)) for v in matrix.divisors))
+    return all(np.issubdtype(t,np.integer) for t in matrix.dtypes)
+
 
 
 class Demand():
@@ -22,46 +185,54 @@ class Demand():
     """
 
     def estimate_break_time(self,tt,long_break,short_break):
+        """works on a single travel time or on an array of them"""
         # long breaks, calc number of breaks
         long_break_time = long_break.break_time
         long_break_period = long_break.accumulator_reset
         short_break_time = short_break.break_time
         short_break_period = short_break.accumulator_reset
 
-        num_long_breaks = math.floor(tt / long_break_period)
+        num_long_breaks = np.floor(np.divide(tt,long_break_period)).astype(int)
 
 
         # for each long break, will also need at least one short break
         # but *might* need another if drive time works out that way
         # drive time is do_tt
         # every 11 hr, 8 hr clock resets to zero
-        num_short_breaks = num_long_breaks
-        if tt - (num_long_breaks*long_break_period) > short_break_period:
-            num_short_breaks += 1
+        num_short_breaks = num_long_breaks + (tt - (num_long_breaks*long_break_period)
+                                              > short_break_period)
 
         # sum the two
         return num_long_breaks*long_break_time + num_short_breaks*short_break_time
 
-    def check_feasible(self, time_matrix, long_break, short_break, record):
+    def check_feasible(self, time_matrix, long_break, short_break, demand):
         """Use travel time matrix to check that every trip is at least
             feasible as a one-off, that is, as a trip from depot to pickup
             to destination and back to depot, respecting both the horizon
             time of the simulation, and the time window of the pickup.
 
             Infeasible nodes will be marked as such here, so that they
-            will not be used in the simulation.
+            will not be used in the simulation.  The reason goes in the
+            constraint column.
+
+            All of the loads are done at once, column by column.
 
         """
-        feasible = True
-        constraint = "None"
+        from_nodes = demand.from_node.values
+        to_nodes = demand.to_node.values
+        depot = np.zeros(len(from_nodes),dtype=int)
         # depot to origin
-        do_tt = time_matrix.loc[0, record.from_node]
+        do_tt = map_space_pair_times(time_matrix,depot,from_nodes)
 
         # origin to destination
-        od_tt = time_matrix.loc[record.from_node, record.to_node]
+        od_tt = map_space_pair_times(time_matrix,from_nodes,to_nodes)
 
         # destination to depot
-        dd_tt = time_matrix.loc[record.to_node, 0]
+        dd_tt = map_space_pair_times(time_matrix,to_nodes,depot)
+
+        if time_matrix_is_integer(time_matrix):
+            # keep the integer arithmetic (and messages) of integer inputs
+            (do_tt,od_tt,dd_tt) = (do_tt.astype(int),od_tt.astype(int),dd_tt.astype(int))
 
         do_break_time = 0
         od_dd_break_time = 0
@@ -71,45 +242,46 @@ class Demand():
             od_dd_break_time = self.estimate_break_time(od_tt+dd_tt,long_break,short_break)
             od_break_time = self.estimate_break_time(od_tt,long_break,short_break)
 
+        pickup_time = demand.pickup_time.values
+        dropoff_time = demand.dropoff_time.values
+        early = demand.early.values
+        late = demand.late.values
 
-        depot_origin_tt = do_tt + record.pickup_time+do_break_time
+        depot_origin_tt = do_tt + pickup_time + do_break_time
 
-        earliest_pickup = record.early
-        if record.early < depot_origin_tt:
-            earliest_pickup = depot_origin_tt
+        earliest_pickup = np.where(early < depot_origin_tt, depot_origin_tt, early)
 
         time_return_depot = (earliest_pickup +     # arrive at orign
-                             record.pickup_time +  # load up
-                             record.dropoff_time +  # unload
+                             pickup_time +  # load up
+                             dropoff_time +  # unload
                              od_tt +               # travel time to dest
                              dd_tt +               # travel time to depot
                              od_dd_break_time      # breaks?
         )
 
         time_destination = (earliest_pickup +
-                            record.pickup_time +
+                            pickup_time +
                             od_tt +
                             od_break_time)
 
-        if time_return_depot > self.horizon:
-            constraint = "Pair from {} to {} will end at {}, after horizon time of {}".format(record.from_node,record.to_node,time_return_depot,self.horizon)
-            print(constraint)
-            feasible = False
-        if depot_origin_tt > record.late:
-            constraint = "Pair from {} to {} has infeasible pickup time.  {} is less than earliest arrival possible of {}".format(record.from_node,record.to_node,
-                                                                                                                           record.late,depot_origin_tt)
-            print(constraint)
-            feasible = False
-        return pd.Series([math.ceil(time_return_depot),
-                          math.ceil(depot_origin_tt),
-                          math.ceil(time_destination),
-                          feasible,
-                          constraint],
-                         index=['round_trip',
-                                'depot_origin',
-                                'earliest_destination',
-                                'feasible',
-                                'constraint'])
+        after_horizon = time_return_depot > self.horizon
+        missed_pickup = depot_origin_tt > late
+        constraint = np.full(len(from_nodes),"None",dtype=object)
+        for i in np.flatnonzero(after_horizon):
+            constraint[i] = "Pair from {} to {} will end at {}, after horizon time of {}".format(from_nodes[i],to_nodes[i],time_return_depot[i],self.horizon)
+        # if both, the pickup message is the one that sticks
+        for i in np.flatnonzero(missed_pickup):
+            constraint[i] = "Pair from {} to {} has infeasible pickup time.  {} is less than earliest arrival possible of {}".format(from_nodes[i],to_nodes[i],
+                                                                                                                               late[i],depot_origin_tt[i])
+        if self.debug:
+            for message in constraint[after_horizon | missed_pickup]:
+                print(message)
+        return pd.DataFrame({'round_trip':np.ceil(time_return_depot).astype(int),
+                             'depot_origin':np.ceil(depot_origin_tt).astype(int),
+                             'earliest_destination':np.ceil(time_destination).astype(int),
+                             'feasible':~(after_horizon | missed_pickup),
+                             'constraint':constraint},
+                            index=demand.index)
 
     def __init__(self,
                  odpairs,
@@ -122,20 +294,18 @@ class Demand():
 
         self.debug = debug
         self.horizon = horizon
+        self.pickup_time = pickup_time
+        self.dropoff_time = dropoff_time
+        self.use_breaks = use_breaks
         demand = odpairs.copy()
         # for now, just use identical pickup and dropoff times
         demand['pickup_time']=pickup_time
         demand['dropoff_time']=dropoff_time
         # check feasible demands based on time_matrix, horizon
-        long_break = None
-        short_break = None
-        if use_breaks:
-            long_break  = BN.BreakNode(-1, -1, 660, 0, 600, 660)
-            short_break = BN.BreakNode(-1, -1, 480, 0,  30, 480)
+        (long_break,short_break) = self.break_rules()
 
-        morecols = demand.apply(partial(self.check_feasible,
-                                        time_matrix,
-                                        long_break, short_break), axis=1)
+        morecols = self.check_feasible(time_matrix,
+                                       long_break, short_break, demand)
 
         # print(morecols)
         demand = demand.join(morecols)
@@ -153,7 +323,23 @@ class Demand():
         self.demand = demand
 
         # slice up to create a lookup object
-        origins = self.demand.loc[feasible_index,['from_node','origin','pickup_time']]
+        (origins,destinations) = self.lookup_frames(self.demand.loc[feasible_index,:])
+        self.origins = origins # for queries---is this origin or not
+        self.destinations = destinations # ditto
+        # can look up a map node given a model node
+        self.equivalence = origins.append(destinations)
+        self.break_nodes = None
+        self.break_node_chains = None
+        self.skip_short_legs = False
+        # solver nodes of loads that have been retired, see retire_loads
+        self.retired_nodes = np.zeros(0,dtype=int)
+        self._node_table = None
+        self._node_columns = None
+
+    def lookup_frames(self,rows):
+        """(origins, destinations) lookup frames for the given demand
+        rows, indexed by model node"""
+        origins = rows.loc[:,['from_node','origin','pickup_time']]
         origins['demand_index'] = origins.index
         origins = origins.rename(index=str,columns={'from_node':'mapnode',
                                                     'origin':'modelnode',
@@ -161,33 +347,93 @@ class Demand():
         origins.set_index('modelnode',inplace=True)
         origins['demand'] = 1
 
-        self.origins = origins # for queries---is this origin or not
-
-        destinations = self.demand.loc[feasible_index,['to_node','destination','dropoff_time']]
+        destinations = rows.loc[:,['to_node','destination','dropoff_time']]
         destinations['demand_index'] = destinations.index
         destinations = destinations.rename(index=str,columns={'to_node':'mapnode',
                                                               'destination':'modelnode',
                                                               'dropoff_time':'service_time'})
         destinations.set_index('modelnode',inplace=True)
         destinations['demand'] = -1
-        self.destinations = destinations # ditto
-        # can look up a map node given a model node
-        self.equivalence = origins.append(destinations)
-        self.break_nodes = None
-        self.break_node_chains = None
+        return (origins,destinations)
+
+    def break_rules(self):
+        """(long break, short break) BreakNodes that check_feasible uses
+        to estimate break time, or (None, None) without breaks"""
+        if not self.use_breaks:
+            return (None,None)
+        return (BN.BreakNode(-1, -1, 660, 0, 600, 660),
+                BN.BreakNode(-1, -1, 480, 0,  30, 480))
+
+    @property
+    def node_table(self):
+        """structured array with one row per model node (depot, pickups,
+        dropoffs and break nodes): map_node, demand, service_time,
+        demand_index, kind (NODE_*), and for break nodes break_time
+        and drive_restore.  Nodes that are not pickups or dropoffs have
+        map_node and demand_index -1, demand and service_time 0, same
+        as the getters always said.  Built on first use, and again
+        after break nodes get added.
+
+        """
+        if self._node_table is None:
+            self._node_table = self._build_node_table()
+            # each column again as a python list, since single reads
+            # from a list are cheaper than from a numpy array
+            self._node_columns = {name:self._node_table[name].tolist()
+                                  for name in self._node_table.dtype.names}
+        return self._node_table
+
+    def __getstate__(self):
+        # the node table and its column lists are built again on first
+        # use, so leave them out of the pickle
+        state = self.__dict__.copy()
+        state['_node_table'] = None
+        state['_node_columns'] = None
+        return state
+
+    def _build_node_table(self):
+        nodes = self.equivalence.index.values.astype(int)
+        size = 1
+        if len(nodes) > 0:
+            size = max(size,int(nodes.max())+1)
+        if self.break_nodes:
+            size = max(size,self.break_nodes.max_node()+1)
+        if len(self.retired_nodes) > 0:
+            size = max(size,int(self.retired_nodes.max())+1)
+        table = np.zeros(size,dtype=NODE_TABLE_DTYPE)
+        table['map_node'] = -1
+        table['demand_index'] = -1
+        table['kind'] = NODE_UNKNOWN
+        table['map_node'][0] = 0
+        table['kind'][0] = NODE_DEPOT
+
+        table['map_node'][nodes] = self.equivalence.mapnode.values
+        table['demand'][nodes] = self.equivalence.demand.values
+        table['service_time'][nodes] = self.equivalence.service_time.values
+        table['demand_index'][nodes] = self.equivalence.demand_index.values
+        table['kind'][nodes] = np.where(self.equivalence.demand.values > 0,
+                                        NODE_PICKUP,NODE_DROPOFF)
+        if self.break_nodes:
+            bn_nodes = self.break_nodes.nodes()
+            table['kind'][bn_nodes] = NODE_BREAK
+            table['break_time'][bn_nodes] = self.break_nodes.break_time[bn_nodes]
+            table['drive_restore'][bn_nodes] = self.break_nodes.drive_time_restore()[bn_nodes]
+        table['kind'][self.retired_nodes] = NODE_RETIRED
+        return table
 
     def get_node_list(self):
         return self.equivalence.index.view(int)
 
     def _get_demand_entry(self,demand_node,entry,default):
-        if demand_node in self.equivalence.index:
-            return int(self.equivalence.loc[demand_node,entry])
+        if self._node_table is None:
+            self.node_table
+        column = self._node_columns[entry]
+        if 0 <= demand_node < len(column):
+            return column[demand_node]
         return default
 
     def get_map_node(self,demand_node):
-        if demand_node == 0:
-            return 0
-        return self._get_demand_entry(demand_node,'mapnode',-1)
+        return self._get_demand_entry(demand_node,'map_node',-1)
 
     def get_demand_number(self,demand_node):
         return self._get_demand_entry(demand_node,'demand_index',-1)
@@ -198,54 +444,39 @@ class Demand():
     def get_demand(self,demand_node):
         return self._get_demand_entry(demand_node,'demand',0)
 
-    def generate_solver_space_matrix(self,matrix,horizon=None):
+    def get_node_kind(self,demand_node):
+        return self._get_demand_entry(demand_node,'kind',NODE_UNKNOWN)
+
+    def generate_solver_space_matrix(self,matrix,horizon=None,compact=False):
         """the input distance matrix is in "map space", meaning that nodes can
         repeat and so on.  The solver cannot work in that space, so
         this routine converts.  Input is a matrix of distances between
         nodes, output is the same data, but reindexed and possibly
         repeated for nodes in solver space.
 
+        All of the arcs are pulled out of the map space matrix in one
+        go by fancy indexing with the origin and destination map node
+        arrays, rather than looping over the loads.
+
         """
         if(horizon == None):
             horizon=self.horizon
-        # iterate over each entry in the matrix, and make a new matrix
-        # with same data.
-        new_times = zeroed_trip_triplets(1)
-        new_matrix = {}
 
         # list of all origins
         self.demand['load_number'] = self.demand.index
         feasible_idx = self.demand.feasible
-        def travtime(record):
-            record_times = zeroed_trip_triplets(5)
-            record_times[0]=(record.origin, record.origin,0.0)
-            record_times[1]=(record.destination, record.destination,0.0)
-            record_times[2]=(record.origin, record.destination,
-                             matrix.loc[record.from_node, record.to_node])
-            record_times[3]=(0,record.origin,
-                             matrix.loc[0, record.from_node])
-            record_times[4]=(record.destination,0,
-                             matrix.loc[record.to_node, 0])
-            return record_times
-
-
-        for idx in self.demand.index[feasible_idx]:
-            record = self.demand.loc[idx]
-            new_times = np.append(new_times,travtime(record),axis=0)
-            other_feasible = feasible_idx.copy()
-            other_feasible[idx] = False
-            if len(other_feasible[other_feasible])>0:
-                # link destination to all other feasible origins
-                other_times = [(record.destination, onode, matrix.loc[record.to_node,omap])
-                               for (onode,omap) in self.demand.loc[other_feasible,
-                                                         ['origin','from_node']].values]
-
-                triple = np.array(other_times,
-                                  dtype=[('x', int), ('y', int),('t',float)])
-                new_times = np.append(new_times,triple,axis=0)
-        df = pd.DataFrame(new_times)
-        df.drop_duplicates(inplace=True)
-        df = df.pivot(index='x',columns='y',values='t')
+        feasible = self.demand.loc[feasible_idx,:]
+        times = solver_space_times(matrix,
+                                   feasible.origin.values,
+                                   feasible.destination.values,
+                                   feasible.from_node.values,
+                                   feasible.to_node.values)
+        if compact:
+            return SM.SolverMatrix.from_array(times)
+        nodes = range(0,len(times))
+        df = pd.DataFrame(times,
+                          index=pd.Index(nodes,name='x'),
+                          columns=pd.Index(nodes,name='y'))
 
         # df = df.fillna(sys.maxsize)
         # I like this prior to solver run, but here is it potentially dangerous
@@ -253,11 +484,28 @@ class Demand():
 
 
 
-    def insert_nodes_for_breaks(self,travel_times):
+    def insert_nodes_for_breaks(self,travel_times,sparse=False,workers=1,
+                                skip_short_legs=False):
         """Use travel time matrix, pickup and dropoff pairs to create the
         necessary dummy nodes for modeling breaks between pairs of nodes.
 
+        travel_times can be a DataFrame or a SolverMatrix, and the
+        expanded matrix that is returned is the same type.  If sparse
+        is true, the expanded matrix is a SparseSolverMatrix instead,
+        built straight from the break node triplets.
+
+        If workers is more than 1, the break nodes are made by that
+        many processes, split up by the from node of each link (so the
+        destination, for the destination to origin links).  The result
+        is identical to the single process run.
+
+        If skip_short_legs is true, links that can never need a break
+        (see breaks.needs_breaks) get no break nodes, just an empty
+        chain.  That sticks for any loads added later.
+
         """
+        if sparse:
+            travel_times = SM.SparseSolverMatrix.from_matrix(travel_times)
 
         # logic:
         #
@@ -267,126 +515,252 @@ class Demand():
         #
         # ditto for each dropoff node and pickup node pairing
         # and for each dropoff node and depot node pairing
+        #
+        # All of the links are collected first, so that the number of
+        # new nodes and triplets is known up front and everything can
+        # be written into one preallocated array.
         new_node = len(travel_times.index)
-        # gb = breaks.split_break_node_generator(travel_times)
-        # apply to demand pairs
         feasible_index = self.demand.feasible
-        # can't use apply here...it breaks
-        # new_times_nodes = self.demand.loc[feasible_index,:].apply(gb,axis=1,result_type='reduce')
-        self.break_nodes = {}
-        self.break_node_chains = {}
-        self.break_node_chains[0]={}
-        new_times = zeroed_trip_triplets(0)
+        legs = []
         for idx in self.demand.index[feasible_index]:
             record = self.demand.loc[idx]
-            pair = breaks.split_break_node(record,travel_times,new_node)
-            # travel_times = breaks.aggregate_split_nodes(travel_times,pair[0])
-            new_times = np.concatenate((new_times, pair[0]), axis=0)
-            new_node = pair[2]
-            for bn in  pair[1]:
-                self.break_nodes[bn.node]=bn
-                # from 0, origin, or destination
-                if bn.destination == record.origin:
-                    # this break from depot to origin
-                    if not record.origin in self.break_node_chains[0]:
-                        self.break_node_chains[0][record.origin]=[]
-                    self.break_node_chains[0][record.origin].append(bn.node)
-                if bn.destination == record.destination:
-                    # this break from origin to destination
-                    if not record.origin in self.break_node_chains:
-                        self.break_node_chains[record.origin]={}
-                    if not record.destination in self.break_node_chains[record.origin]:
-                        self.break_node_chains[record.origin][record.destination]=[]
-                    self.break_node_chains[record.origin][record.destination].append(bn.node)
-                if bn.destination == 0:
-                    # this break from destination to depot
-                    if not record.destination in self.break_node_chains:
-                        self.break_node_chains[record.destination]={}
-                    if not 0 in self.break_node_chains[record.destination]:
-                        self.break_node_chains[record.destination][0]=[]
-                    self.break_node_chains[record.destination][0].append(bn.node)
-
-                # print('checking',bn.origin,bn.node,bn.destination)
-                # assert int(travel_times.loc[bn.origin,bn.node]) == bn.tt_o
-                # assert int(travel_times.loc[bn.node,bn.destination]) == bn.tt_d
-            assert new_node > max(self.break_nodes.keys())
-
-        # fighting memory bloat; incorporate the new travel times
-        # travel_times = breaks.aggregate_split_nodes(travel_times,new_times)
-        # new_times = []
-        # print(self.break_node_chains)
+            legs.extend(breaks.record_legs(record,travel_times))
 
         print('Next deal with destinations crossed with all origins')
 
         # now do that for all destinations to all origins plus depot
         # (0). Yes, this can blow up quite large so only merge those that
         # are possible inside horizon given the total travel time
+        legs.extend(self.destination_origin_legs(travel_times))
 
-
-        # new_node = len(travel_times.index)
-        destination_details = []
-        origin_details = []
-        for idx in self.demand.index[feasible_index]:
-            record = self.demand.loc[idx]
-            destination_details.append((record.destination,
-                                        record.earliest_destination,
-                                        record.origin))
-            origin_details.append((record.origin,
-                                   record.late))
-        for dd in destination_details:
-            didx = dd[0]
-            # moretimes = []
-            for oo in origin_details:
-                oidx = oo[0]
-                if dd[2] == oidx:
-                    # that means traveling back to origin, which is impossible
-                    continue
-                # what is min time to destination, and from then, can
-                # we get to origin before horizon?
-                tt = travel_times.loc[didx,oidx]
-                assert not np.isnan(tt)
-                if dd[1] + tt > self.horizon:
-                    if self.debug:
-                        print("can't get from",didx,"to",oidx,"before horizon")
-                    continue
-                # check that can get to next origin before its time horizon ends
-                if dd[1] + tt > oo[1]:
-                    if self.debug:
-                        print("can't get from",didx,"to",oidx,"before origin pickup horizon",oo[1])
-                    continue
-                # trip chain is possible, so split destination to origin
-                pair = breaks.break_node_splitter(dd[0],oo[0],tt,new_node)
-                new_times = np.concatenate((new_times, pair[0]), axis=0)
-                #print(new_times[-2])
-                #print(new_times[-1])
-
-                for nn in pair[1]:
-                    if self.debug:
-                        print('add new node',nn.node,'bewteen',nn.origin,nn.destination)
-                    self.break_nodes[nn.node] = nn
-                    if not dd[0] in self.break_node_chains:
-                        self.break_node_chains[dd[0]]={}
-                    if not dd[1] in self.break_node_chains[dd[0]]:
-                        self.break_node_chains[dd[0]][oo[0]]=[]
-                    self.break_node_chains[dd[0]][oo[0]].append(bn.node)
-                new_node = pair[2]
-
-            # print(new_times)
-            # now at end of inner loop, incorporate the new travel times
-        travel_times = breaks.aggregate_split_nodes(travel_times,new_times)
+        self.break_nodes = None
+        self.break_node_chains = None
+        self.skip_short_legs = skip_short_legs
+        travel_times = self.expand_break_legs(travel_times,legs,new_node,workers)
         return travel_times # which holds everything of interest except self.break_nodes
 
+    def expand_break_legs(self,travel_times,legs,new_node,workers=1):
+        """make the break nodes for legs (list of (from, to, travel
+        time)), numbered from new_node, add them to the registry and
+        the chains, and return travel_times with the new arcs added
+
+        """
+        needed = np.ones(len(legs),dtype=bool)
+        if self.skip_short_legs and len(legs) > 0:
+            needed = breaks.needs_breaks([leg[0] for leg in legs],
+                                         [leg[2] for leg in legs])
+        expand = [leg for (leg,need) in zip(legs,needed) if need]
+        (new_times,leg_nodes,new_node) = breaks.expand_legs_parallel([leg[0] for leg in expand],
+                                                                     [leg[1] for leg in expand],
+                                                                     [leg[2] for leg in expand],
+                                                                     new_node,
+                                                                     workers)
+        if self.break_nodes is None:
+            # room for all of them up front, so the columns only get
+            # allocated the once
+            self.break_nodes = BN.BreakNodes(new_node)
+        for nodes in leg_nodes:
+            self.break_nodes.add(nodes)
+        # and the chains get built in one go, once everything is made.
+        # Links that were skipped still get a chain, just an empty one
+        made = iter(leg_nodes)
+        chains = ([leg[0] for leg in legs],
+                  [leg[1] for leg in legs],
+                  [[bn.node for bn in next(made)] if need else []
+                   for need in needed])
+        if self.break_node_chains is None:
+            self.break_node_chains = BN.BreakNodeChains.from_legs(*chains)
+        else:
+            self.break_node_chains = self.break_node_chains.with_legs(*chains)
+        self._node_table = None
+        self._node_columns = None
+        if self.break_nodes:
+            assert new_node > self.break_nodes.max_node()
+
+        return breaks.aggregate_split_nodes(travel_times,new_times)
+
+    def destination_origin_legs(self,travel_times,destinations=None,origins=None):
+        """the destination to other origin links that can actually be
+        used: starting from the earliest arrival at the destination, the
+        origin has to be reachable before the horizon and before its
+        pickup window closes.  returns list of (from, to, travel time),
+        by destination, then origin, in demand order
+
+        destinations and origins are the demand rows to link from and
+        to, and default to all of the feasible loads.
+
+        The origins are sorted by the end of their pickup window, so
+        for each destination a searchsorted skips every origin whose
+        window closes before the truck could even leave, and only the
+        rest get their travel times looked up.
+
+        """
+        feasible = self.demand.loc[self.demand.feasible,:]
+        if destinations is None:
+            destinations = feasible
+        if origins is None:
+            origins = feasible
+        late = origins.late.values
+        origins = origins.origin.values.astype(int)
+        by_late = np.argsort(late,kind='stable')
+        late_sorted = late[by_late]
+        legs = []
+        for (didx,earliest,own_origin) in zip(destinations.destination.values.astype(int),
+                                              destinations.earliest_destination.values,
+                                              destinations.origin.values.astype(int)):
+            # tt is never negative, so late >= earliest is a must
+            candidates = np.sort(by_late[np.searchsorted(late_sorted,earliest,side='left'):])
+            candidates = candidates[origins[candidates] != own_origin]
+            if len(candidates) == 0:
+                continue
+            oidx = origins[candidates]
+            tt = SM.lookup(travel_times,didx,oidx)
+            assert not np.isnan(tt).any()
+            arrive = earliest + tt
+            keep = (arrive <= self.horizon) & (arrive <= late[candidates])
+            if self.debug:
+                for o in oidx[arrive > self.horizon]:
+                    print("can't get from",didx,"to",o,"before horizon")
+                late_only = ~keep & (arrive <= self.horizon)
+                for (o,l) in zip(oidx[late_only],late[candidates][late_only]):
+                    print("can't get from",didx,"to",o,"before origin pickup horizon",l)
+            legs.extend(zip([int(didx)]*int(keep.sum()),
+                            oidx[keep].tolist(),
+                            tt[keep].tolist()))
+        return legs
+
+    def add_break_nodes(self,from_node,to_node,nodes):
+        """register the break nodes made for the link from from_node to
+        to_node, and record them in order as that link's chain.  The
+        chains get rebuilt, so for lots of links at once it is better
+        to do what insert_nodes_for_breaks does
+
+        """
+        if self.debug:
+            for bn in nodes:
+                print('add new node',bn.node,'bewteen',bn.origin,bn.destination)
+        if self.break_nodes is None:
+            self.break_nodes = BN.BreakNodes()
+        self.break_nodes.add(nodes)
+        chain = [bn.node for bn in nodes]
+        if self.break_node_chains is None:
+            self.break_node_chains = BN.BreakNodeChains.from_legs([from_node],[to_node],[chain])
+        else:
+            self.break_node_chains = self.break_node_chains.with_legs([from_node],[to_node],[chain])
+        self._node_table = None
+        self._node_columns = None
 
     def get_break_node_chain(self,from_node,to_node):
-        if from_node in self.break_node_chains:
-            if to_node in self.break_node_chains[from_node]:
-                return self.break_node_chains[from_node][to_node]
-        return None
+        """break node ids on the link, as an array (a view, not a copy),
+        or None if there is no such link
+
+        """
+        if self.break_node_chains is None:
+            return None
+        return self.break_node_chains.get(from_node,to_node)
 
     def get_break_node(self,node):
-        if self.break_nodes and node in self.break_nodes:
-            return self.break_nodes[node]
-        return None
+        if self.break_nodes is None:
+            return None
+        return self.break_nodes.get(node)
+
+    def add_loads(self,odpairs,time_matrix,travel_times,workers=1):
+        """add more loads to an already built network, without building
+        it all again.
+
+        odpairs is the same sort of frame the Demand was made from,
+        time_matrix is the map space travel time matrix, and
+        travel_times is the solver space matrix that goes with this
+        Demand (DataFrame, SolverMatrix or SparseSolverMatrix, break
+        expanded or not).  The new loads get demand labels after the
+        existing ones, and are checked for feasibility the same way.
+        The feasible ones get origin and destination ids after the
+        last node of travel_times, and if the network has break nodes,
+        their links get break nodes numbered after that.  Only arcs
+        touching the new nodes get added.
+
+        returns (travel_times with the new nodes and arcs,
+                 demand labels of the new loads)
+
+        """
+        start = 0
+        if len(self.demand.index) > 0:
+            start = int(self.demand.index.max()) + 1
+        demand = odpairs.copy()
+        demand.index = pd.RangeIndex(start,start+len(demand.index))
+        demand['pickup_time'] = self.pickup_time
+        demand['dropoff_time'] = self.dropoff_time
+        (long_break,short_break) = self.break_rules()
+        demand = demand.join(self.check_feasible(time_matrix,
+                                                 long_break,short_break,demand))
+        feasible_index = demand.feasible
+        num = int(feasible_index.sum())
+        first = len(travel_times.index)
+        demand['origin'] = -1
+        demand['destination'] = -1
+        demand.loc[feasible_index,'origin'] = range(first,first+num)
+        demand.loc[feasible_index,'destination'] = range(first+num,first+2*num)
+        if 'load_number' in self.demand.columns:
+            demand['load_number'] = demand.index
+
+        old = self.demand.loc[self.demand.feasible,:]
+        new = demand.loc[feasible_index,:]
+        self.demand = pd.concat([self.demand,demand])
+        (origins,destinations) = self.lookup_frames(new)
+        self.origins = pd.concat([self.origins,origins])
+        self.destinations = pd.concat([self.destinations,destinations])
+        self.equivalence = pd.concat([self.equivalence,origins,destinations])
+        self._node_table = None
+        self._node_columns = None
+        if num == 0:
+            return (travel_times,list(demand.index))
+
+        travel_times = breaks.aggregate_split_nodes(travel_times,
+                                                    new_load_arcs(time_matrix,old,new))
+        if self.break_node_chains is not None:
+            # same links insert_nodes_for_breaks would make, but only
+            # the ones that touch the new loads
+            legs = []
+            for idx in new.index:
+                legs.extend(breaks.record_legs(new.loc[idx],travel_times))
+            legs.extend(self.destination_origin_legs(travel_times,new,
+                                                     self.demand.loc[self.demand.feasible,:]))
+            legs.extend(self.destination_origin_legs(travel_times,old,new))
+            travel_times = self.expand_break_legs(travel_times,legs,
+                                                  len(travel_times.index),workers)
+        return (travel_times,list(demand.index))
+
+    def retire_loads(self,labels,travel_times):
+        """take loads (demand labels) out of an already built network.
+
+        The loads stop being feasible (the constraint column says they
+        were retired), and their origin and destination drop out of the
+        lookups.  Break nodes on any link into or out of those nodes
+        come out of the break node registry and the chains.  All of
+        those nodes are listed in retired_nodes and show up as
+        NODE_RETIRED in the node table.  Node ids are never reused, so
+        the rest of the network keeps its numbering.
+
+        returns travel_times with every arc touching a retired node
+        dropped
+
+        """
+        rows = self.demand.loc[labels,:]
+        rows = rows.loc[rows.feasible,:]
+        nodes = np.concatenate((rows.origin.values,rows.destination.values)).astype(int)
+        self.demand.loc[rows.index,'feasible'] = False
+        self.demand.loc[rows.index,'constraint'] = 'Load retired'
+        self.origins = self.origins.drop(rows.origin.values)
+        self.destinations = self.destinations.drop(rows.destination.values)
+        self.equivalence = self.equivalence.drop(nodes)
+        if self.break_node_chains is not None:
+            (self.break_node_chains,dropped) = self.break_node_chains.without_endpoints(nodes)
+            self.break_nodes.remove(dropped)
+            nodes = np.concatenate((nodes,dropped))
+        self.retired_nodes = np.union1d(self.retired_nodes,nodes).astype(int)
+        self._node_table = None
+        self._node_columns = None
+        return without_nodes(travel_times,nodes)
 
     def break_constraint(self,
                          origin,destination,
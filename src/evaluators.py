@@ -6,20 +6,58 @@ import os
 import pandas as pd
 from multiprocessing import Pool
 import itertools as iter
+import copy
+from collections import OrderedDict
+import solver_matrix as SM
+import demand as D
+import breaks
+
+# how many node subsets each sparse EvaluatorBundle keeps around
+SUBSET_CACHE_SIZE = 4
+
+def matrix_arrays(matrix):
+    """return (node index, values, mask of allowed arcs) for either a
+    pivoted DataFrame (NaN is no arc) or a SolverMatrix
+
+    """
+    if isinstance(matrix,SM.SolverMatrix):
+        return (matrix.index,matrix.times,matrix.allowed())
+    return (matrix.index,matrix.values,matrix.notna().values)
+
+def arc_penalty(max_time,num_nodes,horizon=None):
+    """the cost of an arc that does not exist.
+
+    It has to beat any route that fits inside the horizon, so it is at
+    least horizon + 1.  And a route through every node, all of it on
+    penalty arcs, has to add up to less than half of int64, so that
+    cumul and cost sums inside the solver cannot overflow.  In between
+    those two, it is the same 10000000 * max_time it has always been.
+
+    """
+    ceiling = (np.iinfo(np.int64).max // 2) // (num_nodes + 1)
+    penalty = min(int(10000000 * max_time),ceiling)
+    if horizon is not None:
+        penalty = max(penalty,int(horizon) + 1)
+    assert penalty <= ceiling
+    return penalty
+
+def demand_vector(size,demand):
+    """+1 at pickups, -1 at dropoffs, 0 everywhere else (depot and
+    break nodes), as int8 indexed by node
+
+    """
+    _demand = np.zeros(size,dtype=np.int8)
+    table = demand.node_table[:size]
+    _demand[:len(table)] = table['demand']
+    return _demand
 
 def create_demand_callback(nodes,demand):
     """ create a callback function for demand """
-    _demand = {}
-    for idx in range(0,len(nodes)):
-        node = nodes[idx]
-        _demand[idx] = demand.get_demand(node)
-    print('size of demand matrix is ',len(_demand))
+    _demand = memoryview(demand_vector(len(nodes),demand))
     def demand_callback(manager, index):
         """Returns the demand at the index, if defined, or zero."""
         # Convert from routing variable Index to demand array Node.
         node = manager.IndexToNode(index)
-        # print('demand callback with',node)
-        # print('demand callback with',node,_demand[node])
         return _demand[node]
 
 
@@ -27,13 +65,16 @@ def create_demand_callback(nodes,demand):
     return demand_callback
 
 def lookup_function_generator(_total_time):
+    # a memoryview over the int64 array hands back python ints
+    # directly, with no copy and no int() per call
+    _total_time = memoryview(np.ascontiguousarray(_total_time,dtype=np.int64))
     def lookup_function(manager,from_index,to_index):
         """Returns the travel time between the two nodes."""
         # Convert from routing variable Index to distance matrix NodeIndex.
         from_node = manager.IndexToNode(from_index)
         to_node = manager.IndexToNode(to_index)
-        # print('drive time',from_node,to_node,_total_time[from_node][to_node])
-        return int(_total_time[from_node][to_node])
+        # print('drive time',from_node,to_node,_total_time[from_node,to_node])
+        return _total_time[from_node,to_node]
 
     # return the callback, which will need to be set up with partial
     return lookup_function
@@ -57,15 +98,140 @@ def lookup_function_generator(_total_time):
 
 
 
+def sparse_lookup_function_generator(matrix,_total_time,penalty):
+    """like lookup_function_generator, but for a SparseSolverMatrix.
+    _total_time lines up with matrix.neighbors, and arcs that are
+    not stored cost penalty
+
+    """
+    _total_time = memoryview(np.ascontiguousarray(_total_time,dtype=np.int64))
+    penalty = int(penalty)
+    def lookup_function(manager,from_index,to_index):
+        """Returns the travel time between the two nodes."""
+        from_node = manager.IndexToNode(from_index)
+        to_node = manager.IndexToNode(to_index)
+        pos = matrix.arc_position(from_node,to_node)
+        if pos < 0:
+            return penalty
+        return _total_time[pos]
+
+    return lookup_function
+
+def node_table_columns(nodes,demand):
+    """the demand node table rows for nodes (0 to len(nodes)-1), and
+    how many of them there are"""
+    table = demand.node_table[:len(nodes)]
+    return (table,len(table))
+
+def time_service_vector(nodes,demand):
+    """service time at each node, used when leaving it.  Break nodes
+    take their break time as service time
+
+    """
+    service = np.zeros(len(nodes))
+    (table,n) = node_table_columns(nodes,demand)
+    # break nodes have no service_time, everything else no break_time
+    service[:n] = table['service_time'] + table['break_time']
+    return service
+
+def drive_service_vector(nodes,demand,break_time):
+    """drive time restored when leaving each node"""
+    service = np.zeros(len(nodes))
+    (table,n) = node_table_columns(nodes,demand)
+    # drive callback only wants to know breaks of 600
+    is_break = (table['kind'] == D.NODE_BREAK) & (table['break_time'] >= break_time)
+    service[:n] = np.where(is_break,table['drive_restore'],0)
+    return service
+
+def short_break_service_vector(nodes,demand,period,break_time):
+    """short break (8hr) drive time restored when leaving each node"""
+    service = np.zeros(len(nodes))
+    (table,n) = node_table_columns(nodes,demand)
+    # short break callback gets benefits from both short and long breaks
+    is_break = (table['kind'] == D.NODE_BREAK) & (table['break_time'] >= break_time)
+    restore = table['drive_restore']
+    # after trying a few things, it is never true that a long break
+    # happens without a preceding short break.  Therefore, if this is
+    # a long break, an earlier short break already pushed the clock
+    # back on the counter by period (480), so here I only want to
+    # push it back the rest of the way (3 hours, to get it aligned
+    # with the 11 hr long break timing)
+    restore = np.where(restore < -period,restore + period,restore)
+    service[:n] = np.where(is_break,restore,0)
+    return service
+
+def sparse_total_time(service,matrix,horizon=None):
+    """like gen_total_time, but for the arcs of a SparseSolverMatrix"""
+    origins = matrix.arc_origins()
+    # no service time on the self loops
+    _total_time = (matrix.times + service[origins] * (origins != matrix.neighbors)).astype(np.int64)
+    penalty_time = arc_penalty(matrix.max_time(),len(matrix),horizon)
+    return (_total_time,penalty_time)
+
+def service_lookup_function(service,travel_minutes_matrix,horizon=None):
+    """add the per (from) node service vector to the travel times, and
+    make the lookup function
+
+    """
+    if isinstance(travel_minutes_matrix,SM.SparseSolverMatrix):
+        (_total_time,penalty) = sparse_total_time(service,travel_minutes_matrix,horizon)
+        return sparse_lookup_function_generator(travel_minutes_matrix,
+                                                _total_time,penalty)
+    return lookup_function_generator(service_total_time(service,travel_minutes_matrix,horizon))
+
+def service_total_time(service,travel_minutes_matrix,horizon=None):
+    """the dense total time array: travel time plus the service time of
+    the from node, penalty for arcs that do not exist
+
+    Same as filling a service time matrix and calling gen_total_time,
+    but done in place on one array
+
+    """
+    (tmm_index,values,allowed) = matrix_arrays(travel_minutes_matrix)
+    penalty_time = arc_penalty(values[allowed].max(),len(values),horizon)
+    return dense_total_time(service,values,~allowed,penalty_time)
+
+def dense_total_time(service,values,forbidden,penalty_time):
+    """service_total_time, once the mask and penalty are known.
+    returns int64, truncated like int()
+
+    """
+    # service time is determined by from node, broadcast across each
+    # row.  No service time on the self loops
+    _total_time = np.add(values,np.asarray(service,dtype=float)[:,np.newaxis])
+    diagonal = np.arange(len(values))
+    _total_time[diagonal,diagonal] = values[diagonal,diagonal]
+    # zero first, so the cast never sees a NaN
+    _total_time[forbidden] = 0
+    _total_time = _total_time.astype(np.int64)
+    _total_time[forbidden] = penalty_time
+    return _total_time
+
+def transit_matrix(_total_time):
+    """the total time array as the list of lists of ints that
+    routing.RegisterTransitMatrix wants
+
+    """
+    return np.asarray(_total_time,dtype=np.int64).tolist()
+
+
 def create_dist_callback(dist_matrix,
                          demand):
     """ create a callback function for dist """
     # dist matrix is now in model space, not map space
     # preprocess travel and service dist to speed up solver
+    # distances are not limited by the horizon, so only the overflow
+    # cap applies to the penalty
+    if isinstance(dist_matrix,SM.SparseSolverMatrix):
+        penalty_dist = arc_penalty(dist_matrix.max_time(),len(dist_matrix))
+        return sparse_lookup_function_generator(dist_matrix,
+                                                dist_matrix.times,
+                                                penalty_dist)
 
-    max_dist = dist_matrix.max().max()
-    penalty_dist =  int(10000000 * max_dist)
-    _total_dist = dist_matrix.fillna(penalty_dist).values
+    (index,values,allowed) = matrix_arrays(dist_matrix)
+    penalty_dist = arc_penalty(values[allowed].max(),len(values))
+    _total_dist = np.where(allowed,values,0).astype(np.int64)
+    _total_dist[~allowed] = penalty_dist
 
     return lookup_function_generator(_total_dist)
 
@@ -81,30 +247,24 @@ def create_time_callback2(travel_minutes_matrix,
 
     """
     # preprocess travel and service time to speed up solver
-    size = len(travel_minutes_matrix)
+    service = time_service_vector(travel_minutes_matrix.index,demand)
+    return service_lookup_function(service,travel_minutes_matrix,demand.horizon)
 
-    service_time = np.zeros((size,size))
-    notna = travel_minutes_matrix.notna()
-    tmm_index = travel_minutes_matrix.index
-    # service time is determined by from node
-    for o_idx in tmm_index:
-        o_sv = demand.get_service_time(o_idx)
-        o_bk = demand.get_break_node(o_idx)
-        if o_bk:
-            o_sv = o_bk.break_time
-        for d_idx in tmm_index[notna.loc[o_idx,:]]:
-            if o_idx != d_idx:
-                service_time[o_idx,d_idx] = o_sv
-
-    _total_time = gen_total_time(service_time,travel_minutes_matrix)
-    return lookup_function_generator(_total_time)
-
-
-def gen_total_time(service,times):
-    max_time = times.max().max()
-    penalty_time =  int(10000000 * max_time)
-    df_service_time = pd.DataFrame(service)
-    _total_time = (df_service_time + times).fillna(penalty_time).values
+def create_time_matrix2(travel_minutes_matrix,
+                        demand):
+    """same values as create_time_callback2, as a transit matrix"""
+    service = time_service_vector(travel_minutes_matrix.index,demand)
+    return transit_matrix(service_total_time(service,travel_minutes_matrix,
+                                             demand.horizon))
+
+
+def gen_total_time(service,times,horizon=None):
+    """service plus travel times as int64 (truncated like int()),
+    penalty for arcs that do not exist"""
+    (index,values,allowed) = matrix_arrays(times)
+    penalty_time = arc_penalty(values[allowed].max(),len(values),horizon)
+    _total_time = np.where(allowed,service + values,0).astype(np.int64)
+    _total_time[~allowed] = penalty_time
     return _total_time
 
 def create_drive_callback(travel_minutes_matrix,
@@ -119,33 +279,18 @@ def create_drive_callback(travel_minutes_matrix,
 
     """
     # preprocess travel and service time to speed up solver
-
-    #node_list = [(n,demand,period,break_time) for n in travel_minutes_matrix.index]
-    # print('len node list is ',len(node_list))
-    #ncpus = 3#len(os.sched_getaffinity(0))
-    #p = Pool(ncpus)
-    #node_demand_service_list = p.map(make_drive_data,node_list)
-    # print(node_demand_service_list)
-
-    size = len(travel_minutes_matrix)
-    service_time = np.zeros((size,size))
-    notna = travel_minutes_matrix.notna()
-    tmm_index = travel_minutes_matrix.index
     # service time is determined by from node
-    for o_idx in tmm_index:
-        o_sv = 0
-        o_bk = demand.get_break_node(o_idx)
-        if o_bk:
-            # drive callback only wants to know breaks of 600
-            if o_bk.break_time >= break_time:
-                o_sv = o_bk.drive_time_restore()
-        # again, from node is important
-        for d_idx in tmm_index[notna.loc[o_idx,:]]:
-            if o_idx != d_idx:
-                service_time[o_idx,d_idx] = o_sv
-
-    _total_time = gen_total_time(service_time,travel_minutes_matrix)
-    return lookup_function_generator(_total_time)
+    service = drive_service_vector(travel_minutes_matrix.index,demand,break_time)
+    return service_lookup_function(service,travel_minutes_matrix,demand.horizon)
+
+def create_drive_matrix(travel_minutes_matrix,
+                        demand,
+                        period,
+                        break_time):
+    """same values as create_drive_callback, as a transit matrix"""
+    service = drive_service_vector(travel_minutes_matrix.index,demand,break_time)
+    return transit_matrix(service_total_time(service,travel_minutes_matrix,
+                                             demand.horizon))
 
 
 def create_short_break_callback(travel_minutes_matrix,
@@ -162,38 +307,301 @@ def create_short_break_callback(travel_minutes_matrix,
     if period < 0:
         period = period * -1
     # preprocess travel and service time to speed up solver
-    size = len(travel_minutes_matrix)
-    service_time = np.zeros((size,size))
-    notna = travel_minutes_matrix.notna()
-    tmm_index = travel_minutes_matrix.index
-
     # service time is determined by from node
-    for o_idx in tmm_index:
-        o_sv = 0
-        value = 0
-        o_bk = demand.get_break_node(o_idx)
-        if o_bk:
-            # short break callback gets benefits from both short and long breaks
-            if o_bk.break_time >= break_time:
-                o_sv = o_bk.drive_time_restore()
-                value = o_sv
-                if o_sv < -period:
-                    # after trying a few things, it is never true that
-                    # a long break happens without a preceding short
-                    # break.  Therefore, if this is a long break, an
-                    # earlier short break already pushed the clock
-                    # back on the counter by 480, so here I only want
-                    # to push it back another 3 hours (to get it
-                    # aligned with the 11 hr long break timing
-                    value = -3*60 # same as o_sv - (-period)
-
-        # bail out if just going to assign 0
-        if o_sv != 0:
-            # again, from node is important, but here have to consider if
-            # moving from break to break
-            for d_idx in tmm_index[notna.loc[o_idx,:]]:
-                if o_idx != d_idx:
-                    service_time[o_idx,d_idx] = value
-
-    _total_time = gen_total_time(service_time,travel_minutes_matrix)
-    return lookup_function_generator(_total_time)
+    service = short_break_service_vector(travel_minutes_matrix.index,demand,
+                                         period,break_time)
+    return service_lookup_function(service,travel_minutes_matrix,demand.horizon)
+
+def create_short_break_matrix(travel_minutes_matrix,
+                              demand,
+                              period,
+                              break_time):
+    """same values as create_short_break_callback, as a transit matrix"""
+    if period < 0:
+        period = period * -1
+    service = short_break_service_vector(travel_minutes_matrix.index,demand,
+                                         period,break_time)
+    return transit_matrix(service_total_time(service,travel_minutes_matrix,
+                                             demand.horizon))
+
+def service_vectors(size,demand):
+    """the time, drive and short break service vectors, with the break
+    rules from the breaks module.  These are what the bundle's
+    callbacks and matrices use
+
+    """
+    nodes = range(size)
+    return (time_service_vector(nodes,demand),
+            drive_service_vector(nodes,demand,breaks.long_break_time),
+            short_break_service_vector(nodes,demand,
+                                       breaks.short_break_interval,
+                                       breaks.short_break_time))
+
+class EvaluatorBundle():
+    """
+    Everything the routing model looks up per arc or per node, built
+    once from the expanded network.
+
+    The travel and distance matrices are kept as SolverMatrix (or
+    SparseSolverMatrix), so the bundle can stand in for them in
+    initial route generation and solution output (anything that does
+    .loc[from,to]).  The time, drive and short break arrays are the
+    same numbers the create_*_callback functions use (int64, see
+    arc_penalty), with the missing-arc mask and penalty worked out once
+    for all three.
+
+    set_vehicle_classes() adds time, drive and short break arrays for
+    vehicles that are slower or faster than the speed the network was
+    built at, stacked along a new first axis (one slice per class).
+    Pass vehicle_class to the callback and matrix methods to get at
+    them.
+
+    subset(nodes) hands back a bundle for the arcs between those nodes
+    only, picked out of these arrays rather than rebuilt.
+
+    """
+
+    def __init__(self,travel_minutes_matrix,demand,dist_matrix=None):
+        self.travel = self._convert(travel_minutes_matrix)
+        self.distance = None
+        if dist_matrix is not None:
+            self.distance = self._convert(dist_matrix)
+        self.loc = self.travel.loc
+        self.index = self.travel.index
+        self.demand_source = demand
+        size = len(self.travel)
+
+        self.demand = demand_vector(size,demand)
+        self.services = service_vectors(size,demand)
+        self.penalty = arc_penalty(self.travel.max_time(),size,
+                                   demand.horizon)
+        (self.time,self.drive,self.short_break) = self._total_times(self.travel.times)
+
+        self.class_factors = None
+        self.class_time = None
+        self.class_drive = None
+        self.class_short_break = None
+        self._subsets = OrderedDict()
+        self._costs = {}
+
+    @staticmethod
+    def _convert(matrix):
+        if isinstance(matrix,SM.SparseSolverMatrix):
+            return matrix
+        return SM.as_solver_matrix(matrix)
+
+    def __len__(self):
+        return len(self.travel)
+
+    def sparse(self):
+        return isinstance(self.travel,SM.SparseSolverMatrix)
+
+    def _total_times(self,travel_times):
+        """the time, drive and short break arrays, for travel minutes
+        laid out like self.travel.times"""
+        if self.sparse():
+            origins = self.travel.arc_origins()
+            # no service time on the self loops
+            not_loop = origins != self.travel.neighbors
+            return [(travel_times + service[origins] * not_loop).astype(np.int64)
+                    for service in self.services]
+        forbidden = ~self.travel.allowed()
+        return [dense_total_time(service,travel_times,forbidden,self.penalty)
+                for service in self.services]
+
+    def set_vehicle_classes(self,factors):
+        """one travel time multiplier per vehicle class.  1.0 is the
+        speed the network was built at, 0.8 is a truck that needs 20%
+        less time on every arc.  Service and break times are the same
+        for every class.  Break nodes are spaced for the network
+        speed, so classes should not be slower than that (see
+        vehicles.parse_vehicle_classes).
+
+        """
+        factors = tuple(float(factor) for factor in factors)
+        if factors == self.class_factors:
+            return
+        stacked = ([],[],[])
+        for factor in factors:
+            if factor == 1:
+                arrays = (self.time,self.drive,self.short_break)
+            else:
+                arrays = self._total_times(np.floor(self.travel.times * factor))
+            for (stack,values) in zip(stacked,arrays):
+                stack.append(values)
+        (self.class_time,self.class_drive,self.class_short_break) = [
+            np.stack(stack) for stack in stacked]
+        if not self.sparse():
+            allowed = self.travel.allowed()
+            assert self.class_time[:,allowed].max(initial=0) < self.penalty
+        self.class_factors = factors
+        self._costs = {}
+
+    def _arrays(self,vehicle_class=None):
+        """(time, drive, short break) for a vehicle class, or for the
+        network speed if vehicle_class is None"""
+        if vehicle_class is None:
+            return (self.time,self.drive,self.short_break)
+        return (self.class_time[vehicle_class],
+                self.class_drive[vehicle_class],
+                self.class_short_break[vehicle_class])
+
+    def _lookup_function(self,_total_time):
+        if self.sparse():
+            return sparse_lookup_function_generator(self.travel,_total_time,self.penalty)
+        return lookup_function_generator(_total_time)
+
+    def time_callback(self,vehicle_class=None):
+        """same as create_time_callback2"""
+        return self._lookup_function(self._arrays(vehicle_class)[0])
+
+    def drive_callback(self,vehicle_class=None):
+        """same as create_drive_callback(..., breaks.long_break_interval,
+        breaks.long_break_time)"""
+        return self._lookup_function(self._arrays(vehicle_class)[1])
+
+    def short_break_callback(self,vehicle_class=None):
+        """same as create_short_break_callback(...,
+        breaks.short_break_interval, breaks.short_break_time)"""
+        return self._lookup_function(self._arrays(vehicle_class)[2])
+
+    def dist_callback(self):
+        """same as create_dist_callback"""
+        return create_dist_callback(self.distance,None)
+
+    def demand_callback(self):
+        """same as create_demand_callback"""
+        _demand = memoryview(self.demand)
+        def demand_callback(manager, index):
+            """Returns the demand at the index, if defined, or zero."""
+            return _demand[manager.IndexToNode(index)]
+        return demand_callback
+
+    def demand_values(self):
+        """the demand vector as the list of ints that
+        routing.RegisterUnaryTransitVector wants"""
+        return self.demand.tolist()
+
+    def time_matrix(self,vehicle_class=None):
+        return transit_matrix(self._arrays(vehicle_class)[0])
+
+    def drive_matrix(self,vehicle_class=None):
+        return transit_matrix(self._arrays(vehicle_class)[1])
+
+    def short_break_matrix(self,vehicle_class=None):
+        return transit_matrix(self._arrays(vehicle_class)[2])
+
+    def arc_cost(self,time_weight=1,distance_weight=0,vehicle_class=None):
+        """time (with service time, same as self.time) and distance
+        weighted into one int64 arc cost array, laid out like
+        self.time, and the penalty for arcs that do not exist.
+        Rounded to whole units, and cached per weights and class.
+
+        """
+        key = (time_weight,distance_weight,vehicle_class)
+        if key in self._costs:
+            return self._costs[key]
+        if distance_weight:
+            assert self.distance is not None, 'a distance weight needs the distance matrix'
+        time = self._arrays(vehicle_class)[0]
+        if self.sparse():
+            allowed = np.ones(len(time),dtype=bool)
+            distance = 0
+            if distance_weight:
+                assert np.array_equal(self.distance.offsets,self.travel.offsets)
+                distance = self.distance.times
+        else:
+            allowed = self.travel.allowed()
+            distance = 0
+            if distance_weight:
+                allowed = allowed & self.distance.allowed()
+                distance = np.where(allowed,self.distance.times,0)
+        cost = np.rint(time_weight * np.where(allowed,time,0)
+                       + distance_weight * distance).astype(np.int64)
+        max_cost = cost[allowed].max() if allowed.any() else 0
+        penalty = arc_penalty(max_cost,len(self))
+        cost[~allowed] = penalty
+        self._costs[key] = (cost,penalty)
+        return self._costs[key]
+
+    def cost_callback(self,time_weight=1,distance_weight=0,vehicle_class=None):
+        (cost,penalty) = self.arc_cost(time_weight,distance_weight,vehicle_class)
+        if self.sparse():
+            return sparse_lookup_function_generator(self.travel,cost,penalty)
+        return lookup_function_generator(cost)
+
+    def cost_matrix(self,time_weight=1,distance_weight=0,vehicle_class=None):
+        return transit_matrix(self.arc_cost(time_weight,distance_weight,vehicle_class)[0])
+
+    def subset(self,nodes):
+        """the bundle for just the arcs between nodes, same as building
+        one from travel.subset(nodes), except that missing arcs keep
+        this bundle's penalty.
+
+        The subset is always a sparse bundle that holds only the arcs
+        between nodes, picked out of this bundle's arrays, so a sub-run
+        on a few nodes never costs a copy of the whole dense network.
+        Subsets of a sparse network are cached by node set (the last
+        few); subsets of a dense network are not, since the per load
+        runs never ask for the same node set twice.
+
+        """
+        nodes = np.unique(np.asarray(nodes,dtype=int))
+        key = None
+        if self.sparse():
+            key = nodes.tobytes()
+            if key in self._subsets:
+                self._subsets.move_to_end(key)
+                return self._subsets[key]
+        bundle = copy.copy(self)
+        bundle._subsets = OrderedDict()
+        bundle._costs = {}
+        names = ['time','drive','short_break']
+        if self.class_factors is not None:
+            names.extend(['class_time','class_drive','class_short_break'])
+        if self.sparse():
+            keep = np.zeros(len(self),dtype=bool)
+            keep[nodes] = True
+            origins = self.travel.arc_origins()
+            arcs = np.flatnonzero(keep[origins] & keep[self.travel.neighbors])
+            (x,y) = (origins[arcs],self.travel.neighbors[arcs])
+            times = self.travel.times[arcs]
+            pick = lambda values: values[...,arcs]
+        else:
+            # only the nodes by nodes block gets looked at.  nodes is
+            # sorted, so the arcs come out sorted by (x, y)
+            (rows,cols) = np.nonzero(self.travel.allowed()[np.ix_(nodes,nodes)])
+            (x,y) = (nodes[rows],nodes[cols])
+            times = self.travel.times[x,y]
+            pick = lambda values: values[...,x,y]
+        offsets = np.zeros(len(self)+1,dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(x,minlength=len(self)))
+        bundle.travel = SM.SparseSolverMatrix(offsets,y,times)
+        for name in names:
+            setattr(bundle,name,pick(getattr(self,name)))
+        if self.distance is not None:
+            # same arcs as travel, so arc_cost can line them up
+            bundle.distance = SM.SparseSolverMatrix(offsets,y,
+                                                    pick(self.distance.times))
+        bundle.loc = bundle.travel.loc
+        bundle.index = bundle.travel.index
+        if key is not None:
+            self._subsets[key] = bundle
+            if len(self._subsets) > SUBSET_CACHE_SIZE:
+                self._subsets.popitem(last=False)
+        return bundle
+
+def network_evaluators(travel_minutes_matrix,demand,dist_matrix=None):
+    """the EvaluatorBundle for an expanded network, cached on the matrix
+    object itself, so every model run on the same network (and demand)
+    shares one.  DataFrames do not get the cache.
+
+    """
+    bundle = getattr(travel_minutes_matrix,'evaluators',None)
+    if bundle is None or bundle.demand_source is not demand:
+        bundle = EvaluatorBundle(travel_minutes_matrix,demand,dist_matrix)
+        if isinstance(travel_minutes_matrix,(SM.SolverMatrix,SM.SparseSolverMatrix)):
+            travel_minutes_matrix.evaluators = bundle
+    elif dist_matrix is not None and bundle.distance is None:
+        bundle.distance = bundle._convert(dist_matrix)
+    return bundle
@@ -186,12 +186,11 @@ def initial_routes_2(d,v,t):
                         'short_time': 0
         }
 
-        # debugging
-        break_list.append(0)
-        break_list.append(record.origin)
-        break_list.append(record.destination)
-        print(break_list)
-        print(t.loc[break_list,break_list])
+        # debugging.  break_list is a view of the stored chain, so
+        # copy it rather than append to it
+        debug_nodes = break_list.tolist() + [0,record.origin,record.destination]
+        print(debug_nodes)
+        print(t.loc[debug_nodes,debug_nodes])
 
         reached = move_along(d,t,accumulators,od)
         while reached:
@@ -205,6 +204,49 @@ def initial_routes_2(d,v,t):
         veh += 1
     return trip_chains
 
+def route_with_breaks(d,t,route):
+    """thread break nodes into a route that has none.
+
+    route is the pickups and dropoffs of one vehicle in order, depot
+    left off both ends, as they come out of the no breaks model.  Each
+    link (depot to first node, node to node, last node to depot) is
+    walked the same way initial_routes_2 walks the links of a single
+    load: straight to the next node if the drive limits allow,
+    otherwise on to the next break in that link's chain.  The
+    accumulators carry over from link to link.
+
+    returns the route with the break nodes in it, or None if some link
+    would need a break but has no (or not enough) break nodes
+
+    """
+    od = {'prior': 0,
+          'prior_break': None}
+    accumulators = {'travel_time': 0,
+                    'long_time': 0,
+                    'short_time': 0
+    }
+    trip_chain = []
+    for goal in list(route) + [0]:
+        break_list = d.get_break_node_chain(od['prior'],goal)
+        if break_list is None:
+            break_list = []
+        od['goal'] = goal
+        od['breaks'] = [d.get_break_node(bk) for bk in break_list]
+        od['break_index'] = 0
+        try:
+            reached = decide_next(d,t,accumulators,od)
+            while reached != goal:
+                trip_chain.append(reached)
+                od['prior'] = reached
+                reached = decide_next(d,t,accumulators,od)
+        except IndexError:
+            # ran off the end of the chain
+            return None
+        if goal != 0:
+            trip_chain.append(goal)
+        od['prior'] = goal
+    return trip_chain
+
 
 
 
@@ -0,0 +1,121 @@
+"""Binary (.npy) map space distance matrix, read through a memory map"""
+import numpy as np
+import pandas as pd
+
+class _Locator():
+    """scalar .loc[row,col] lookups, same as on the CSV DataFrame"""
+    def __init__(self,matrix):
+        self.matrix = matrix
+
+    def __getitem__(self,key):
+        (row,col) = key
+        return self.matrix.get(row,col)
+
+class MappedMatrix():
+    """
+    Map space distances (or times) backed by a read-only memory map.
+
+    Nothing is read from disk until a row or block is asked for, and
+    only the pages holding those entries get pulled in.  travel_time()
+    does not copy the matrix either, it just remembers the divisor and
+    applies it to whatever gets read out.  Map node ids run 0 to N-1,
+    the same as the RangeIndex of the headerless CSV.
+
+    """
+
+    def __init__(self,values,divisors=()):
+        assert values.ndim == 2 and values.shape[0] == values.shape[1]
+        self.values = values
+        self.divisors = tuple(divisors)
+        self.loc = _Locator(self)
+
+    @classmethod
+    def load(cls,filename):
+        return cls(np.load(filename,mmap_mode='r'))
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    @property
+    def index(self):
+        return pd.RangeIndex(len(self))
+
+    @property
+    def columns(self):
+        return self.index
+
+    def _scale(self,values):
+        for divisor in self.divisors:
+            values = np.floor_divide(values,divisor)
+        return values
+
+    def floordiv(self,value):
+        """same as DataFrame.floordiv, but lazy"""
+        return MappedMatrix(self.values,self.divisors + (value,))
+
+    def copy(self):
+        # read only, so nothing to copy
+        return self
+
+    def get(self,row,col):
+        return self._scale(self.values[row,col])
+
+    def row(self,node):
+        return self._scale(np.asarray(self.values[node,:]))
+
+    def _positions(self,nodes):
+        """map node ids as an int array.  A node that is not in the
+        matrix is a KeyError, same as for the CSV DataFrame, rather
+        than numpy reading the last row for -1"""
+        nodes = np.asarray(nodes,dtype=int)
+        outside = (nodes < 0) | (nodes >= len(self))
+        if outside.any():
+            raise KeyError('map nodes not in the matrix: {}'.format(np.unique(nodes[outside]).tolist()))
+        return nodes
+
+    def take(self,rows,cols):
+        """the rows by cols block, as a float array"""
+        block = self.values[np.ix_(self._positions(rows),
+                                   self._positions(cols))]
+        return np.asarray(self._scale(block),dtype=float)
+
+    def take_pairs(self,rows,cols):
+        """elementwise (row, col) entries, as a float array"""
+        values = self.values[self._positions(rows),
+                             self._positions(cols)]
+        return np.asarray(self._scale(values),dtype=float)
+
+    def to_dataframe(self):
+        """the whole thing in memory.  Only for small matrices"""
+        return pd.DataFrame(self._scale(np.asarray(self.values)))
+
+def convert_csv(csvfile,npyfile,chunksize=1000,dtype=None):
+    """one time conversion of a headerless CSV matrix to .npy
+
+    The CSV is read chunksize rows at a time and written straight into
+    the output file, so the whole matrix is never held in memory.  The
+    dtype defaults to whatever pandas makes of the first chunk.  If a
+    later chunk does not fit that exactly (a blank or a decimal in an
+    integer matrix, say), that is a ValueError rather than a quietly
+    truncated matrix; pass dtype='float64' for those files.
+
+    """
+    out = None
+    pos = 0
+    for chunk in pd.read_csv(csvfile,header=None,chunksize=chunksize):
+        if out is None:
+            size = len(chunk.columns)
+            if dtype is None:
+                dtype = chunk.values.dtype
+            out = np.lib.format.open_memmap(npyfile,mode='w+',
+                                            dtype=dtype,shape=(size,size))
+        values = chunk.values
+        if not np.array_equal(values.astype(out.dtype),values,equal_nan=True):
+            raise ValueError('{} rows {} to {} do not fit in {}, try dtype float64'.format(
+                csvfile,pos,pos+len(chunk.index)-1,out.dtype))
+        out[pos:pos+len(chunk.index),:] = values
+        pos += len(chunk.index)
+    assert out is not None and pos == out.shape[0]
+    out.flush()
+    del out
+    return npyfile
@@ -2,7 +2,12 @@ from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 import numpy as np
 from functools import partial
+from collections import namedtuple
 import evaluators as E
+import breaks
+import initial_routes as IR
+import solver_matrix as SM
+import vehicles as V
 
 def use_nodes(record,d):
     nodes = [0,record.origin,record.destination]
@@ -21,6 +26,21 @@ short_break_dimension_name = 'break'
 
 
 
+# what the solver minimizes.  Arc cost is time_weight * (travel +
+# service minutes) + distance_weight * distance, and if vehicle_cost
+# is set each vehicle used also costs its Vehicle.cost
+Objective = namedtuple('Objective',['time_weight','distance_weight','vehicle_cost'])
+
+# the default, and what it has always been: arc cost is the time dimension
+TIME_ONLY = Objective(1,0,False)
+
+def objective_from_args(args):
+    if args is None:
+        return TIME_ONLY
+    return Objective(getattr(args,'cost_per_minute',1),
+                     getattr(args,'cost_per_mile',0),
+                     getattr(args,'vehicle_cost',False))
+
 def get_route(v,assignment,routing,manager):
     index = routing.Start(v)
     initial_route = []
@@ -62,14 +82,6 @@ def setup_params(args):
 
     return parameters
 
-def unset_times(t,demand_subset):
-    t = t.copy()
-    l = len(t.index)
-    index_mask = t.index.isin(demand_subset).reshape(l,1)
-    column_mask = t.columns.isin(demand_subset)
-    m = np.multiply(index_mask,column_mask)
-    return t.where(m)
-
 
 
 def breaks_at_nodes_constraints(d,
@@ -115,7 +127,76 @@ def breaks_at_nodes_constraints(d,
         solver.AddConstraint(
             end_short < base_value+(8*60))
 
-def setup_model(d,t,v):
+def use_transit_matrix(t,transit_matrix):
+    """matrix backed transit callbacks need the dense matrix, so the
+    sparse network always gets the python callbacks"""
+    return transit_matrix and not isinstance(t,SM.SparseSolverMatrix)
+
+def register_transit(routing,manager,name,evaluators,use_matrix,stats=None,
+                     vehicle_class=None):
+    """register the time, drive or short_break evaluator from the
+    bundle, either as a matrix or as a python callback (wrapped for
+    counting if stats is given)"""
+    if vehicle_class is not None:
+        stats_name = '{}_{}'.format(name,vehicle_class)
+    else:
+        stats_name = name
+    if use_matrix:
+        if stats is not None:
+            stats.note_matrix(stats_name)
+        return routing.RegisterTransitMatrix(
+            getattr(evaluators,name+'_matrix')(vehicle_class))
+    callback = partial(getattr(evaluators,name+'_callback')(vehicle_class), manager)
+    if stats is not None:
+        callback = stats.wrap(stats_name,callback)
+    return routing.RegisterTransitCallback(callback)
+
+def register_cost(routing,manager,objective,evaluators,use_matrix,stats=None,
+                  vehicle_class=None):
+    """one precomputed int64 array holds the weighted arc cost, so it
+    is no dearer to look up than the time alone"""
+    weights = (objective.time_weight,objective.distance_weight,vehicle_class)
+    stats_name = 'cost' if vehicle_class is None else 'cost_{}'.format(vehicle_class)
+    if use_matrix:
+        if stats is not None:
+            stats.note_matrix(stats_name)
+        return routing.RegisterTransitMatrix(evaluators.cost_matrix(*weights))
+    callback = partial(evaluators.cost_callback(*weights), manager)
+    if stats is not None:
+        callback = stats.wrap(stats_name,callback)
+    return routing.RegisterTransitCallback(callback)
+
+def per_vehicle(register,v,evaluators):
+    """call register(vehicle_class) once per vehicle class, and return
+    the evaluator index for each vehicle.  With every vehicle at the
+    network speed, that is just one plain registration.
+
+    """
+    factors = V.vehicle_class_factors(v)
+    if all(factor == 1 for factor in factors):
+        return [register(None)] * len(v)
+    evaluators.set_vehicle_classes(factors)
+    indices = [register(vclass) for vclass in range(len(factors))]
+    return [indices[veh.vehicle_class] for veh in v]
+
+def add_transit_dimension(routing,indices,slack,capacity,fix_start_cumul_to_zero,name):
+    """AddDimension, or AddDimensionWithVehicleTransits if the vehicles
+    do not all share one evaluator"""
+    if len(set(indices)) == 1:
+        routing.AddDimension(indices[0],slack,capacity,fix_start_cumul_to_zero,name)
+    else:
+        routing.AddDimensionWithVehicleTransits(indices,slack,capacity,
+                                                fix_start_cumul_to_zero,name)
+
+def set_arc_costs(routing,indices,v):
+    if len(set(indices)) == 1:
+        routing.SetArcCostEvaluatorOfAllVehicles(indices[0])
+    else:
+        for (veh,index) in zip(v,indices):
+            routing.SetArcCostEvaluatorOfVehicle(index,veh.index)
+
+def setup_model(d,t,v,transit_matrix=False,evaluators=None,stats=None,
+                objective=TIME_ONLY):
     # common to both with and without breaks
     num_nodes = len(t.index)
     manager = pywrapcp.RoutingIndexManager(
@@ -127,14 +208,31 @@ def setup_model(d,t,v):
     model_parameters.max_callback_cache_size = 2 * num_nodes * num_nodes
     routing = pywrapcp.RoutingModel(manager, model_parameters)
 
-    time_callback = E.create_time_callback2(t, d)
-    demand_callback = E.create_demand_callback(t.index,d)
+    if evaluators is None:
+        evaluators = E.network_evaluators(t, d)
 
-    transit_callback_index = routing.RegisterTransitCallback(
-        partial(time_callback, manager)
-    )
+    if stats is not None:
+        stats.manager = manager
 
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+    # with a transit matrix the values are handed to the solver up
+    # front, so the search never calls back into python for travel times
+    # one evaluator per vehicle class (just the one, normally)
+    use_matrix = use_transit_matrix(t,transit_matrix)
+    transit_callback_indices = per_vehicle(
+        lambda vclass: register_transit(routing,manager,'time',evaluators,
+                                        use_matrix,stats,vclass),
+        v,evaluators)
+
+    if objective[:2] == TIME_ONLY[:2]:
+        set_arc_costs(routing,transit_callback_indices,v)
+    else:
+        set_arc_costs(routing,per_vehicle(
+            lambda vclass: register_cost(routing,manager,objective,evaluators,
+                                         use_matrix,stats,vclass),
+            v,evaluators),v)
+    if objective.vehicle_cost:
+        for veh in v:
+            routing.SetFixedCostOfVehicle(veh.cost,veh.index)
 
     # count
     routing.AddConstantDimension(
@@ -145,8 +243,9 @@ def setup_model(d,t,v):
     count_dimension = routing.GetDimensionOrDie(count_dimension_name)
 
     # time
-    routing.AddDimension(
-        transit_callback_index, # same "cost" evaluator as above
+    add_transit_dimension(
+        routing,
+        transit_callback_indices, # same "cost" evaluator as above
         # d.horizon,  # try infinite slack
         0, # try no slack
         d.horizon,  # max time is end of time horizon
@@ -156,8 +255,11 @@ def setup_model(d,t,v):
     # time_dimension.SetGlobalSpanCostCoefficient(100)
 
     # capacity/demand
-    demand_evaluator_index = routing.RegisterUnaryTransitCallback(
-        partial(demand_callback, manager))
+    # a plain vector, so the solver never calls into python for demand
+    demand_evaluator_index = routing.RegisterUnaryTransitVector(
+        evaluators.demand_values())
+    if stats is not None:
+        stats.note_matrix('demand')
     vehicle_capacities = [veh.capacity for veh in v]
     routing.AddDimensionWithVehicleCapacity(
         demand_evaluator_index,
@@ -248,30 +350,50 @@ def vehicle_time_drive_constraints(v,base_value,manager,routing):
 def model_run(d,t,v,base_value,
               demand_subset=None,
               initial_routes=None,
-              args=None):
-
-    # use demand_subset to pick out a subset of nodes
+              args=None,
+              transit_matrix=False,
+              evaluators=None,
+              stats=None,
+              objective=None,
+              fallback_routes=None):
+
+    if evaluators is None:
+        evaluators = E.network_evaluators(t, d)
+    if objective is None:
+        objective = objective_from_args(args)
+
+    # use demand_subset to pick out a subset of nodes.  The bundle
+    # masks (and caches) its arrays rather than rebuilding them
     if demand_subset != None:
-        t = unset_times(t,demand_subset)
+        evaluators = evaluators.subset(demand_subset)
+        t = evaluators.travel
     else:
         demand_subset = t.index
 
-    (num_nodes,manager,routing) = setup_model(d,t,v)
-
-    drive_callback = partial(E.create_drive_callback(t, d, 11*60, 10*60), manager)
-    drive_callback_index = routing.RegisterTransitCallback(drive_callback)
-    routing.AddDimension(
-        drive_callback_index, # same "cost" evaluator as above
+    (num_nodes,manager,routing) = setup_model(d,t,v,transit_matrix,evaluators,stats,
+                                              objective)
+
+    use_matrix = use_transit_matrix(t,transit_matrix)
+    drive_callback_indices = per_vehicle(
+        lambda vclass: register_transit(routing,manager,'drive',evaluators,
+                                        use_matrix,stats,vclass),
+        v,evaluators)
+    add_transit_dimension(
+        routing,
+        drive_callback_indices, # same "cost" evaluator as above
         0,  # No slack for drive dimension? infinite slack?
         d.horizon,  # max drive is end of drive horizon
         False, # set to zero for each vehicle
         drive_dimension_name)
     drive_dimension = routing.GetDimensionOrDie(drive_dimension_name)
 
-    short_break_callback = partial(E.create_short_break_callback(t, d, 8*60, 30), manager)
-    short_break_callback_index = routing.RegisterTransitCallback(short_break_callback)
-    routing.AddDimension(
-        short_break_callback_index, # modified "cost" evaluator as above
+    short_break_callback_indices = per_vehicle(
+        lambda vclass: register_transit(routing,manager,'short_break',evaluators,
+                                        use_matrix,stats,vclass),
+        v,evaluators)
+    add_transit_dimension(
+        routing,
+        short_break_callback_indices, # modified "cost" evaluator as above
         0,  # No slack
         d.horizon,  # max horizon is horizon
         False, # set to zero for each vehicle
@@ -307,31 +429,59 @@ def model_run(d,t,v,base_value,
 
     more_droppables = [routing.AddDisjunction([manager.NodeToIndex(c)],
                                               break_penalty) for c in breaknodes]
-    assignment = run_solver(routing,parameters,initial_routes)
+    assignment = run_solver(routing,parameters,initial_routes,stats,
+                            fallback_routes)
     return (assignment,routing,manager)
 
-def run_solver(routing,parameters,initial_routes):
+def run_solver(routing,parameters,initial_routes,stats=None,fallback_routes=None):
+    """solve, starting from initial_routes if given.  If those routes
+    do not fit the model and fallback_routes is given, start from
+    those instead.  fallback_routes can be [] to just solve from
+    scratch.  Without fallback_routes, routes that do not fit are a
+    ValueError.
+
+    """
+    if stats is not None:
+        stats.start_solve()
     if initial_routes:
         routing.CloseModelWithParameters(parameters)
         initial_solution = routing.ReadAssignmentFromRoutes(initial_routes,
                                                             True)
-        assert initial_solution
-        return routing.SolveFromAssignmentWithParameters(initial_solution, parameters)
+        if not initial_solution and fallback_routes is not None:
+            print('initial routes do not fit the model, trying the fallback')
+            return run_solver(routing,parameters,fallback_routes,stats)
+        if not initial_solution:
+            raise ValueError('initial routes do not fit the model')
+        assignment = routing.SolveFromAssignmentWithParameters(initial_solution, parameters)
     else:
-        return routing.SolveWithParameters(parameters)
+        assignment = routing.SolveWithParameters(parameters)
+    if stats is not None:
+        stats.end_solve()
+        stats.report()
+    return assignment
 
 
 
-def model_run_nobreaks(d,t,v,demand_subset=None,initial_routes=None,args=None):
+def model_run_nobreaks(d,t,v,demand_subset=None,initial_routes=None,args=None,
+                       transit_matrix=False,evaluators=None,stats=None,
+                       objective=None,fallback_routes=None):
 
-    # use demand_subset to pick out a subset of nodes
+    if evaluators is None:
+        evaluators = E.network_evaluators(t, d)
+    if objective is None:
+        objective = objective_from_args(args)
+
+    # use demand_subset to pick out a subset of nodes.  The bundle
+    # masks (and caches) its arrays rather than rebuilding them
     if demand_subset != None:
-        t = unset_times(t,demand_subset)
+        evaluators = evaluators.subset(demand_subset)
+        t = evaluators.travel
     else:
         demand_subset = t.index
 
 
-    (num_nodes,manager,routing) = setup_model(d,t,v)
+    (num_nodes,manager,routing) = setup_model(d,t,v,transit_matrix,evaluators,stats,
+                                              objective)
 
     pick_deliver_constraints(d,t,manager,routing)
     vehicle_time_constraints(v,manager,routing)
@@ -344,5 +494,155 @@ def model_run_nobreaks(d,t,v,demand_subset=None,initial_routes=None,args=None):
 
     droppable_nodes = [routing.AddDisjunction([manager.NodeToIndex(c)],
                                               penalty) for c in d.get_node_list()]
-    assignment = run_solver(routing,parameters,initial_routes)
+    assignment = run_solver(routing,parameters,initial_routes,stats,
+                            fallback_routes)
     return (assignment,routing,manager)
+
+
+def used_legs(routes):
+    """the (from, to) links a set of routes drive, depot to first node
+    and last node back to depot included"""
+    legs = []
+    for route in routes:
+        if len(route) == 0:
+            continue
+        stops = [0] + list(route) + [0]
+        legs.extend(zip(stops[:-1],stops[1:]))
+    return legs
+
+def lazy_break_run(d,t,v,base_value,args=None,max_rounds=5,
+                   transit_matrix=False,distance=None,stats=None,
+                   objective=None):
+    """solve with break nodes only on the links that the routes use,
+    rather than on every link that could ever be used.
+
+    t is the solver space matrix with no break nodes, and d must not
+    have any break nodes yet (no insert_nodes_for_breaks).  Each round:
+
+    1. solve the no breaks (hours of service relaxed) model on t,
+       starting from the last round's routes with the breaks taken out
+
+    2. make break nodes for the links those routes drive that do not
+       have a chain yet (links that can never need a break get an
+       empty one, see breaks.needs_breaks).  The first round also
+       does the depot to origin to destination to depot links of every
+       feasible load, so that any load can still be served on its own.
+       If there is nothing new, the routes are already covered, so
+       stop.
+
+    3. solve the break model on the grown network, starting from the
+       relaxed routes with break nodes threaded in (see
+       initial_routes.route_with_breaks).  If those do not fit (time
+       windows, say), start from the last round's routes instead.
+       Node ids never change as the network grows, so those always
+       fit.  The first round falls back on initial_routes_2.
+
+    While it runs, d.skip_short_legs is on, so that links that can
+    never need a break get an empty chain and count as done.  It gets
+    put back the way it was at the end, so loads added later follow
+    the caller's setting.
+
+    distance, if given, turns a solver space travel time matrix into
+    the distance matrix, for objectives that count miles.
+
+    returns (assignment,routing,manager,expanded matrix,converged) for
+    the best break model solve.  converged is False if max_rounds ran
+    out (or the break model failed) before a round came back with no
+    new links, and that gets printed too.
+
+    """
+    assert d.break_nodes is None, 'lazy_break_run needs a Demand with no break nodes yet'
+    assert max_rounds >= 1
+    skip_short_legs = d.skip_short_legs
+    d.skip_short_legs = True
+    try:
+        return lazy_break_rounds(d,t,v,base_value,args,max_rounds,
+                                 transit_matrix,distance,stats,objective)
+    finally:
+        d.skip_short_legs = skip_short_legs
+
+def lazy_break_rounds(d,t,v,base_value,args,max_rounds,
+                      transit_matrix,distance,stats,objective):
+    """the rounds of lazy_break_run"""
+    def bundle(matrix):
+        dist = None
+        if distance is not None:
+            dist = distance(matrix)
+        return E.network_evaluators(matrix,d,dist)
+
+    relaxed = bundle(t)
+    x_m = t
+    routes = None
+    best = None
+    converged = False
+    for rnd in range(max_rounds):
+        warm = None
+        if routes:
+            warm = [[n for n in route if d.get_break_node(n) is None]
+                    for route in routes]
+        (assignment,routing,manager) = model_run_nobreaks(d,t,v,None,warm,args,
+                                                          transit_matrix,
+                                                          relaxed,stats,
+                                                          objective,
+                                                          fallback_routes=[])
+        relaxed_routes = [get_route(veh.index,assignment,routing,manager)
+                          for veh in v]
+
+        links = used_legs(relaxed_routes)
+        if rnd == 0:
+            feasible_index = d.demand.feasible
+            for idx in d.demand.index[feasible_index]:
+                record = d.demand.loc[idx]
+                links.extend((o,dd) for (o,dd,tt) in breaks.record_legs(record,t))
+        legs = []
+        seen = set()
+        for (o,dd) in links:
+            o = int(o)
+            dd = int(dd)
+            if (o,dd) in seen:
+                continue
+            seen.add((o,dd))
+            if d.break_node_chains is not None and (o,dd) in d.break_node_chains:
+                continue
+            tt = t.loc[o,dd]
+            if np.isnan(tt):
+                continue
+            legs.append((o,dd,tt))
+        print('lazy breaks round',rnd,'new links:',len(legs))
+        if len(legs) == 0 and best is not None:
+            converged = True
+            break
+        if len(legs) > 0:
+            x_m = d.expand_break_legs(x_m,legs,len(x_m.index))
+        evaluators = bundle(x_m)
+
+        initial_routes = []
+        for route in relaxed_routes:
+            with_breaks = IR.route_with_breaks(d,evaluators,route)
+            if with_breaks is None:
+                with_breaks = []
+            initial_routes.append(with_breaks)
+        fallback = routes
+        if fallback is None:
+            fallback = list(IR.initial_routes_2(d,v,evaluators).values())
+        (assignment,routing,manager) = model_run(d,x_m,v,base_value,None,
+                                                 initial_routes,args,
+                                                 transit_matrix,evaluators,
+                                                 stats,objective,
+                                                 fallback_routes=fallback)
+        if not assignment:
+            print('lazy breaks round',rnd,'break model found no solution')
+            break
+        print('lazy breaks round',rnd,'solved with',len(x_m.index),
+              'nodes, objective',assignment.ObjectiveValue())
+        routes = [get_route(veh.index,assignment,routing,manager)
+                  for veh in v]
+        if best is None or assignment.ObjectiveValue() < best[0].ObjectiveValue():
+            best = (assignment,routing,manager,x_m)
+
+    if not converged:
+        print('lazy breaks did not converge: stopped after round',rnd,
+              'before a round came back with no new links')
+    if best is None:
+        return (None,None,None,x_m,converged)
+    return best + (converged,)
@@ -0,0 +1,61 @@
+"""Cache the break-expanded network on disk, keyed by its inputs
+
+Building the network (feasibility check, solver space matrix, break
+node expansion) only depends on the matrix file, the demand file, the
+speed, the horizon and how the breaks get expanded, so when those are unchanged the Demand object
+and the expanded matrix can just be read back in.
+
+"""
+import hashlib
+import os
+import pickle
+from functools import partial
+
+# bump this whenever the way the network gets built changes, so that
+# stale cache files stop matching
+CACHE_VERSION = 7
+
+def _hash_file(h,filename):
+    with open(filename,'rb') as f:
+        for chunk in iter(partial(f.read,1<<20),b''):
+            h.update(chunk)
+
+def cache_key(matrixfile,demandfile,speed,horizon,sparse=False,skip_short_legs=False):
+    """sha256 hex digest of the input file contents and the parameters"""
+    h = hashlib.sha256()
+    h.update('network_cache v{}'.format(CACHE_VERSION).encode())
+    for filename in (matrixfile,demandfile):
+        _hash_file(h,filename)
+    h.update(repr((float(speed),int(horizon),bool(sparse),bool(skip_short_legs))).encode())
+    return h.hexdigest()
+
+def cache_path(cachedir,key):
+    return os.path.join(cachedir,'network_{}.pkl'.format(key))
+
+def load(cachedir,key):
+    """return (demand, expanded matrix), or None if nothing is cached"""
+    filename = cache_path(cachedir,key)
+    if not os.path.exists(filename):
+        return None
+    with open(filename,'rb') as f:
+        cached = pickle.load(f)
+    if cached.get('version') != CACHE_VERSION:
+        return None
+    return (cached['demand'],cached['matrix'])
+
+def save(cachedir,key,demand,matrix):
+    """write the Demand object (with its break_nodes and
+    break_node_chains) and the expanded matrix.  Writes to a temp file
+    first, so a crash never leaves a half written cache entry behind.
+
+    """
+    os.makedirs(cachedir,exist_ok=True)
+    filename = cache_path(cachedir,key)
+    tmp = '{}.{}.tmp'.format(filename,os.getpid())
+    with open(tmp,'wb') as f:
+        pickle.dump({'version':CACHE_VERSION,
+                     'demand':demand,
+                     'matrix':matrix},
+                    f,protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp,filename)
+    return filename
@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 import re
 
+import map_matrix as MM
+
 
 def load_demand_from_csv(filename):
     """extract a usable data structure from a csv file
@@ -31,6 +33,21 @@ def load_matrix_from_csv(filename):
     matrix = pd.read_csv(filename,header=None)
     return matrix
 
+def load_matrix(filename):
+    """load the distance matrix from either a headerless CSV file or a
+    .npy file (see map_matrix.convert_csv).  The .npy file is memory
+    mapped, not read in.
+
+    Args:
+       filename (str): the input file.  Anything not ending in .npy is read as CSV
+
+    Returns: a pandas.DataFrame, or a map_matrix.MappedMatrix
+
+    """
+    if filename.endswith('.npy'):
+        return MM.MappedMatrix.load(filename)
+    return load_matrix_from_csv(filename)
+
 def travel_time(speed,matrix):
     """convert the distance matrix into a travel time matrix"""
     return matrix.copy().floordiv(speed)
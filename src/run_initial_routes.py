@@ -16,6 +16,8 @@ import solution_output as SO
 
 import initial_routes as IR
 import model_run as MR
+import callback_stats as CS
+import network_cache as NC
 
 def main():
     """Entry point of the program."""
@@ -23,7 +25,7 @@ def main():
     # parser.add_argument('--resume_file',type=str,dest='resumefile',
     #                     help="resume a failed solver run from this file")
     parser.add_argument('-m,--matrixfile', type=str, dest='matrixfile',
-                        help='CSV file for travel matrix (distances)')
+                        help='CSV or .npy file for travel matrix (distances).  A .npy file (see src/convert_matrix.py) is memory mapped rather than read in')
     parser.add_argument('-d,--demandfile', type=str, dest='demand',
                         help='CSV file for demand pairs (origin, dest, time windows)')
     parser.add_argument('-o,--vehicleoutput', type=str, dest='vehicle_output', default='vehicle_output.csv',
@@ -61,31 +63,100 @@ def main():
     parser.add_argument('--noroutes',type=bool,dest='noroutes',default=False,
                         help="Disable generating initial routes.  Not recommended")
 
+    parser.add_argument('--sparse', action='store_true', dest='sparse',
+                        default=False,
+                        help='Store the break-expanded network as sparse (CSR) arcs rather than a dense matrix.  Uses far less memory on large problems, at the cost of slower arc lookups')
+
+    parser.add_argument('--workers', type=int, dest='workers', default=1,
+                        help='Number of processes to use for creating the break nodes.  Default is 1')
+
+    parser.add_argument('--skip_short_leg_breaks', action='store_true', dest='skip_short_legs',
+                        default=False,
+                        help='Do not make break nodes on links that can never need a break, that is, links out of the depot shorter than the 8 hour drive limit.  Cuts the node count on regional networks')
+
+    parser.add_argument('--lazy_breaks', action='store_true', dest='lazy_breaks',
+                        default=False,
+                        help='Do not make break nodes for every link up front.  Solve without the hours of service rules first, make break nodes only for the links those routes drive (plus each load on its own), solve again with the breaks, and repeat until the routes stop needing new links (or --lazy_rounds runs out, which gets printed).  While it runs, links that can never need a break get no break nodes, same as --skip_short_leg_breaks, whether or not that is set.  --cachedir, --sparse and --workers are ignored')
+
+    parser.add_argument('--lazy_rounds', type=int, dest='lazy_rounds', default=5,
+                        help='Most rounds of --lazy_breaks.  Default is 5')
+
+    parser.add_argument('--cachedir', type=str, dest='cachedir',
+                        help='Directory for caching the break-expanded network.  If the matrix file, demand file, speed, horizon, --sparse and --skip_short_leg_breaks all match an earlier run, the network is read from here instead of being rebuilt.  Default is no caching')
+
+    parser.add_argument('--transit_matrix', action='store_true', dest='transit_matrix',
+                        default=False,
+                        help='Hand the solver precomputed transit matrices rather than python callbacks, so the search never calls back into python for arc values.  Ignored with --sparse')
+
+    parser.add_argument('--vehicle_class', type=str, nargs='+', dest='vehicle_classes',
+                        help='Vehicle classes as COUNT:SPEED, for example 20:45 60:55 with --speed 45 to get 20 vehicles at 45 mph and 60 at 55 mph.  Each class gets its own travel times, scaled from the network built at --speed, so --speed has to be the slowest class (break nodes are spaced for it).  The initial routes are still built at --speed, and may not fit the faster classes.  The counts replace -v.  Default is every vehicle at --speed')
+
+    parser.add_argument('--cost_per_minute', type=float, dest='cost_per_minute', default=1.0,
+                        help='Objective weight on each minute of travel and service time.  Default 1')
+    parser.add_argument('--cost_per_mile', type=float, dest='cost_per_mile', default=0.0,
+                        help='Objective weight on each mile driven.  Default 0, which leaves the plain travel time objective')
+    parser.add_argument('--vehicle_cost', action='store_true', dest='vehicle_cost',
+                        default=False,
+                        help="Add each vehicle's fixed cost to the objective when that vehicle gets used")
+
+    parser.add_argument('--callback_stats', type=str, dest='callback_stats',
+                        help='Count and time the python callbacks during the solve, and write a JSON summary (calls per second, python time, hottest node pairs) to this file.  Off by default')
+
     parser.add_argument('--guided_local', action='store_true', dest='guided_local',
                         default=False,
                         help='whether or not to use the guided local search metaheuristic')
     args = parser.parse_args()
 
-    print('read in distance matrix')
-    matrix = reader.load_matrix_from_csv(args.matrixfile)
-    minutes_matrix = reader.travel_time(args.speed/60,matrix)
+    cached = None
+    if args.cachedir and not args.lazy_breaks:
+        cache_key = NC.cache_key(args.matrixfile,args.demand,args.speed,
+                                 args.horizon,args.sparse,args.skip_short_legs)
+        cached = NC.load(args.cachedir,cache_key)
+
+    if cached:
+        print('read expanded network from cache')
+        (d,expanded_mm) = cached
+    else:
+        print('read in distance matrix')
+        matrix = reader.load_matrix(args.matrixfile)
+        minutes_matrix = reader.travel_time(args.speed/60,matrix)
+
+        print('read in demand data')
+        odpairs = reader.load_demand_from_csv(args.demand)
+        d = D.Demand(odpairs,minutes_matrix,args.horizon)
 
-    print('read in demand data')
-    odpairs = reader.load_demand_from_csv(args.demand)
-    d = D.Demand(odpairs,minutes_matrix,args.horizon)
+        # convert nodes to solver space from input map space
+        mm = d.generate_solver_space_matrix(minutes_matrix,args.horizon,
+                                            compact=True)
 
-    # convert nodes to solver space from input map space
-    mm = d.generate_solver_space_matrix(minutes_matrix,args.horizon)
+        # create dummy nodes for breaks.  With lazy breaks, they get
+        # made as the routes need them
+        expanded_mm = mm
+        if not args.lazy_breaks:
+            expanded_mm = d.insert_nodes_for_breaks(mm,sparse=args.sparse,
+                                                     workers=args.workers,
+                                                     skip_short_legs=args.skip_short_legs)
 
-    # create dummy nodes for breaks
-    expanded_mm = d.insert_nodes_for_breaks(mm)
+        if args.cachedir and not args.lazy_breaks:
+            NC.save(args.cachedir,cache_key,d,expanded_mm)
 
     # copy new nodes to distance matrix
     expanded_m = reader.travel_time(60/args.speed,expanded_mm)
+
+    # all of the per arc and per node values, built once and shared by
+    # initial routes, the model, and the output
+    evaluators = E.network_evaluators(expanded_mm,d,expanded_m)
     # print('original matrix of',len(matrix.index),'expanded to ',len(expanded_m.index))
 
     # vehicles:
-    vehicles = V.Vehicles(args.numvehicles,args.horizon)
+    vehicle_classes = None
+    if args.vehicle_classes:
+        try:
+            vehicle_classes = V.parse_vehicle_classes(args.vehicle_classes,args.speed)
+        except ValueError as e:
+            parser.error(str(e))
+        args.numvehicles = sum(count for (count,factor) in vehicle_classes)
+    vehicles = V.Vehicles(args.numvehicles,args.horizon,vehicle_classes)
 
     # Create the routing index manager.
 
@@ -93,7 +164,10 @@ def main():
     # probably should refactor to put time under control of
     # demand class
     num_nodes = len(expanded_mm.index)
-    print('After augmenting network with break nodes, solving with ',num_nodes,'nodes')
+    if args.lazy_breaks:
+        print('Break nodes get added as needed, starting with',num_nodes,'nodes')
+    else:
+        print('After augmenting network with break nodes, solving with ',num_nodes,'nodes')
     #print(d.demand.loc[d.demand.feasible,:])
     print(d.demand.loc[:,['from_node',
                           'to_node',
@@ -114,9 +188,34 @@ def main():
     initial_routes = None
     trip_chains = {}
 
-    trip_chainsb = IR.initial_routes_2(d,vehicles.vehicles,expanded_mm)
-    initial_routesb = [v for v in trip_chainsb.values()]
-    (assB,routing,manager) = MR.model_run(d,expanded_mm,vehicles.vehicles,args.drive_dimension_start_value,None,initial_routesb,args)
+    stats = None
+    if args.callback_stats:
+        stats = CS.CallbackStats(args.callback_stats)
+
+    if args.lazy_breaks:
+        (assB,routing,manager,expanded_mm,converged) = MR.lazy_break_run(d,expanded_mm,vehicles.vehicles,
+                                                                         args.drive_dimension_start_value,
+                                                                         args,
+                                                                         max_rounds=args.lazy_rounds,
+                                                                         transit_matrix=args.transit_matrix,
+                                                                         distance=partial(reader.travel_time,60/args.speed),
+                                                                         stats=stats)
+        print('lazy breaks solved with',len(expanded_mm.index),'nodes')
+        expanded_m = reader.travel_time(60/args.speed,expanded_mm)
+        evaluators = E.network_evaluators(expanded_mm,d,expanded_m)
+    else:
+        # the initial routes are built at --speed, so with faster
+        # vehicle classes they may not fit.  Then fall back on just the
+        # routes of the vehicles that run at --speed, rather than fail
+        trip_chainsb = IR.initial_routes_2(d,vehicles.vehicles,evaluators)
+        initial_routesb = [v for v in trip_chainsb.values()]
+        network_speed_routes = [route if veh.time_factor == 1 else []
+                                for (veh,route) in zip(vehicles.vehicles,initial_routesb)]
+        (assB,routing,manager) = MR.model_run(d,expanded_mm,vehicles.vehicles,args.drive_dimension_start_value,None,initial_routesb,args,
+                                             transit_matrix=args.transit_matrix,
+                                             evaluators=evaluators,
+                                             stats=stats,
+                                             fallback_routes=network_speed_routes)
     # 1201918
 
     # # set up initial routes by creating a lot of little problems
@@ -144,15 +243,15 @@ def main():
         print('The Objective Value is {0}'.format(assignment.ObjectiveValue()))
         print('details:')
 
-        SO.print_solution(d,expanded_m,expanded_mm,
+        SO.print_solution(d,evaluators.distance,evaluators.travel,
                           vehicles,manager,routing,assignment,args.horizon,
                           args.drive_dimension_start_value,
                           args)
 
-        SO.csv_output(d,expanded_m,expanded_mm,
+        SO.csv_output(d,evaluators.distance,evaluators.travel,
                       vehicles,manager,routing,assignment,args.horizon,
                       args.vehicle_output)
-        SO.csv_demand_output(d,expanded_m,expanded_mm,
+        SO.csv_demand_output(d,evaluators.distance,evaluators.travel,
                              vehicles,manager,routing,assignment,args.horizon,
                              args.demand_output)
 
@@ -16,6 +16,7 @@ import solution_output as SO
 
 import initial_routes as IR
 import model_run as MR
+import callback_stats as CS
 
 def main():
     """Entry point of the program."""
@@ -23,7 +24,7 @@ def main():
     # parser.add_argument('--resume_file',type=str,dest='resumefile',
     #                     help="resume a failed solver run from this file")
     parser.add_argument('-m,--matrixfile', type=str, dest='matrixfile',
-                        help='CSV file for travel matrix (distances)')
+                        help='CSV or .npy file for travel matrix (distances).  A .npy file (see src/convert_matrix.py) is memory mapped rather than read in')
     parser.add_argument('-d,--demandfile', type=str, dest='demand',
                         help='CSV file for demand pairs (origin, dest, time windows)')
     parser.add_argument('-o,--vehicleoutput', type=str, dest='vehicle_output', default='vehicle_output.csv',
@@ -58,10 +59,28 @@ def main():
     parser.add_argument('--debug', type=bool, dest='debug', default=False,
                         help="Turn on some print statements.")
 
+    parser.add_argument('--transit_matrix', action='store_true', dest='transit_matrix',
+                        default=False,
+                        help='Hand the solver precomputed transit matrices rather than python callbacks, so the search never calls back into python for arc values.')
+
+    parser.add_argument('--vehicle_class', type=str, nargs='+', dest='vehicle_classes',
+                        help='Vehicle classes as COUNT:SPEED, for example 20:45 60:55 with --speed 45 to get 20 vehicles at 45 mph and 60 at 55 mph.  Each class gets its own travel times, scaled from the network built at --speed, so --speed has to be the slowest class (break nodes are spaced for it).  The counts replace -v.  Default is every vehicle at --speed')
+
+    parser.add_argument('--cost_per_minute', type=float, dest='cost_per_minute', default=1.0,
+                        help='Objective weight on each minute of travel and service time.  Default 1')
+    parser.add_argument('--cost_per_mile', type=float, dest='cost_per_mile', default=0.0,
+                        help='Objective weight on each mile driven.  Default 0, which leaves the plain travel time objective')
+    parser.add_argument('--vehicle_cost', action='store_true', dest='vehicle_cost',
+                        default=False,
+                        help="Add each vehicle's fixed cost to the objective when that vehicle gets used")
+
+    parser.add_argument('--callback_stats', type=str, dest='callback_stats',
+                        help='Count and time the python callbacks during the solve, and write a JSON summary (calls per second, python time, hottest node pairs) to this file.  Off by default')
+
     args = parser.parse_args()
 
     print('read in distance matrix')
-    matrix = reader.load_matrix_from_csv(args.matrixfile)
+    matrix = reader.load_matrix(args.matrixfile)
     minutes_matrix = reader.travel_time(args.speed/60,matrix)
 
     print('read in demand data')
@@ -69,14 +88,26 @@ def main():
     d = D.Demand(odpairs,minutes_matrix,args.horizon,use_breaks=False)
 
     # convert nodes to solver space from input map space
-    expanded_mm = d.generate_solver_space_matrix(minutes_matrix,args.horizon)
+    expanded_mm = d.generate_solver_space_matrix(minutes_matrix,args.horizon,
+                                                 compact=True)
 
     # echo nodes to distance matrix
     expanded_m = reader.travel_time(60/args.speed,expanded_mm)
+
+    # all of the per arc and per node values, built once and shared by
+    # initial routes, the model, and the output
+    evaluators = E.network_evaluators(expanded_mm,d,expanded_m)
     # print('original matrix of',len(matrix.index),'expanded to ',len(expanded_m.index))
 
     # vehicles:
-    vehicles = V.Vehicles(args.numvehicles,args.horizon)
+    vehicle_classes = None
+    if args.vehicle_classes:
+        try:
+            vehicle_classes = V.parse_vehicle_classes(args.vehicle_classes,args.speed)
+        except ValueError as e:
+            parser.error(str(e))
+        args.numvehicles = sum(count for (count,factor) in vehicle_classes)
+    vehicles = V.Vehicles(args.numvehicles,args.horizon,vehicle_classes)
 
     # number of nodes is now given by the travel time matrix
     # probably should refactor to put time under control of
@@ -98,20 +129,30 @@ def main():
 
 
     initial_routes = None
+    stats = None
+    if args.callback_stats:
+        stats = CS.CallbackStats(args.callback_stats)
+
     trip_chains = {}
     assignment=None
     routing=None
     manager=None
     if args.initial_routes:
-        trip_chains = IR.initial_routes_no_breaks(d,vehicles.vehicles,expanded_mm,
+        trip_chains = IR.initial_routes_no_breaks(d,vehicles.vehicles,evaluators,
                                                   debug = args.debug)
         initial_routes = [v for v in trip_chains.values()]
         (assignment,routing,manager) = MR.model_run_nobreaks(d,expanded_mm,vehicles.vehicles,
                                                              None,initial_routes,
-                                                             args)
+                                                             args,
+                                                             transit_matrix=args.transit_matrix,
+                                                             evaluators=evaluators,
+                                                             stats=stats)
     else:
         (assignment,routing,manager) = MR.model_run_nobreaks(d,expanded_mm,vehicles.vehicles,
-                                                             args=args)
+                                                             args=args,
+                                                             transit_matrix=args.transit_matrix,
+                                                             evaluators=evaluators,
+                                                             stats=stats)
 
     if assignment:
         ## save the assignment, (Google Protobuf format)
@@ -124,14 +165,14 @@ def main():
         print('The Objective Value is {0}'.format(assignment.ObjectiveValue()))
         print('details:')
 
-        SO.print_solution(d,expanded_m,expanded_mm,
+        SO.print_solution(d,evaluators.distance,evaluators.travel,
                           vehicles,manager,routing,assignment,args.horizon,
                           0,
                           args)
-        SO.csv_output(d,expanded_m,expanded_mm,
+        SO.csv_output(d,evaluators.distance,evaluators.travel,
                       vehicles,manager,routing,assignment,args.horizon,
                       args.vehicle_output)
-        SO.csv_demand_output(d,expanded_m,expanded_mm,
+        SO.csv_demand_output(d,evaluators.distance,evaluators.travel,
                              vehicles,manager,routing,assignment,args.horizon,
                              args.demand_output)
 
@@ -0,0 +1,342 @@
+"""Compact solver space travel time matrix"""
+import numpy as np
+import pandas as pd
+
+# marks an arc that does not exist (what used to be NaN)
+FORBIDDEN = np.iinfo(np.int32).max
+
+class _Locator():
+    """DataFrame style .loc lookups, so that older code that does
+    t.loc[o,d] and np.isnan() keeps working.  Forbidden arcs come
+    back as NaN.
+
+    """
+    def __init__(self,matrix):
+        self.matrix = matrix
+
+    def _positions(self,key):
+        if isinstance(key,slice):
+            return np.arange(len(self.matrix))[key]
+        return np.atleast_1d(np.asarray(key,dtype=int))
+
+    def __getitem__(self,key):
+        (rows,cols) = key
+        if np.ndim(rows) == 0 and np.ndim(cols) == 0:
+            value = self.matrix.get(rows,cols)
+            if value == FORBIDDEN:
+                return np.nan
+            return float(value)
+        rows = self._positions(rows)
+        cols = self._positions(cols)
+        if isinstance(self.matrix,SolverMatrix):
+            block = self.matrix.times[np.ix_(rows,cols)]
+        else:
+            block = np.array([[self.matrix.get(r,c) for c in cols] for r in rows])
+        return pd.DataFrame(np.where(block == FORBIDDEN, np.nan, block),
+                            index=rows,columns=cols)
+
+class SolverMatrix():
+    """
+    Travel minutes between solver nodes, stored as int32.
+
+    Solver node ids run from 0 to N-1 (the depot is 0), so a node id
+    is also its row and column number, and a row or column is a
+    plain array view.  Arcs that do not exist hold FORBIDDEN rather
+    than NaN, so the whole thing is a quarter of the size of the
+    pivoted float64 DataFrame it replaces.
+
+    """
+
+    def __init__(self,times):
+        times = np.asarray(times)
+        assert times.ndim == 2 and times.shape[0] == times.shape[1]
+        self.times = np.ascontiguousarray(times,dtype=np.int32)
+        self.loc = _Locator(self)
+
+    @classmethod
+    def from_array(cls,values):
+        """convert a square float array with NaN for missing arcs"""
+        values = np.asarray(values,dtype=float)
+        missing = np.isnan(values)
+        times = np.trunc(np.where(missing,0,values)).astype(np.int32)
+        times[missing] = FORBIDDEN
+        return cls(times)
+
+    @classmethod
+    def from_dataframe(cls,df):
+        """convert a pivoted travel time DataFrame (NaN is no arc)"""
+        size = int(max(df.index.max(),df.columns.max())) + 1
+        df = df.reindex(index=range(0,size),columns=range(0,size))
+        return cls.from_array(df.values)
+
+    def to_array(self):
+        """float array with NaN for forbidden arcs"""
+        return np.where(self.allowed(),self.times,np.nan)
+
+    def to_dataframe(self):
+        nodes = range(0,len(self))
+        return pd.DataFrame(self.to_array(),
+                            index=pd.Index(nodes,name='x'),
+                            columns=pd.Index(nodes,name='y'))
+
+    def __len__(self):
+        return self.times.shape[0]
+
+    @property
+    def index(self):
+        return pd.RangeIndex(len(self))
+
+    @property
+    def columns(self):
+        return self.index
+
+    def copy(self):
+        return SolverMatrix(self.times.copy())
+
+    def get(self,from_node,to_node):
+        """travel time as int, or FORBIDDEN"""
+        return int(self.times[from_node,to_node])
+
+    def has_arc(self,from_node,to_node):
+        return self.times[from_node,to_node] != FORBIDDEN
+
+    def row(self,node):
+        """times out of node, as a view"""
+        return self.times[node,:]
+
+    def column(self,node):
+        """times into node, as a view"""
+        return self.times[:,node]
+
+    def lookup(self,from_node,to_nodes):
+        """times from one node to many, as floats with NaN for no arc"""
+        times = self.times[from_node,np.asarray(to_nodes,dtype=int)]
+        return np.where(times == FORBIDDEN,np.nan,times)
+
+    def allowed(self):
+        """boolean mask of the arcs that exist (same as DataFrame.notna())"""
+        return self.times != FORBIDDEN
+
+    def max_time(self):
+        allowed = self.allowed()
+        if not allowed.any():
+            return 0
+        return int(self.times[allowed].max())
+
+    def floordiv(self,value):
+        """same as DataFrame.floordiv, but forbidden arcs stay forbidden"""
+        allowed = self.allowed()
+        times = np.full_like(self.times,FORBIDDEN)
+        times[allowed] = np.floor_divide(self.times[allowed],value)
+        return SolverMatrix(times)
+
+    def subset(self,nodes):
+        """keep only the arcs between the given nodes"""
+        keep = np.zeros(len(self),dtype=bool)
+        keep[np.asarray(nodes,dtype=int)] = True
+        times = np.where(np.outer(keep,keep),self.times,FORBIDDEN)
+        return SolverMatrix(times)
+
+    def with_arcs(self,triplets):
+        """return a new matrix with the arcs in triplets (x, y, t) added,
+        growing it to cover any new nodes.  Existing arcs win over
+        new ones, same as DataFrame.update() did.
+
+        """
+        size = len(self)
+        if len(triplets) > 0:
+            size = max(size,int(triplets['x'].max())+1,int(triplets['y'].max())+1)
+        times = np.full((size,size),FORBIDDEN,dtype=np.int32)
+        times[triplets['x'],triplets['y']] = np.trunc(triplets['t'])
+        old = len(self)
+        np.copyto(times[:old,:old],self.times,where=self.allowed())
+        return SolverMatrix(times)
+
+def as_solver_matrix(matrix):
+    """pass through a SolverMatrix, or convert a pivoted DataFrame"""
+    if isinstance(matrix,SolverMatrix):
+        return matrix
+    return SolverMatrix.from_dataframe(matrix)
+
+def lookup(matrix,from_node,to_nodes):
+    """times from one node to many, for any of the solver space matrix
+    types (NaN for no arc)
+
+    """
+    if isinstance(matrix,(SolverMatrix,SparseSolverMatrix)):
+        return matrix.lookup(from_node,to_nodes)
+    # pivoted DataFrame, node ids are positions
+    return np.asarray(matrix.values[from_node,np.asarray(to_nodes,dtype=int)],dtype=float)
+
+class SparseSolverMatrix():
+    """
+    Travel minutes between solver nodes, stored CSR style.
+
+    The arcs out of node n are neighbors[offsets[n]:offsets[n+1]],
+    sorted by neighbor id, with the matching travel minutes in
+    times.  After break expansion almost every node has only two or
+    three arcs, so this grows with the number of arcs rather than
+    with the number of nodes squared.  Arcs that are not stored are
+    forbidden.
+
+    """
+
+    def __init__(self,offsets,neighbors,times):
+        self.offsets = np.asarray(offsets,dtype=np.int64)
+        self.neighbors = np.asarray(neighbors,dtype=np.int32)
+        self.times = np.asarray(times,dtype=np.int32)
+        assert len(self.neighbors) == len(self.times) == self.offsets[-1]
+        self.loc = _Locator(self)
+
+    @classmethod
+    def from_triplets(cls,triplets,size=None):
+        """build from a structured array of (x, y, t) arcs.  If the same
+        arc shows up more than once, the first one wins.
+
+        """
+        x = np.asarray(triplets['x'],dtype=np.int64)
+        y = np.asarray(triplets['y'],dtype=np.int64)
+        t = np.trunc(np.asarray(triplets['t'],dtype=float))
+        if size is None:
+            size = 1
+            if len(x) > 0:
+                size = int(max(x.max(),y.max())) + 1
+        # lexsort is stable, so the first of any repeats stays first
+        order = np.lexsort((y,x))
+        x = x[order]
+        y = y[order]
+        t = t[order]
+        keys = x*size + y
+        keep = np.ones(len(keys),dtype=bool)
+        keep[1:] = keys[1:] != keys[:-1]
+        x = x[keep]
+        offsets = np.zeros(size+1,dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(x,minlength=size))
+        return cls(offsets,y[keep],t[keep])
+
+    @classmethod
+    def from_matrix(cls,matrix):
+        """convert a SolverMatrix, a pivoted DataFrame, or pass through"""
+        if isinstance(matrix,SparseSolverMatrix):
+            return matrix
+        matrix = as_solver_matrix(matrix)
+        (x,y) = np.nonzero(matrix.allowed())
+        triplets = np.zeros(len(x),dtype=[('x', int), ('y', int),('t',float)])
+        triplets['x'] = x
+        triplets['y'] = y
+        triplets['t'] = matrix.times[x,y]
+        return cls.from_triplets(triplets,len(matrix))
+
+    def arcs(self):
+        """all of the arcs, as a structured array of (x, y, t)"""
+        triplets = np.zeros(len(self.neighbors),dtype=[('x', int), ('y', int),('t',float)])
+        triplets['x'] = self.arc_origins()
+        triplets['y'] = self.neighbors
+        triplets['t'] = self.times
+        return triplets
+
+    def arc_origins(self):
+        """the from node of every stored arc"""
+        return np.repeat(np.arange(len(self)),np.diff(self.offsets))
+
+    def to_solver_matrix(self):
+        times = np.full((len(self),len(self)),FORBIDDEN,dtype=np.int32)
+        times[self.arc_origins(),self.neighbors] = self.times
+        return SolverMatrix(times)
+
+    def to_array(self):
+        return self.to_solver_matrix().to_array()
+
+    def to_dataframe(self):
+        return self.to_solver_matrix().to_dataframe()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def index(self):
+        return pd.RangeIndex(len(self))
+
+    @property
+    def columns(self):
+        return self.index
+
+    def num_arcs(self):
+        return len(self.neighbors)
+
+    def copy(self):
+        return SparseSolverMatrix(self.offsets.copy(),
+                                  self.neighbors.copy(),
+                                  self.times.copy())
+
+    def arc_position(self,from_node,to_node):
+        """position of the arc in neighbors and times, or -1"""
+        lo = self.offsets[from_node]
+        hi = self.offsets[from_node+1]
+        pos = lo + np.searchsorted(self.neighbors[lo:hi],to_node)
+        if pos < hi and self.neighbors[pos] == to_node:
+            return int(pos)
+        return -1
+
+    def get(self,from_node,to_node):
+        """travel time as int, or FORBIDDEN"""
+        pos = self.arc_position(from_node,to_node)
+        if pos < 0:
+            return FORBIDDEN
+        return int(self.times[pos])
+
+    def has_arc(self,from_node,to_node):
+        return self.arc_position(from_node,to_node) >= 0
+
+    def row(self,node):
+        """(neighbors, times) out of node, as views"""
+        lo = self.offsets[node]
+        hi = self.offsets[node+1]
+        return (self.neighbors[lo:hi],self.times[lo:hi])
+
+    def lookup(self,from_node,to_nodes):
+        """times from one node to many, as floats with NaN for no arc"""
+        (neighbors,times) = self.row(from_node)
+        to_nodes = np.asarray(to_nodes,dtype=int)
+        pos = np.minimum(np.searchsorted(neighbors,to_nodes),max(len(neighbors)-1,0))
+        found = np.zeros(len(to_nodes),dtype=bool)
+        if len(neighbors) > 0:
+            found = neighbors[pos] == to_nodes
+        result = np.full(len(to_nodes),np.nan)
+        result[found] = times[pos[found]]
+        return result
+
+    def column(self,node):
+        """(from nodes, times) into node.  This one scans all the arcs"""
+        into = self.neighbors == node
+        return (self.arc_origins()[into],self.times[into])
+
+    def max_time(self):
+        if len(self.times) == 0:
+            return 0
+        return int(self.times.max())
+
+    def floordiv(self,value):
+        return SparseSolverMatrix(self.offsets.copy(),
+                                  self.neighbors.copy(),
+                                  np.floor_divide(self.times,value))
+
+    def subset(self,nodes):
+        """keep only the arcs between the given nodes"""
+        keep = np.zeros(len(self),dtype=bool)
+        keep[np.asarray(nodes,dtype=int)] = True
+        arcs = self.arcs()
+        arcs = arcs[keep[arcs['x']] & keep[arcs['y']]]
+        return SparseSolverMatrix.from_triplets(arcs,len(self))
+
+    def with_arcs(self,triplets):
+        """return a new matrix with the arcs in triplets (x, y, t) added.
+        Existing arcs win over new ones.
+
+        """
+        size = len(self)
+        if len(triplets) > 0:
+            size = max(size,int(triplets['x'].max())+1,int(triplets['y'].max())+1)
+        combined = np.concatenate((self.arcs(),
+                                   np.asarray(triplets,dtype=[('x', int), ('y', int),('t',float)])))
+        return SparseSolverMatrix.from_triplets(combined,size)
@@ -8,12 +8,20 @@ class Vehicles():
     Args:
     filename: the CSV file that defines the vehicles
     num_vehicles: default to 100, only used if filename is None
+    horizon: end of every vehicle's time window
+    vehicle_classes: optional list of (count, time_factor), one per
+      class.  time_factor multiplies the network travel times for
+      that class (1.0 is the --speed the network was built at, and
+      faster classes are below 1, see parse_vehicle_classes).  The
+      counts have to add up to num_vehicles.  Default is one class,
+      all at 1.0
   """
 
   def __init__(self,
                # filename = None, # uncomment if want vehicle def in file
                num_vehicles,
-               horizon
+               horizon,
+               vehicle_classes=None
   ):
     # copy the python from the example.
     Vehicle = namedtuple(
@@ -23,7 +31,9 @@ class Vehicles():
         'capacity',
         'cost',
         'time_window',
-        'depot_index'
+        'depot_index',
+        'vehicle_class',
+        'time_factor'
       ]
     )
 
@@ -42,7 +52,57 @@ class Vehicles():
     depots = np.zeros_like(idxs)
     # for now, all time windows are from 0 to horizon
 
+    # vehicle classes, in order: the first count vehicles are class 0,
+    # and so on
+    if vehicle_classes is None:
+      vehicle_classes = [(num_vehicles,1.0)]
+    assert sum(count for (count,factor) in vehicle_classes) == num_vehicles
+    classes = np.repeat(np.arange(len(vehicle_classes)),
+                        [count for (count,factor) in vehicle_classes])
+    factors = np.array([factor for (count,factor) in vehicle_classes],dtype=float)[classes]
+
     self.vehicles = [
-          Vehicle(int(idx), int(capacity), int(cost), [0,horizon], int(depot_idx))
-          for idx, capacity, cost, depot_idx in zip(idxs, caps, costs, depots)
+          Vehicle(int(idx), int(capacity), int(cost), [0,horizon], int(depot_idx),
+                  int(vclass), float(factor))
+          for idx, capacity, cost, depot_idx, vclass, factor in zip(idxs, caps, costs, depots,
+                                                                   classes, factors)
       ]
+
+  def class_factors(self):
+    """the time factor of each vehicle class, in class order"""
+    return vehicle_class_factors(self.vehicles)
+
+def vehicle_class_factors(vehicles):
+  """the time factor of each vehicle class, from a list of Vehicle"""
+  factors = {}
+  for veh in vehicles:
+    factors[veh.vehicle_class] = veh.time_factor
+  return [factors.get(vclass,1.0) for vclass in range(max(factors)+1)]
+
+def parse_vehicle_classes(specs,speed):
+  """turn COUNT:SPEED strings (as on the command line) into the
+  (count, time_factor) list Vehicles wants, with time factors relative
+  to the speed the network was built at.
+
+  Break nodes are spaced for the network speed, so no class can be
+  slower than that: a slower truck would drive past 8 or 11 hours
+  between break nodes.  Build the network at the slowest class speed.
+
+  Malformed specs are a ValueError that says which one.
+  """
+  classes = []
+  for spec in specs:
+    parts = spec.split(':')
+    try:
+      if len(parts) != 2:
+        raise ValueError
+      count = int(parts[0])
+      class_speed = float(parts[1])
+    except ValueError:
+      raise ValueError('vehicle class {!r} is not COUNT:SPEED, for example 20:45'.format(spec))
+    if count < 1 or class_speed <= 0:
+      raise ValueError('vehicle class {!r} needs a positive count and speed'.format(spec))
+    if class_speed < float(speed):
+      raise ValueError('vehicle class speed {} is slower than --speed {}'.format(parts[1],speed))
+    classes.append((count,float(speed)/class_speed))
+  return classes
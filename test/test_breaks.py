@@ -1,10 +1,16 @@
 import breaks as B
+import break_node as BN
 import demand as D
 import read_csv as reader
+import solver_matrix as SM
 import math
+import pickle
 import pandas as pd
 import numpy as np
 
+def node_fields(bn):
+    return tuple(getattr(bn,name) for name in BN.BreakNode.__slots__)
+
 def test_make_nodes():
 
     # no new nodes with travel time equal to one hour
@@ -246,3 +252,216 @@ def test_insert_nodes_for_breaks():
         assert len(newtimes.loc[:,origin].index[newtimes.loc[:,origin].notna()]) == 5
         # 6 nodes link to destination---origin plus 5 break nodes
         assert len(newtimes.loc[:,dest].index[newtimes.loc[:,dest].notna()]) == 6
+
+def test_count_break_arcs():
+
+    # counts line up with what break_node_splitter actually makes
+    for tt in [0,1,61,479,480,481,659,660,661,1140,1141,1320,1321,5000]:
+        (num_nodes,num_arcs) = B.count_break_arcs(tt)
+        triple = B.break_node_splitter(10,20,tt,30)
+        assert len(triple[0]) == num_arcs
+        assert len(triple[1]) == num_nodes
+        assert triple[2] == 30 + num_nodes
+    # and works on arrays too
+    (num_nodes,num_arcs) = B.count_break_arcs([61,481,1321])
+    assert list(num_nodes) == [2,3,6]
+    assert list(num_arcs) == [7,10,19]
+
+def test_needs_breaks():
+    # out of the depot, only links that could hit the 8 hour limit
+    assert not B.needs_breaks(0,40)
+    assert not B.needs_breaks(0,479)
+    assert B.needs_breaks(0,480)
+    assert B.needs_breaks(0,1321)
+    # anywhere else the accumulators might already be nearly full
+    assert B.needs_breaks(3,1)
+    assert B.needs_breaks(3,40)
+    # zero minute links never need one
+    assert not B.needs_breaks(3,0)
+    assert not B.needs_breaks(0,0)
+    assert list(B.needs_breaks([0,0,3,3],[40,500,40,0])) == [False,True,True,False]
+
+def test_expand_legs():
+
+    # writing all the legs into one array gives the same triplets
+    # and node numbers as splitting them one at a time
+    origins = [0,1,2]
+    destinations = [1,2,0]
+    tts = [930,1500,61]
+    (new_times,leg_nodes,next_node) = B.expand_legs(origins,destinations,tts,3)
+    min_start = 3
+    pos = 0
+    for (o,dd,tt,nodes) in zip(origins,destinations,tts,leg_nodes):
+        triple = B.break_node_splitter(o,dd,tt,min_start)
+        assert [bn.node for bn in nodes] == [bn.node for bn in triple[1]]
+        assert all(bn.destination == dd for bn in nodes)
+        assert (new_times[pos:pos+len(triple[0])] == triple[0]).all()
+        pos += len(triple[0])
+        min_start = triple[2]
+    assert pos == len(new_times)
+    assert next_node == min_start
+    # no repeated arcs, so no need to drop duplicates
+    assert len(set(zip(new_times['x'],new_times['y']))) == len(new_times)
+
+def test_destination_origin_chains():
+
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    mm = d.generate_solver_space_matrix(m)
+    d.insert_nodes_for_breaks(mm)
+    # chain from a destination to some other origin holds that link's
+    # own break nodes, short break before long break
+    chain = d.get_break_node_chain(7,3)
+    assert len(chain) == B.count_break_arcs(mm.loc[7,3])[0]
+    assert sorted(chain) == list(range(min(chain),min(chain)+len(chain)))
+    assert d.get_break_node(chain[0]).break_time == 30
+    assert d.get_break_node(chain[1]).break_time == 600
+    for bk in chain:
+        assert d.get_break_node(bk).destination == 3
+
+def test_aggregate_split_nodes():
+
+    nodes = range(0,3)
+    tt = pd.DataFrame([[0.,5.,np.nan],[5.,0.,7.],[np.nan,7.,0.]],
+                      index=pd.Index(nodes,name='x'),
+                      columns=pd.Index(nodes,name='y'))
+    newtimes = np.zeros(4,dtype=[('x', int), ('y', int),('t',float)])
+    newtimes[0] = (0,1,99)  # already there, old arc wins
+    newtimes[1] = (0,2,3)   # was NaN, so it gets filled in
+    newtimes[2] = (2,4,11)  # grows the matrix
+    newtimes[3] = (4,0,13)
+    agg = B.aggregate_split_nodes(tt,newtimes)
+    assert len(agg.index) == 5
+    assert list(agg.index) == list(range(0,5))
+    assert agg.index.name == 'x' and agg.columns.name == 'y'
+    assert agg.loc[0,1] == 5
+    assert agg.loc[0,2] == 3
+    assert agg.loc[2,4] == 11
+    assert agg.loc[4,0] == 13
+    assert np.isnan(agg.loc[3,3])
+    assert np.isnan(agg.loc[2,0])
+    # matrix types give the same answers
+    for matrix in (SM.as_solver_matrix(tt),SM.SparseSolverMatrix.from_matrix(tt)):
+        other = B.aggregate_split_nodes(matrix,newtimes).to_dataframe()
+        assert other.equals(agg)
+
+    # nothing to add means nothing changes
+    empty = np.zeros(0,dtype=[('x', int), ('y', int),('t',float)])
+    agg = B.aggregate_split_nodes(tt,empty)
+    assert agg.equals(tt)
+
+def test_chunk_bounds():
+    from_nodes = [0,0,1,1,1,2,3,3]
+    num_arcs = [7,7,7,7,7,7,7,7]
+    bounds = B.chunk_bounds(from_nodes,num_arcs,3)
+    # covers everything, in order, never splitting a from node
+    assert bounds[0][0] == 0
+    assert bounds[-1][1] == len(from_nodes)
+    for (a,b) in zip(bounds[:-1],bounds[1:]):
+        assert a[1] == b[0]
+        assert from_nodes[b[0]-1] != from_nodes[b[0]]
+    assert len(bounds) > 1
+    assert B.chunk_bounds(from_nodes,num_arcs,1) == [(0,8)]
+    assert B.chunk_bounds([5,5,5],[7,7,7],4) == [(0,3)]
+
+def test_expand_legs_parallel():
+
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    mm = d.generate_solver_space_matrix(m)
+    serial = d.insert_nodes_for_breaks(mm)
+    serial_nodes = d.break_nodes
+    serial_chains = d.break_node_chains
+    for workers in (2,3):
+        parallel = d.insert_nodes_for_breaks(mm,workers=workers)
+        assert parallel.equals(serial)
+        assert d.break_node_chains == serial_chains
+        assert list(d.break_nodes.keys()) == list(serial_nodes.keys())
+        for (node,bn) in serial_nodes.items():
+            pbn = d.break_nodes[node]
+            assert node_fields(pbn) == node_fields(bn)
+
+    origins = [1,1,2,2,2,3,4,4]
+    destinations = [5,6,5,7,8,5,6,7]
+    tts = [100,700,1321,300,2000,480,481,90]
+    (new_times,leg_nodes,next_node) = B.expand_legs(origins,destinations,tts,20)
+    (pnew_times,pleg_nodes,pnext_node) = B.expand_legs_parallel(origins,destinations,tts,20,3)
+    assert pnew_times.tobytes() == new_times.tobytes()
+    assert pnext_node == next_node
+    assert [[node_fields(bn) for bn in nodes] for nodes in pleg_nodes] == \
+        [[node_fields(bn) for bn in nodes] for nodes in leg_nodes]
+
+def test_break_node_registry():
+    registry = BN.BreakNodes()
+    assert len(registry) == 0
+    assert not registry
+    assert registry.get(3) is None
+    (new_times,new_nodes,next_node) = B.break_node_splitter(1,2,1000,10)
+    registry.add(new_nodes)
+    assert len(registry) == len(new_nodes)
+    assert registry.keys() == sorted(bn.node for bn in new_nodes)
+    assert registry.max_node() == next_node - 1
+    for bn in new_nodes:
+        assert bn.node in registry
+        view = registry[bn.node]
+        assert node_fields(view) == node_fields(bn)
+        assert view.drive_time_restore() == bn.drive_time_restore()
+        assert registry.drive_time_restore()[bn.node] == bn.drive_time_restore()
+    assert 0 not in registry
+    assert -1 not in registry
+    assert next_node not in registry
+    # columns grow for nodes past the end, and re-adding does not
+    # count twice
+    (new_times,more_nodes,last_node) = B.break_node_splitter(2,3,100,100)
+    registry.add(more_nodes)
+    registry.add(more_nodes)
+    assert len(registry) == len(new_nodes) + len(more_nodes)
+    assert registry[100].destination == 3
+    # lookups are made once and handed out again, until the registry
+    # changes
+    assert registry.get(100) is registry.get(100)
+    assert registry.get(-1) is None
+    assert registry.get(10**6) is None
+    registry.remove([100,100,5,-1,10**6])
+    assert 100 not in registry
+    assert registry.get(100) is None
+    assert len(registry) == len(new_nodes) + len(more_nodes) - 1
+    assert [node for (node,bn) in registry.items()] == registry.keys()
+    copied = pickle.loads(pickle.dumps(registry))
+    assert copied.keys() == registry.keys()
+    assert node_fields(copied[101]) == node_fields(registry[101])
+
+def test_break_node_chains():
+    chains = BN.BreakNodeChains.from_legs([5,1,5,1],[2,7,0,7],
+                                          [[20,21],[10,11,12],[],[13]])
+    # repeats of a link join up in order
+    assert len(chains) == 3
+    assert chains.get(1,7).tolist() == [10,11,12,13]
+    assert chains.get(5,2).tolist() == [20,21]
+    # no break nodes is an empty chain, no link at all is None
+    assert len(chains.get(5,0)) == 0
+    assert chains.get(0,5) is None
+    assert chains.get(7,1) is None
+    assert chains.get(100,2) is None
+    assert (5,0) in chains and (0,5) not in chains
+    # a view, not a copy
+    assert chains.get(1,7).base is not None
+
+    more = chains.with_legs([0,5],[5,2],[[30],[22]])
+    assert more.get(0,5).tolist() == [30]
+    assert more.get(5,2).tolist() == [20,21,22]
+    assert more.get(1,7).tolist() == [10,11,12,13]
+    assert chains.get(5,2).tolist() == [20,21]
+    assert more != chains
+    assert BN.BreakNodeChains.from_legs([5,1,5,1],[2,7,0,7],
+                                        [[20,21],[10,11,12],[],[13]]) == chains
+
+    (fewer,dropped) = more.without_endpoints([0])
+    assert sorted(dropped.tolist()) == [30]
+    assert fewer.get(0,5) is None and fewer.get(5,0) is None
+    assert fewer.get(5,2).tolist() == [20,21,22]
+    assert fewer.get(1,7).tolist() == [10,11,12,13]
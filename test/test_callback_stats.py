@@ -0,0 +1,55 @@
+import json
+
+import callback_stats as CS
+import demand as D
+import vehicles as V
+import model_run as MR
+import read_csv as reader
+
+def test_wrap():
+    stats = CS.CallbackStats(sample_every=3)
+    calls = []
+    def callback(i,j):
+        calls.append((i,j))
+        return i+j
+    wrapped = stats.wrap('time',callback)
+    assert [wrapped(i,1) for i in range(7)] == [i+1 for i in range(7)]
+    assert len(calls) == 7
+    counter = stats.counters['time']
+    assert counter.calls == 7
+    # the 3rd and 6th calls get timed
+    assert counter.sampled == 2
+    assert set(counter.pairs) == {(2,1),(5,1)}
+
+    stats.note_matrix('demand')
+    summary = stats.summary()
+    assert summary['total_calls'] == 7
+    assert summary['solve_seconds'] is None
+    assert summary['callbacks']['demand']['kind'] == 'matrix'
+    assert summary['callbacks']['demand']['calls'] == 0
+    assert summary['callbacks']['time']['kind'] == 'callback'
+    assert len(summary['callbacks']['time']['hottest']) == 2
+
+def test_model_run_stats(tmp_path):
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    m = d.generate_solver_space_matrix(m)
+    v = V.Vehicles(5,horizon)
+
+    filename = str(tmp_path / 'stats.json')
+    stats = CS.CallbackStats(filename,sample_every=10)
+    (assignment,routing,manager) = MR.model_run_nobreaks(d,m,v.vehicles,
+                                                         stats=stats)
+    assert assignment
+    with open(filename) as f:
+        summary = json.load(f)
+    assert summary['solve_seconds'] > 0
+    time_stats = summary['callbacks']['time']
+    assert time_stats['calls'] > 0
+    assert time_stats['calls_per_second'] > 0
+    for hot in time_stats['hottest']:
+        assert len(hot['nodes']) == 2
+        assert all(node in m.index for node in hot['nodes'])
+    assert summary['callbacks']['demand']['kind'] == 'matrix'
@@ -1,6 +1,10 @@
+import pytest
 import demand as D
 import numpy as np
+import pickle
 import read_csv as reader
+import break_node as BN
+import solver_matrix as SM
 
 def test_demand():
     horizon = 10000
@@ -76,6 +80,15 @@ def test_demand():
     assert mm.loc[0,1] == 1150
     assert np.isnan(mm.loc[6,1])
     assert np.isnan(mm.loc[0,6])
+
+    # every destination links to every other origin, but not its own
+    for dnode in range(6,11):
+        for onode in range(1,6):
+            if dnode - 5 == onode:
+                assert np.isnan(mm.loc[dnode,onode])
+            else:
+                assert mm.loc[dnode,onode] == m.loc[d_alt.get_map_node(dnode),
+                                                    d_alt.get_map_node(onode)]
     mm_ex = d_alt.insert_nodes_for_breaks(mm)
     for idx in mm.index:
         assert mm.loc[idx,idx] == mm_ex.loc[idx,idx]
@@ -97,17 +110,244 @@ def test_demand():
     assert break_chain[4] == new_node_start + 4
 
     assert d_alt.get_break_node(0) == None
-    bn8 = d_alt.get_break_node(new_node_start)
-    bn10 = d_alt.get_break_node(new_node_start+1)
-
-    bn8.node = new_node_start
-    bn8.origin = 0
-    bn8.destination = bn10.node
-    bn8.break_time = 30
-    bn8.drive_time_restore = -480
-
-    bn10.node = new_node_start + 1
-    bn10.origin = 0
-    bn10.destination = 1
-    bn10.break_time = 600
-    bn10.drive_time_restore = -660
+    # the long break node is made first, then the short break before it
+    bn10 = d_alt.get_break_node(new_node_start)
+    bn8 = d_alt.get_break_node(new_node_start+1)
+
+    assert bn8.node == new_node_start + 1
+    assert bn8.origin == 0
+    assert bn8.destination == 1
+    assert bn8.break_time == 30
+    assert bn8.drive_time_restore() == -480
+
+    assert bn10.node == new_node_start
+    assert bn10.origin == 0
+    assert bn10.destination == 1
+    assert bn10.break_time == 600
+    assert bn10.drive_time_restore() == -660
+
+def test_destination_origin_legs():
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    for horizon in (5000,10000,20000):
+        d = D.Demand(odpairs,m,horizon)
+        feasible = d.demand.loc[d.demand.feasible,:]
+        for mm in (d.generate_solver_space_matrix(m),
+                   d.generate_solver_space_matrix(m,compact=True)):
+            # check against every pair, the slow way
+            expected = []
+            for (didx,earliest,own) in zip(feasible.destination,
+                                           feasible.earliest_destination,
+                                           feasible.origin):
+                for (oidx,late) in zip(feasible.origin,feasible.late):
+                    if oidx == own:
+                        continue
+                    tt = mm.loc[didx,oidx]
+                    if earliest + tt > horizon or earliest + tt > late:
+                        continue
+                    expected.append((didx,oidx,tt))
+            assert d.destination_origin_legs(mm) == expected
+
+def test_check_feasible(capsys):
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    horizon = 10000
+    d = D.Demand(odpairs,m,horizon)
+    # reasons go in the constraint column, not to the screen
+    assert capsys.readouterr().out == ""
+    infeasible = d.demand.loc[~d.demand.feasible,:]
+    assert len(infeasible) == 4
+    for (idx,record) in infeasible.iterrows():
+        assert record.constraint.startswith('Pair from {} to {}'.format(record.from_node,record.to_node))
+    assert (d.demand.loc[d.demand.feasible,'constraint'] == 'None').all()
+
+    # same answer as one record at a time
+    for (idx,record) in d.demand.iterrows():
+        do_tt = m.loc[0,record.from_node]
+        od_tt = m.loc[record.from_node,record.to_node]
+        dd_tt = m.loc[record.to_node,0]
+        do_break = int(np.floor(do_tt/660))*630 + (do_tt - int(np.floor(do_tt/660))*660 > 480)*30
+        depot_origin = do_tt + 15 + do_break
+        assert record.depot_origin == depot_origin
+        assert record.feasible == (record.round_trip <= horizon and depot_origin <= record.late)
+        if record.feasible:
+            assert record.earliest_destination >= max(record.early,depot_origin) + 15 + od_tt
+            assert record.round_trip >= record.earliest_destination + 15 + dd_tt
+
+    # a map node that is not in the matrix is an error, not the last row
+    with pytest.raises(KeyError):
+        D.map_space_pair_times(m,[0],[m.columns.max()+1])
+    with pytest.raises(KeyError):
+        D.map_space_times(m,[m.index.max()+1],[0])
+
+    # estimate_break_time works on arrays and on single values
+    tt = np.array([0,480,481,660,661,1140,1141,1400])
+    long_break = BN.BreakNode(-1, -1, 660, 0, 600, 660)
+    short_break = BN.BreakNode(-1, -1, 480, 0,  30, 480)
+    expected = [0,0,30,630,630,630,660,1260]
+    assert list(d.estimate_break_time(tt,long_break,short_break)) == expected
+    for (t,e) in zip(tt,expected):
+        assert d.estimate_break_time(int(t),long_break,short_break) == e
+
+def test_node_table():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    table = d.node_table
+    assert len(table) == len(d.equivalence) + 1
+    assert table['kind'][0] == D.NODE_DEPOT
+    assert table['map_node'][0] == 0
+    for node in d.equivalence.index:
+        row = d.equivalence.loc[node]
+        assert table['map_node'][node] == row.mapnode
+        assert table['demand'][node] == row.demand
+        assert table['service_time'][node] == row.service_time
+        assert table['demand_index'][node] == row.demand_index
+        expected_kind = D.NODE_PICKUP if row.demand > 0 else D.NODE_DROPOFF
+        assert table['kind'][node] == expected_kind
+        assert d.get_node_kind(node) == expected_kind
+
+    # break nodes extend the table
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    table = d.node_table
+    assert len(table) == len(x_m)
+    for (node,bn) in d.break_nodes.items():
+        assert table['kind'][node] == D.NODE_BREAK
+        assert table['break_time'][node] == bn.break_time
+        assert table['drive_restore'][node] == bn.drive_time_restore()
+        assert d.get_map_node(node) == -1
+        assert d.get_demand(node) == 0
+        assert d.get_service_time(node) == 0
+        assert d.get_demand_number(node) == -1
+    assert (table['kind'] != D.NODE_UNKNOWN).all()
+    # off the end of the table gets the defaults
+    assert d.get_map_node(len(x_m)) == -1
+    assert d.get_demand(-1) == 0
+    assert d.get_node_kind(len(x_m)) == D.NODE_UNKNOWN
+
+    # the table is dropped from a pickle and built again on first use
+    copied = pickle.loads(pickle.dumps(d))
+    assert copied._node_table is None and copied._node_columns is None
+    assert np.array_equal(copied.node_table,table)
+    for node in range(len(x_m)):
+        assert copied.get_map_node(node) == d.get_map_node(node)
+        assert copied.get_node_kind(node) == d.get_node_kind(node)
+
+def test_add_loads():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    full = D.Demand(odpairs,m,horizon)
+    full_m = full.insert_nodes_for_breaks(full.generate_solver_space_matrix(m,compact=True))
+
+    d = D.Demand(odpairs.iloc[:3],m,horizon)
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    old_size = len(x_m)
+    old_arcs = x_m.times.copy()
+    (x_m,labels) = d.add_loads(odpairs.iloc[3:],m,x_m)
+    assert labels == list(range(3,len(odpairs)))
+    # the old part of the network is untouched
+    assert np.array_equal(x_m.times[:old_size,:old_size],old_arcs)
+    # same sized network, same number of links and break nodes
+    assert len(x_m) == len(full_m)
+    assert len(d.break_nodes) == len(full.break_nodes)
+    assert len(d.break_node_chains) == len(full.break_node_chains)
+    assert np.array_equal(np.bincount(d.node_table['kind']+1),
+                          np.bincount(full.node_table['kind']+1))
+    for idx in labels:
+        record = d.demand.loc[idx]
+        assert record.feasible == full.demand.loc[idx].feasible
+        if not record.feasible:
+            continue
+        assert record.origin >= old_size and record.destination >= old_size
+        assert d.get_map_node(record.origin) == record.from_node
+        assert d.get_map_node(record.destination) == record.to_node
+        assert d.get_demand(record.origin) == 1
+        assert d.get_demand(record.destination) == -1
+        assert d.get_demand_number(record.origin) == idx
+        assert x_m.get(0,record.origin) == m.loc[0,record.from_node]
+        assert x_m.get(record.origin,record.destination) == m.loc[record.from_node,record.to_node]
+        for (o,dd) in [(0,record.origin),
+                       (record.origin,record.destination),
+                       (record.destination,0)]:
+            chain = d.get_break_node_chain(o,dd)
+            assert len(chain) > 0
+            assert all(bn >= old_size for bn in chain)
+
+def test_retire_loads():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    for sparse in (False,True):
+        d = D.Demand(odpairs,m,horizon)
+        x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True),
+                                        sparse=sparse)
+        record = d.demand.loc[1]
+        num_break_nodes = len(d.break_nodes)
+        chain = d.get_break_node_chain(record.origin,record.destination)
+        retired = d.retire_loads([1],x_m)
+        assert len(retired) == len(x_m)
+        assert not d.demand.loc[1].feasible
+        assert d.demand.loc[1].constraint == 'Load retired'
+        for node in (record.origin,record.destination):
+            assert node not in d.get_node_list()
+            assert d.get_node_kind(node) == D.NODE_RETIRED
+            assert d.get_map_node(node) == -1
+        assert d.get_break_node_chain(record.origin,record.destination) is None
+        assert d.get_break_node_chain(0,record.origin) is None
+        for bn in chain:
+            assert d.get_break_node(bn) is None
+            assert d.get_node_kind(bn) == D.NODE_RETIRED
+        assert len(d.break_nodes) == num_break_nodes - (len(d.retired_nodes) - 2)
+        # nothing goes into or out of a retired node any more
+        gone = SM.SparseSolverMatrix.from_matrix(retired).arcs()
+        assert not np.isin(gone['x'],d.retired_nodes).any()
+        assert not np.isin(gone['y'],d.retired_nodes).any()
+        # and everything else is still there
+        kept = SM.SparseSolverMatrix.from_matrix(x_m).arcs()
+        kept = kept[~np.isin(kept['x'],d.retired_nodes) & ~np.isin(kept['y'],d.retired_nodes)]
+        assert np.array_equal(kept,gone)
+        # retiring again does nothing
+        again = d.retire_loads([1],retired)
+        assert np.array_equal(SM.SparseSolverMatrix.from_matrix(again).arcs(),gone)
+        assert len(d.break_nodes) == num_break_nodes - (len(d.retired_nodes) - 2)
+
+def test_skip_short_legs():
+    horizon = 20000
+    raw = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    # fast enough that some depot legs are under 8 hours
+    m = reader.travel_time(2.5,raw)
+    d = D.Demand(odpairs,m,horizon)
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    d_skip = D.Demand(odpairs,m,horizon)
+    x_skip = d_skip.insert_nodes_for_breaks(d_skip.generate_solver_space_matrix(m,compact=True),
+                                            skip_short_legs=True)
+    chains = d.break_node_chains
+    skipped = 0
+    for (o,dd) in zip(chains.from_nodes,chains.to_nodes):
+        chain = d.get_break_node_chain(o,dd)
+        chain_skip = d_skip.get_break_node_chain(o,dd)
+        if o == 0 and x_m.get(o,dd) < 480:
+            assert len(chain_skip) == 0
+            skipped += len(chain)
+        else:
+            assert [d.get_break_node(n).break_time for n in chain] == \
+                [d_skip.get_break_node(n).break_time for n in chain_skip]
+    assert skipped > 0
+    assert len(d_skip.break_node_chains) == len(chains)
+    assert len(d_skip.break_nodes) == len(d.break_nodes) - skipped
+    assert len(x_skip) == len(x_m) - skipped
+    # the direct arcs are all still there
+    for idx in d_skip.demand.index[d_skip.demand.feasible]:
+        record = d_skip.demand.loc[idx]
+        assert x_skip.get(0,record.origin) == x_m.get(0,record.origin)
+
+    # and loads added later follow the same rule
+    d_add = D.Demand(odpairs.iloc[:2],m,horizon)
+    x_add = d_add.insert_nodes_for_breaks(d_add.generate_solver_space_matrix(m,compact=True),
+                                          skip_short_legs=True)
+    (x_add,labels) = d_add.add_loads(odpairs.iloc[2:],m,x_add)
+    assert len(x_add) == len(x_skip)
+    assert len(d_add.break_nodes) == len(d_skip.break_nodes)
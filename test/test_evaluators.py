@@ -175,3 +175,279 @@ def test_time_callback():
     assert short_callback(3,1) ==  (m.loc[0,d.get_map_node(1)] - 660) + (bn11.drive_time_restore() - bn8.drive_time_restore())
     # can't go
     assert short_callback(3,4) > max_time
+
+def test_transit_matrices():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    manager = MockManager()
+    # every entry matches what the python callback would say
+    for (matrix,callback) in [(E.create_time_matrix2(x_m,d),
+                               E.create_time_callback2(x_m,d)),
+                              (E.create_drive_matrix(x_m,d,660,600),
+                               E.create_drive_callback(x_m,d,660,600)),
+                              (E.create_short_break_matrix(x_m,d,480,30),
+                               E.create_short_break_callback(x_m,d,480,30))]:
+        assert len(matrix) == len(x_m)
+        assert all(len(row) == len(x_m) for row in matrix)
+        assert isinstance(matrix[0][1],int)
+        for o in x_m.index:
+            for dd in x_m.index:
+                assert matrix[o][dd] == callback(manager,o,dd)
+
+def test_service_total_time():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    mm = d.generate_solver_space_matrix(m)
+    for x_m in (d.insert_nodes_for_breaks(mm),
+                d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))):
+        (index,values,notna) = E.matrix_arrays(x_m)
+        for service in (E.time_service_vector(x_m.index,d),
+                        E.drive_service_vector(x_m.index,d,600),
+                        E.short_break_service_vector(x_m.index,d,480,30)):
+            # the old way, one arc at a time
+            service_time = np.zeros((len(index),len(index)))
+            for o_idx in index:
+                for d_idx in index[notna[o_idx,:]]:
+                    if o_idx != d_idx:
+                        service_time[o_idx,d_idx] = service[o_idx]
+            expected = E.gen_total_time(service_time,x_m)
+            total = E.service_total_time(service,x_m)
+            assert total.dtype == expected.dtype
+            assert np.array_equal(total,expected)
+
+def test_evaluator_bundle():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    mm = d.generate_solver_space_matrix(m)
+    x_m = d.insert_nodes_for_breaks(mm)
+    dist = reader.travel_time(0.5,x_m)
+    manager = MockManager()
+
+    # one pass gives the same three vectors as one at a time
+    (time_service,drive_service,short_service) = E.service_vectors(len(x_m),d)
+    assert np.array_equal(time_service,E.time_service_vector(x_m.index,d))
+    assert np.array_equal(drive_service,E.drive_service_vector(x_m.index,d,600))
+    assert np.array_equal(short_service,E.short_break_service_vector(x_m.index,d,480,30))
+    # and what the break nodes themselves say
+    for (node,bn) in d.break_nodes.items():
+        assert time_service[node] == bn.break_time
+        expected = 0
+        if bn.break_time >= 600:
+            expected = bn.drive_time_restore()
+        assert drive_service[node] == expected
+        expected = bn.drive_time_restore()
+        if expected < -480:
+            expected = -3*60
+        assert short_service[node] == expected
+
+    d_sp = D.Demand(odpairs,m,horizon)
+    x_sp = d_sp.insert_nodes_for_breaks(d_sp.generate_solver_space_matrix(m,compact=True),
+                                        sparse=True)
+    dist_sp = reader.travel_time(0.5,x_sp)
+    for (bundle,matrix,demand,dist_matrix) in [(E.EvaluatorBundle(x_m,d,dist),x_m,d,dist),
+                                               (E.EvaluatorBundle(x_sp,d_sp,dist_sp),x_sp,d_sp,dist_sp)]:
+        assert len(bundle) == len(x_m)
+        assert bundle.loc[0,1] == x_m.loc[0,1]
+        assert np.isnan(bundle.loc[1,0])
+        pairs = [(bundle.time_callback(),E.create_time_callback2(matrix,demand)),
+                 (bundle.drive_callback(),E.create_drive_callback(matrix,demand,660,600)),
+                 (bundle.short_break_callback(),E.create_short_break_callback(matrix,demand,480,30)),
+                 (bundle.dist_callback(),E.create_dist_callback(dist_matrix,demand))]
+        for (cb,expected) in pairs:
+            for o in x_m.index:
+                for dd in x_m.index:
+                    assert cb(manager,o,dd) == expected(manager,o,dd)
+        demand_cb = E.create_demand_callback(x_m.index,demand)
+        for node in x_m.index:
+            assert bundle.demand_callback()(manager,node) == demand_cb(manager,node)
+        if not bundle.sparse():
+            assert bundle.time_matrix() == E.create_time_matrix2(matrix,demand)
+            assert bundle.drive_matrix() == E.create_drive_matrix(matrix,demand,660,600)
+            assert bundle.short_break_matrix() == E.create_short_break_matrix(matrix,demand,480,30)
+
+def test_arc_penalty():
+    int64_max = np.iinfo(np.int64).max
+    # normal sized problems keep the old penalty
+    assert E.arc_penalty(1500,1000,10080) == 10000000 * 1500
+    # never less than the horizon
+    assert E.arc_penalty(0,1000,10080) == 10081
+    # and capped, so a route through every node on penalty arcs fits
+    for num_nodes in (10,100000,10000000):
+        penalty = E.arc_penalty(1e15,num_nodes,10080)
+        assert penalty * (num_nodes + 1) <= int64_max // 2
+
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    bundle = E.EvaluatorBundle(x_m,d)
+    for values in (bundle.time,bundle.drive,bundle.short_break):
+        assert values.dtype == np.int64
+    # callbacks hand back plain ints
+    manager = MockManager()
+    assert type(bundle.time_callback()(manager,0,1)) == int
+    assert bundle.time_callback()(manager,1,0) == bundle.penalty
+    assert type(E.create_time_callback2(x_m,d)(manager,1,0)) == int
+
+def test_demand_vector():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    values = E.demand_vector(len(x_m),d)
+    assert values.dtype == np.int8
+    for node in x_m.index:
+        assert values[node] == d.get_demand(node)
+    assert values.sum() == 0
+    # shorter than the node list is fine too
+    assert list(E.demand_vector(3,d)) == [0,1,1]
+    assert E.EvaluatorBundle(x_m,d).demand_values() == [d.get_demand(n) for n in x_m.index]
+
+def test_bundle_subset():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    manager = MockManager()
+    for sparse in (False,True):
+        d = D.Demand(odpairs,m,horizon)
+        x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True),
+                                        sparse=sparse)
+        dist = reader.travel_time(0.5,x_m)
+        bundle = E.network_evaluators(x_m,d,dist)
+        # cached on the network, per demand
+        assert E.network_evaluators(x_m,d) is bundle
+        assert E.EvaluatorBundle(x_m,d).sparse() == sparse
+
+        record = d.demand.loc[d.demand.index[0]]
+        nodes = [0,record.origin,record.destination]
+        nodes.extend(d.get_break_node_chain(0,record.origin))
+        nodes.extend(d.get_break_node_chain(record.origin,record.destination))
+        sub = bundle.subset(nodes)
+        # just the arcs between the nodes, whatever the network
+        assert sub.sparse()
+        assert sub.travel.num_arcs() <= len(nodes)**2
+        assert len(sub) == len(x_m)
+        if sparse:
+            # same node set, any order, comes back from the cache
+            assert bundle.subset(list(reversed(nodes))) is sub
+        else:
+            # dense subsets are not cached
+            assert bundle.subset(list(reversed(nodes))) is not sub
+
+        rebuilt = E.EvaluatorBundle(x_m.subset(nodes),d,dist.subset(nodes))
+        for o in x_m.index:
+            for dd in x_m.index:
+                if o in nodes and dd in nodes:
+                    assert sub.travel.get(o,dd) == rebuilt.travel.get(o,dd)
+                for name in ('time_callback','drive_callback','short_break_callback'):
+                    value = getattr(sub,name)()(manager,o,dd)
+                    expected = getattr(rebuilt,name)()(manager,o,dd)
+                    if np.isnan(rebuilt.loc[o,dd]):
+                        # missing arcs keep the whole network's penalty
+                        assert value == bundle.penalty
+                    else:
+                        assert value == expected
+        outside = [n for n in x_m.index if n not in nodes]
+        assert all(np.isnan(sub.loc[0,n]) for n in outside)
+        assert sub.dist_callback()(manager,0,record.origin) == rebuilt.dist_callback()(manager,0,record.origin)
+
+        if sparse:
+            # only the last few subsets are kept
+            for n in outside[:E.SUBSET_CACHE_SIZE]:
+                bundle.subset(nodes + [n])
+            assert bundle.subset(nodes) is not sub
+
+def test_arc_cost():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    manager = MockManager()
+    d = D.Demand(odpairs,m,horizon)
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    dist = reader.travel_time(0.5,x_m)
+    bundle = E.EvaluatorBundle(x_m,d,dist)
+    allowed = x_m.allowed()
+
+    # time only is just the time array, apart from the penalty
+    (cost,penalty) = bundle.arc_cost()
+    assert cost.dtype == np.int64
+    assert np.array_equal(cost[allowed],bundle.time[allowed])
+    assert (cost[~allowed] == penalty).all()
+    assert bundle.arc_cost() is bundle.arc_cost()
+
+    (cost,penalty) = bundle.arc_cost(2,1.5)
+    expected = np.rint(2*bundle.time + 1.5*dist.times)
+    assert np.array_equal(cost[allowed],expected[allowed])
+    assert (cost[~allowed] == penalty).all()
+    assert penalty > cost[allowed].max()
+    assert bundle.cost_matrix(2,1.5) == cost.tolist()
+
+    d_sp = D.Demand(odpairs,m,horizon)
+    x_sp = d_sp.insert_nodes_for_breaks(d_sp.generate_solver_space_matrix(m,compact=True),
+                                        sparse=True)
+    sparse_bundle = E.EvaluatorBundle(x_sp,d_sp,reader.travel_time(0.5,x_sp))
+    callback = sparse_bundle.cost_callback(2,1.5)
+    dense_callback = bundle.cost_callback(2,1.5)
+    for o in x_m.index:
+        for dd in x_m.index:
+            assert callback(manager,o,dd) == dense_callback(manager,o,dd)
+
+    # no distance, no distance weight
+    try:
+        E.EvaluatorBundle(x_m,d).arc_cost(1,1)
+        assert False
+    except AssertionError as e:
+        assert 'distance' in str(e)
+
+def test_vehicle_classes():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    manager = MockManager()
+    d = D.Demand(odpairs,m,horizon)
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    bundle = E.EvaluatorBundle(x_m,d)
+    bundle.set_vehicle_classes([1.0,1.5])
+    assert bundle.class_time.shape == (2,len(x_m),len(x_m))
+    for (name,values) in [('time',bundle.time),('drive',bundle.drive),('short_break',bundle.short_break)]:
+        assert np.array_equal(getattr(bundle,'class_'+name)[0],values)
+    assert bundle.time_matrix(0) == bundle.time_matrix()
+
+    # the slow class is the same as a network built 1.5 times slower
+    allowed = x_m.allowed()
+    slow = x_m.copy()
+    slow.times[allowed] = np.floor(x_m.times[allowed] * 1.5)
+    expected = E.EvaluatorBundle(slow,d)
+    for name in ('time','drive','short_break'):
+        assert np.array_equal(getattr(bundle,'class_'+name)[1][allowed],
+                              getattr(expected,name)[allowed])
+        assert (getattr(bundle,'class_'+name)[1][~allowed] == bundle.penalty).all()
+    assert bundle.time_callback(1)(manager,0,1) == expected.time_callback()(manager,0,1)
+
+    # subsets carry the classes along
+    sub = bundle.subset([0,1,2])
+    assert sub.class_time.shape == (len(bundle.class_factors),sub.travel.num_arcs())
+    assert sub.time_callback(1)(manager,0,1) == bundle.time_callback(1)(manager,0,1)
+    assert sub.time_callback(1)(manager,0,3) == bundle.penalty
+
+    # and the sparse network gets the same numbers
+    d_sp = D.Demand(odpairs,m,horizon)
+    x_sp = d_sp.insert_nodes_for_breaks(d_sp.generate_solver_space_matrix(m,compact=True),
+                                        sparse=True)
+    sparse_bundle = E.EvaluatorBundle(x_sp,d_sp)
+    sparse_bundle.set_vehicle_classes([1.0,1.5])
+    for name in ('time_callback','drive_callback','short_break_callback'):
+        cb = getattr(sparse_bundle,name)(1)
+        expected_cb = getattr(bundle,name)(1)
+        for o in x_m.index:
+            for dd in x_m.index:
+                assert cb(manager,o,dd) == expected_cb(manager,o,dd)
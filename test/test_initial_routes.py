@@ -1,6 +1,7 @@
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 from functools import partial
+import pytest
 
 import solution_output as SO
 import evaluators as E
@@ -50,3 +51,87 @@ def test_initial_routes():
         # print(original_chain)
         # print(plan_output)
         assert original_chain == plan_output
+
+def test_route_with_breaks():
+
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d     = D.Demand(odpairs,m,horizon)
+    m = d.generate_solver_space_matrix(m)
+    x_m = d.insert_nodes_for_breaks(m)
+
+    v = V.Vehicles(5,horizon)
+
+    # one load per route, same as initial_routes_2 does it
+    trip_chains = IR.initial_routes_2(d,v.vehicles,x_m)
+    feasible = d.demand.loc[d.demand.feasible,:]
+    for (veh,(o,dd)) in enumerate(zip(feasible.origin,feasible.destination)):
+        assert IR.route_with_breaks(d,x_m,[o,dd]) == trip_chains[veh]
+
+    # break nodes only between regular nodes
+    for node in IR.route_with_breaks(d,x_m,[2,7,1,6]):
+        assert node in [2,7,1,6] or d.get_break_node(node) is not None
+
+    # no chain at all for the link, so no way to put breaks on it
+    d.break_node_chains = None
+    assert IR.route_with_breaks(d,x_m,[4,9]) is None
+
+def test_lazy_breaks():
+
+    horizon = 20000
+    raw = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d     = D.Demand(odpairs,raw,horizon)
+    m = d.generate_solver_space_matrix(raw,compact=True)
+
+    v = V.Vehicles(5,horizon)
+    (assignment,routing,manager,x_m,converged) = MR.lazy_break_run(d,m,v.vehicles,10000)
+    assert assignment
+    assert converged
+    # the caller's setting is left alone
+    assert not d.skip_short_legs
+    # same as with every link expanded (test_initial_routes), with
+    # fewer nodes than the 122 of the full expansion
+    assert assignment.ObjectiveValue() == 43516
+    assert len(x_m.index) < 122
+    served = []
+    for vehicle in v.vehicles:
+        for node in MR.get_route(vehicle.index,assignment,routing,manager):
+            if d.get_break_node(node) is None:
+                served.append(node)
+    assert sorted(served) == sorted(d.get_node_list())
+
+    # and it only starts from a network with no break nodes
+    with pytest.raises(AssertionError):
+        MR.lazy_break_run(d,m,v.vehicles,10000)
+
+    # one round makes the break nodes and solves, but never gets to
+    # check that the routes want nothing more
+    d = D.Demand(odpairs,raw,horizon)
+    m = d.generate_solver_space_matrix(raw,compact=True)
+    (assignment,routing,manager,x_m,converged) = MR.lazy_break_run(d,m,v.vehicles,10000,
+                                                                   max_rounds=1)
+    assert assignment
+    assert not converged
+
+def test_initial_routes_that_do_not_fit():
+
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d     = D.Demand(odpairs,m,horizon)
+    x_m = d.insert_nodes_for_breaks(d.generate_solver_space_matrix(m,compact=True))
+    v = V.Vehicles(5,horizon)
+
+    # drop off before pick up
+    record = d.demand.loc[d.demand.index[0]]
+    backwards = [[record.destination,record.origin]]
+    with pytest.raises(ValueError):
+        MR.model_run(d,x_m,v.vehicles,10000,None,backwards)
+    # unless there is something to fall back on
+    trip_chains = IR.initial_routes_2(d,v.vehicles,x_m)
+    initial_routes = [tcv for tcv in trip_chains.values()]
+    (assignment,routing,manager) = MR.model_run(d,x_m,v.vehicles,10000,None,backwards,
+                                                fallback_routes=initial_routes)
+    assert assignment.ObjectiveValue() == 43516
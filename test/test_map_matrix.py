@@ -0,0 +1,73 @@
+import map_matrix as MM
+import read_csv as reader
+import demand as D
+import numpy as np
+import pytest
+
+def test_convert_and_load(tmp_path):
+    npyfile = str(tmp_path / 'matrix.npy')
+    # small chunks, so the chunked write gets exercised
+    MM.convert_csv('test/data/matrix.csv',npyfile,chunksize=3)
+    csv_matrix = reader.load_matrix_from_csv('test/data/matrix.csv')
+    matrix = reader.load_matrix(npyfile)
+    assert isinstance(matrix,MM.MappedMatrix)
+    assert isinstance(matrix.values,np.memmap)
+    assert len(matrix) == 10
+    assert (matrix.index == csv_matrix.index).all()
+    assert matrix.loc[0,1] == 1269
+    assert matrix.loc[1,0] == 1275
+    assert (matrix.row(0) == csv_matrix.loc[0].values).all()
+    assert (matrix.to_dataframe().values == csv_matrix.values).all()
+
+    # travel_time is lazy but gives the same numbers
+    for speed in (1,60,55/60):
+        minutes = reader.travel_time(speed,matrix)
+        assert minutes.values is matrix.values
+        expected = reader.travel_time(speed,csv_matrix)
+        assert (minutes.to_dataframe().values == expected.values).all()
+        assert minutes.loc[3,7] == expected.loc[3,7]
+        rows = [0,4,4,9]
+        cols = [2,0,8]
+        assert (minutes.take(rows,cols) == expected.values[np.ix_(rows,cols)]).all()
+        assert (minutes.take_pairs(rows,[1,2,3,4]) == expected.values[rows,[1,2,3,4]]).all()
+
+def test_demand_from_mapped_matrix(tmp_path):
+    npyfile = str(tmp_path / 'matrix.npy')
+    MM.convert_csv('test/data/matrix.csv',npyfile)
+    horizon = 20000
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    csv_matrix = reader.travel_time(55/60,reader.load_matrix('test/data/matrix.csv'))
+    matrix = reader.travel_time(55/60,reader.load_matrix(npyfile))
+
+    d_csv = D.Demand(odpairs,csv_matrix,horizon)
+    d = D.Demand(odpairs,matrix,horizon)
+    assert d.demand.equals(d_csv.demand)
+    mm = d.generate_solver_space_matrix(matrix)
+    mm_csv = d_csv.generate_solver_space_matrix(csv_matrix)
+    assert mm.equals(mm_csv)
+
+def test_convert_mixed_chunks(tmp_path):
+    # integers in the first chunk, a decimal and a blank further down
+    csvfile = tmp_path / 'matrix.csv'
+    csvfile.write_text('0,1,2,3\n1,0,2,3\n1.7,2,0,3\n1,,2,0\n')
+    npyfile = str(tmp_path / 'matrix.npy')
+    with pytest.raises(ValueError):
+        MM.convert_csv(str(csvfile),npyfile,chunksize=2)
+    MM.convert_csv(str(csvfile),npyfile,chunksize=2,dtype='float64')
+    matrix = reader.load_matrix(npyfile)
+    assert matrix.loc[2,0] == 1.7
+    assert np.isnan(matrix.loc[3,1])
+
+def test_missing_map_nodes(tmp_path):
+    npyfile = str(tmp_path / 'matrix.npy')
+    MM.convert_csv('test/data/matrix.csv',npyfile)
+    matrix = reader.load_matrix(npyfile)
+    # same as the CSV DataFrame: not the last row, not an IndexError
+    for (rows,cols) in (([-1],[0]),([0],[10]),([0,1],[2,-1])):
+        with pytest.raises(KeyError):
+            matrix.take(rows,cols)
+        with pytest.raises(KeyError):
+            matrix.take_pairs(rows,cols)
+        with pytest.raises(KeyError):
+            D.map_space_times(matrix,rows,cols)
+
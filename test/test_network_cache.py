@@ -0,0 +1,50 @@
+import network_cache as NC
+import demand as D
+import read_csv as reader
+import solver_matrix as SM
+import numpy as np
+
+def build(horizon):
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    mm = d.generate_solver_space_matrix(m,horizon,compact=True)
+    expanded_mm = d.insert_nodes_for_breaks(mm)
+    return (d,expanded_mm)
+
+def test_cache_key():
+    key = NC.cache_key('test/data/matrix.csv','test/data/demand.csv',55,10080)
+    assert key == NC.cache_key('test/data/matrix.csv','test/data/demand.csv',55.0,10080)
+    assert len(key) == 64
+    # any change to the inputs changes the key
+    assert key != NC.cache_key('test/data/matrix.csv','test/data/demand2.csv',55,10080)
+    assert key != NC.cache_key('test/data/matrix.csv','test/data/demand.csv',60,10080)
+    assert key != NC.cache_key('test/data/matrix.csv','test/data/demand.csv',55,20000)
+    assert key != NC.cache_key('test/data/matrix.csv','test/data/demand.csv',55,10080,True)
+    assert key != NC.cache_key('test/data/matrix.csv','test/data/demand.csv',55,10080,False,True)
+
+def test_save_and_load(tmp_path):
+    horizon = 20000
+    key = NC.cache_key('test/data/matrix.csv','test/data/demand.csv',60,horizon)
+    assert NC.load(str(tmp_path),key) is None
+
+    (d,expanded_mm) = build(horizon)
+    NC.save(str(tmp_path),key,d,expanded_mm)
+    (cd,cmm) = NC.load(str(tmp_path),key)
+
+    assert isinstance(cmm,SM.SolverMatrix)
+    assert (cmm.times == expanded_mm.times).all()
+    # the .loc shim survives the round trip
+    assert cmm.loc[0,1] == expanded_mm.loc[0,1]
+    assert cd.demand.equals(d.demand)
+    assert sorted(cd.break_nodes.keys()) == sorted(d.break_nodes.keys())
+    for (node,bn) in d.break_nodes.items():
+        cbn = cd.break_nodes[node]
+        assert (cbn.origin,cbn.destination,cbn.break_time,cbn.tt_o,cbn.tt_d) == \
+            (bn.origin,bn.destination,bn.break_time,bn.tt_o,bn.tt_d)
+    assert cd.break_node_chains == d.break_node_chains
+    assert np.array_equal(cd.get_break_node_chain(1,6),d.get_break_node_chain(1,6))
+
+    # different key, no hit
+    other = NC.cache_key('test/data/matrix.csv','test/data/demand.csv',60,10080)
+    assert NC.load(str(tmp_path),other) is None
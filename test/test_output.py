@@ -119,3 +119,101 @@ def test_output():
 
     assert filecmp.cmp(output_file,expected_breaks_file)
     os.unlink(output_file)
+
+def test_output_compact():
+
+    # same runs as above, but using the compact SolverMatrix
+    horizon = 20000
+    raw = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d     = D.Demand(odpairs,raw,horizon)
+    m = d.generate_solver_space_matrix(raw,compact=True)
+
+    v = V.Vehicles(5,horizon)
+    (assignment,routing,manager) = MR.model_run_nobreaks(d,m,v.vehicles)
+    assert assignment
+    args = MockArgs()
+    SO.print_solution(d,m,m,
+                      v,manager,routing,assignment,horizon,
+                      0,args
+    )
+    assert filecmp.cmp(output_file,expected_file)
+    os.unlink(output_file)
+
+    x_m = d.insert_nodes_for_breaks(m)
+    trip_chains = IR.initial_routes_2(d,v.vehicles,x_m)
+    initial_routes = [v for v in trip_chains.values()]
+    (assignment,routing,manager) = MR.model_run(d, x_m, v.vehicles,
+                                                10000, None, initial_routes)
+    SO.print_solution(d,x_m,x_m,
+                      v,manager,routing,assignment,horizon,
+                      10000,args
+    )
+    assert filecmp.cmp(output_file,expected_breaks_file)
+    os.unlink(output_file)
+
+    # same again, with the transit matrices instead of callbacks, and
+    # everything going through one evaluator bundle
+    evaluators = E.EvaluatorBundle(x_m,d,x_m)
+    trip_chains = IR.initial_routes_2(d,v.vehicles,evaluators)
+    initial_routes = [v for v in trip_chains.values()]
+    (assignment,routing,manager) = MR.model_run(d, x_m, v.vehicles,
+                                                10000, None, initial_routes,
+                                                transit_matrix=True,
+                                                evaluators=evaluators)
+    SO.print_solution(d,evaluators.distance,evaluators.travel,
+                      v,manager,routing,assignment,horizon,
+                      10000,args
+    )
+    assert filecmp.cmp(output_file,expected_breaks_file)
+    os.unlink(output_file)
+
+    # weighted distance plus time objective, with the vehicle fixed
+    # costs.  The objective is the precomputed arc costs along the
+    # routes plus the cost of each vehicle used
+    objective = MR.Objective(1,2,True)
+    (assignment,routing,manager) = MR.model_run(d, x_m, v.vehicles,
+                                                10000, None, initial_routes,
+                                                transit_matrix=True,
+                                                evaluators=evaluators,
+                                                objective=objective)
+    assert assignment
+    (cost,penalty) = evaluators.arc_cost(1,2)
+    total = 0
+    for veh in v.vehicles:
+        assert routing.GetFixedCostOfVehicle(veh.index) == veh.cost
+        route = [0] + MR.get_route(veh.index,assignment,routing,manager) + [0]
+        if len(route) > 2:
+            total += veh.cost
+            total += sum(cost[a,b] for (a,b) in zip(route[:-1],route[1:]))
+    assert assignment.ObjectiveValue() == total
+
+    # two vehicle classes, the second one faster (a team truck).  Each
+    # vehicle's arcs cost (and take) its own class's times
+    vc = V.Vehicles(5,horizon,[(3,1.0),(2,0.8)])
+    for transit_matrix in (False,True):
+        (num_nodes,manager,routing) = MR.setup_model(d,x_m,vc.vehicles,
+                                                     transit_matrix,evaluators)
+        routing.CloseModel()
+        time_dimension = routing.GetDimensionOrDie(MR.time_dimension_name)
+        (i,j) = (manager.NodeToIndex(0),manager.NodeToIndex(1))
+        for veh in vc.vehicles:
+            expected = evaluators.class_time[veh.vehicle_class][0,1]
+            assert routing.GetArcCostForVehicle(i,j,veh.index) == expected
+            assert time_dimension.GetTransitValue(i,j,veh.index) == expected
+    assert evaluators.class_time[1][0,1] < evaluators.time[0,1]
+
+    # and again, with the sparse expanded network
+    d     = D.Demand(odpairs,raw,horizon)
+    m = d.generate_solver_space_matrix(raw,compact=True)
+    x_m = d.insert_nodes_for_breaks(m,sparse=True)
+    trip_chains = IR.initial_routes_2(d,v.vehicles,x_m)
+    initial_routes = [v for v in trip_chains.values()]
+    (assignment,routing,manager) = MR.model_run(d, x_m, v.vehicles,
+                                                10000, None, initial_routes)
+    SO.print_solution(d,x_m,x_m,
+                      v,manager,routing,assignment,horizon,
+                      10000,args
+    )
+    assert filecmp.cmp(output_file,expected_breaks_file)
+    os.unlink(output_file)
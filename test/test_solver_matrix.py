@@ -0,0 +1,172 @@
+import solver_matrix as SM
+import demand as D
+import evaluators as E
+import read_csv as reader
+import numpy as np
+import pandas as pd
+
+class MockManager():
+
+    def NodeToIndex(self,a):
+        return a
+
+    def IndexToNode(self,a):
+        return a
+
+def test_solver_matrix():
+    values = np.array([[0,10,np.nan],
+                       [np.nan,0,20.0],
+                       [30,np.nan,0]])
+    sm = SM.SolverMatrix.from_array(values)
+    assert sm.times.dtype == np.int32
+    assert len(sm) == 3
+    assert list(sm.index) == [0,1,2]
+    assert sm.get(0,1) == 10
+    assert sm.get(0,2) == SM.FORBIDDEN
+    assert sm.has_arc(1,2)
+    assert not sm.has_arc(1,0)
+    assert list(sm.row(2)) == [30,SM.FORBIDDEN,0]
+    assert list(sm.column(2)) == [SM.FORBIDDEN,20,0]
+    assert sm.max_time() == 30
+    # rows are views, not copies
+    assert sm.row(0).base is sm.times
+
+    # old style lookups still see NaN for no arc
+    assert sm.loc[0,1] == 10
+    assert np.isnan(sm.loc[0,2])
+    block = sm.loc[[0,1],[1,2]]
+    assert block.loc[0,1] == 10
+    assert np.isnan(block.loc[0,2])
+
+    # round trip through a DataFrame
+    df = sm.to_dataframe()
+    assert np.array_equal(df.values,values,equal_nan=True)
+    assert np.array_equal(SM.as_solver_matrix(df).times,sm.times)
+    assert SM.as_solver_matrix(sm) is sm
+
+    # floordiv keeps forbidden arcs forbidden
+    half = sm.floordiv(2)
+    assert half.get(0,1) == 5
+    assert half.get(0,2) == SM.FORBIDDEN
+
+    # subset drops arcs that touch other nodes
+    sub = sm.subset([0,1])
+    assert sub.get(0,1) == 10
+    assert sub.get(1,2) == SM.FORBIDDEN
+    assert sub.get(2,0) == SM.FORBIDDEN
+
+    # adding arcs grows the matrix, and old arcs win
+    triplets = D.zeroed_trip_triplets(3)
+    triplets[0] = (0,3,5)
+    triplets[1] = (3,3,0)
+    triplets[2] = (0,1,99)
+    more = sm.with_arcs(triplets)
+    assert len(more) == 4
+    assert more.get(0,3) == 5
+    assert more.get(3,0) == SM.FORBIDDEN
+    assert more.get(0,1) == 10
+
+
+def test_compact_matches_dataframe():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    mm = d.generate_solver_space_matrix(m)
+    sm = d.generate_solver_space_matrix(m,compact=True)
+    assert isinstance(sm,SM.SolverMatrix)
+    assert np.array_equal(sm.to_array(),mm.values,equal_nan=True)
+
+    # break expansion keeps the type, and gives the same network
+    d_sm = D.Demand(odpairs,m,horizon)
+    d_sm.generate_solver_space_matrix(m)
+    x_mm = d.insert_nodes_for_breaks(mm)
+    x_sm = d_sm.insert_nodes_for_breaks(sm)
+    assert isinstance(x_sm,SM.SolverMatrix)
+    assert np.array_equal(x_sm.to_array(),x_mm.values,equal_nan=True)
+
+
+def test_sparse_solver_matrix():
+    triplets = D.zeroed_trip_triplets(6)
+    triplets[0] = (0,2,7)
+    triplets[1] = (0,1,10)
+    triplets[2] = (1,2,20)
+    triplets[3] = (2,0,30)
+    triplets[4] = (0,1,99) # repeat, first one wins
+    triplets[5] = (1,1,0)
+    sp = SM.SparseSolverMatrix.from_triplets(triplets)
+    assert len(sp) == 3
+    assert sp.num_arcs() == 5
+    assert list(sp.offsets) == [0,2,4,5]
+    (neighbors,times) = sp.row(0)
+    assert list(neighbors) == [1,2]
+    assert list(times) == [10,7]
+    assert sp.get(0,1) == 10
+    assert sp.get(1,0) == SM.FORBIDDEN
+    assert not sp.has_arc(2,2)
+    (sources,times) = sp.column(2)
+    assert list(sources) == [0,1]
+    assert list(times) == [7,20]
+    assert sp.max_time() == 30
+    assert sp.loc[1,2] == 20
+    assert np.isnan(sp.loc[2,1])
+    for m in (sp,sp.to_solver_matrix(),sp.to_dataframe()):
+        lookup = SM.lookup(m,0,[2,0,1])
+        assert list(lookup[[0,2]]) == [7,10]
+        assert np.isnan(lookup[1])
+        assert np.isnan(SM.lookup(m,2,[1,2])).all()
+
+    # same network as the dense version
+    dense = sp.to_solver_matrix()
+    assert dense.get(0,2) == 7
+    assert dense.get(2,1) == SM.FORBIDDEN
+    again = SM.SparseSolverMatrix.from_matrix(dense)
+    assert np.array_equal(again.offsets,sp.offsets)
+    assert np.array_equal(again.neighbors,sp.neighbors)
+    assert np.array_equal(again.times,sp.times)
+
+    sub = sp.subset([0,2])
+    assert sub.get(0,2) == 7
+    assert sub.get(0,1) == SM.FORBIDDEN
+    assert sp.floordiv(2).get(2,0) == 15
+
+    more = SM.SparseSolverMatrix.from_triplets(triplets).with_arcs(triplets[:1])
+    assert more.get(0,2) == 7
+    extra = D.zeroed_trip_triplets(2)
+    extra[0] = (2,4,5)
+    extra[1] = (0,1,1)
+    more = sp.with_arcs(extra)
+    assert len(more) == 5
+    assert more.get(2,4) == 5
+    assert more.get(0,1) == 10
+
+
+def test_sparse_break_expansion():
+    horizon = 20000
+    m = reader.load_matrix_from_csv('test/data/matrix.csv')
+    odpairs = reader.load_demand_from_csv('test/data/demand.csv')
+    d = D.Demand(odpairs,m,horizon)
+    mm = d.generate_solver_space_matrix(m)
+    x_mm = d.insert_nodes_for_breaks(mm)
+
+    d_sp = D.Demand(odpairs,m,horizon)
+    sm = d_sp.generate_solver_space_matrix(m,compact=True)
+    x_sp = d_sp.insert_nodes_for_breaks(sm,sparse=True)
+    assert isinstance(x_sp,SM.SparseSolverMatrix)
+    assert np.array_equal(x_sp.to_array(),x_mm.values,equal_nan=True)
+    # far fewer arcs than cells
+    assert x_sp.num_arcs() < len(x_sp)*len(x_sp) / 4
+
+    # and the evaluators give the same answers without densifying
+    manager = MockManager()
+    for (dense_cb,sparse_cb) in [(E.create_time_callback2(x_mm,d),
+                                  E.create_time_callback2(x_sp,d_sp)),
+                                 (E.create_drive_callback(x_mm,d,660,600),
+                                  E.create_drive_callback(x_sp,d_sp,660,600)),
+                                 (E.create_short_break_callback(x_mm,d,480,30),
+                                  E.create_short_break_callback(x_sp,d_sp,480,30)),
+                                 (E.create_dist_callback(x_mm,d),
+                                  E.create_dist_callback(x_sp,d_sp))]:
+        for o in x_mm.index:
+            for dd in x_mm.index:
+                assert dense_cb(manager,o,dd) == sparse_cb(manager,o,dd)
@@ -1,3 +1,4 @@
+import pytest
 import vehicles as V
 
 def test_vehicles():
@@ -18,3 +19,19 @@ def test_vehicles():
     assert len(v2.vehicles) == 100
     for veh in v2.vehicles:
         assert veh.time_window[1] == 1000
+
+def test_vehicle_classes():
+    v = V.Vehicles(5,100,[(3,1.0),(2,1.25)])
+    assert [veh.vehicle_class for veh in v.vehicles] == [0,0,0,1,1]
+    assert [veh.time_factor for veh in v.vehicles] == [1.0,1.0,1.0,1.25,1.25]
+    assert v.class_factors() == [1.0,1.25]
+    # default is one class at the network speed
+    assert V.Vehicles(5,100).class_factors() == [1.0]
+    assert V.parse_vehicle_classes(['2:44','3:55'],44) == [(2,1.0),(3,0.8)]
+    # nothing slower than the network speed
+    with pytest.raises(ValueError,match='slower'):
+        V.parse_vehicle_classes(['3:55','2:44'],55)
+    # and nothing that is not COUNT:SPEED
+    for spec in ('3','3:55:1','three:55','3:fast','0:55','3:-55'):
+        with pytest.raises(ValueError,match=spec):
+            V.parse_vehicle_classes([spec],55)